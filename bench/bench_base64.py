@@ -0,0 +1,134 @@
+# bench_base64.py  Base64 into caller buffers (lib/base64.py) against binascii.
+#
+# CPython:    python bench/bench_base64.py
+# unix port:  micropython bench/bench_base64.py
+#
+# Encodes 1, 16 and 64 KB four ways:
+#   binascii        binascii.b2a_base64(data): one new object, newline included
+#   b64encode       base64.b64encode(data): the same plus a copy without the newline
+#   b64encode_into  base64.b64encode_into(data, dst) into a preallocated buffer
+#   Encoder 512     base64.Encoder(dst) fed 512-byte pieces, as the UART delivers them
+# and reports the time per call, the throughput and the heap each call needs:
+# the tracemalloc peak on CPython, the bytes allocated (gc.mem_alloc() with the
+# collector off) under the unix port.  Then checks that every variant gives the
+# binascii text for odd sizes and piece lengths.
+
+import gc
+import sys
+
+_HOST = sys.implementation.name != 'micropython'
+_HERE = __file__.rpartition('/')[0] or '.'
+sys.path.insert(0, _HERE + '/../lib')
+sys.path.append(_HERE + '/../host')
+
+try:
+    from time import perf_counter_ns
+
+    def _now_us():
+        return perf_counter_ns() // 1000
+
+    def _diff_us(end, start):
+        return end - start
+except ImportError:
+    import utime
+    _now_us = utime.ticks_us
+    _diff_us = utime.ticks_diff
+
+import binascii
+import base64
+from checks import check, done
+
+SIZES = (1024, 16384, 65536)
+PIECE = 512
+TARGET_US = 200000
+
+
+def timeit(fn, target_us=TARGET_US):
+    n = 1
+    while True:
+        t = _now_us()
+        for _ in range(n):
+            fn()
+        elapsed = _diff_us(_now_us(), t)
+        if elapsed >= target_us // 4 or n >= 1 << 16:
+            break
+        n *= 4
+    n = max(1, n * target_us // max(elapsed, 1))
+    t = _now_us()
+    for _ in range(n):
+        fn()
+    return _diff_us(_now_us(), t) / n
+
+
+def heap(fn):
+    gc.collect()
+    if _HOST:
+        import tracemalloc
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+    gc.disable()
+    base = gc.mem_alloc()
+    fn()
+    used = gc.mem_alloc() - base
+    gc.enable()
+    return used
+
+
+def encode_pieces(data, dst, piece=PIECE):
+    mv = memoryview(data)
+    enc = base64.Encoder(dst)
+    for start in range(0, len(data), piece):
+        enc.update(mv[start:start + piece])
+    return enc.finalize()
+
+
+def variants(data, dst):
+    return (('binascii', lambda: binascii.b2a_base64(data)),
+            ('b64encode', lambda: base64.b64encode(data)),
+            ('b64encode_into', lambda: base64.b64encode_into(data, dst)),
+            ('Encoder %d' % PIECE, lambda: encode_pieces(data, dst)))
+
+
+def main():
+    print('%-16s %8s %12s %10s %12s' % ('variant', 'size', 'us/call', 'MB/s', 'heap bytes'))
+    heaps = {}
+    for size in SIZES:
+        data = bytes(range(256)) * (size // 256)
+        dst = bytearray(base64.encoded_length(size))
+        for name, fn in variants(data, dst):
+            us = timeit(fn)
+            used = heap(fn)
+            heaps[name, size] = used
+            print('%-16s %8d %12.1f %10.1f %12d' % (name, size, us, size / us, used))
+
+    print()
+    print('checks')
+    ok = True
+    for n in (0, 1, 2, 3, 4, 5, 767, 768, 769, 1000, 2305):
+        data = bytes((i * 7 + n) & 0xff for i in range(n))
+        want = binascii.b2a_base64(data)[:-1]
+        dst = bytearray(base64.encoded_length(n))
+        ok = ok and base64.b64encode(data) == want and len(want) == len(dst)
+        ok = ok and base64.b64encode_into(data, dst) == len(want) and bytes(dst) == want
+        for piece in (1, 2, 4, 100, 511):
+            dst = bytearray(len(dst))
+            ok = ok and encode_pieces(data, dst, piece) == len(want) and bytes(dst) == want
+    check('all variants give the binascii text', ok)
+    try:
+        base64.b64encode_into(b'abcd', bytearray(7))
+        check('short destination raises ValueError', False)
+    except ValueError:
+        check('short destination raises ValueError', True)
+    if _HOST:
+        big = SIZES[-1]
+        check('b64encode_into heap under 4 KB at 64 KB', heaps['b64encode_into', big] < 4096)
+        check('Encoder heap under 4 KB at 64 KB', heaps['Encoder %d' % PIECE, big] < 4096)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
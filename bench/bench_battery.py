@@ -0,0 +1,131 @@
+# bench_battery.py  Background battery measurement against the blocking one.
+#
+#   python bench/bench_battery.py
+#
+# Feeds the host ADC stand-in a battery voltage with Gaussian noise and the odd
+# spike, and compares
+#   blocking    the original battery_voltage(): 10 readings 10 ms apart, their
+#               mean, the float fit, a string
+#   background  lib/battery.py: Timer.Alarm sampling while a 300 ms modem attach
+#               runs, trimmed mean, integer calibration
+# on the time the caller is blocked and the error of the result, then checks a
+# two-point calibration kept in lib/state.py.
+
+import os
+import random
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import battery
+import machine
+import state
+from checks import check, done
+
+TRIALS = 40
+NOISE = 6                   # ADC counts RMS
+SPIKE_P = 0.06              # Chance of a spike per reading
+
+
+class Source:
+    # ADC counts for a battery at 'mv' through the factory fit, with noise and spikes
+    def __init__(self, rng, gain=1.754703, offset=544.528802):
+        self.rng = rng
+        self.gain = gain
+        self.offset = offset
+        self.mv = 6500
+
+    def __call__(self, pin):
+        count = (self.mv - self.offset) / self.gain + self.rng.gauss(0, NOISE)
+        if self.rng.random() < SPIKE_P:
+            count += self.rng.choice((-1, 1)) * self.rng.uniform(100, 400)
+        return count
+
+
+def blocking(pin):
+    # The original battery_voltage(), returning centivolts as a string
+    pin.value(1)
+    adc = machine.ADC(0)
+    adc_vbat = adc.channel(pin='P18', attn=adc.ATTN_0DB)
+    adc_value = 0.0
+    for y in range(0, 10):
+        time.sleep(0.010)
+        adc_value += adc_vbat()
+    pin.value(0)
+    adc_value = adc_value / 10
+    volts = adc_value * 0.001754703 + 0.544528802
+    return str(int(100 * round(volts, 2)))
+
+
+def main():
+    rng = random.Random(3)
+    source = Source(rng)
+    machine.ADC.source = source
+    pin = machine.Pin('P19', mode=machine.Pin.OUT, value=0)
+    meter = battery.Battery(pin)
+
+    old_blocked = new_blocked = 0.0
+    old_err = []
+    new_err = []
+    divider_on = 0              # Samples in, divider still powered while the modem attaches
+    for _ in range(TRIALS):
+        source.mv = rng.uniform(5800, 7300)
+
+        start = time.monotonic()
+        old = int(blocking(pin)) * 10
+        old_blocked += time.monotonic() - start
+        old_err.append(old - source.mv)
+
+        start = time.monotonic()
+        meter.start()
+        blocked = time.monotonic() - start
+        time.sleep(0.3)                                 # lte.attach()
+        divider_on += meter.done() and pin.value()
+        start = time.monotonic()
+        mv = meter.read_mv()
+        new_blocked += blocked + time.monotonic() - start
+        new_err.append(mv - source.mv)
+
+    def rms(errors):
+        return (sum(e * e for e in errors) / len(errors)) ** 0.5
+
+    print('%-12s %14s %14s %14s' % ('', 'blocked ms', 'rms error mV', 'max error mV'))
+    print('%-12s %14.1f %14.1f %14.1f' % ('blocking', old_blocked / TRIALS * 1000, rms(old_err),
+                                          max(abs(e) for e in old_err)))
+    print('%-12s %14.1f %14.1f %14.1f' % ('background', new_blocked / TRIALS * 1000, rms(new_err),
+                                          max(abs(e) for e in new_err)))
+
+    # A unit whose ADC reads 3% high: calibrate at two meter readings
+    print()
+    source.gain = 1.754703 / 1.03
+    points = []
+    for mv in (6000, 7000):
+        source.mv = mv
+        meter.start()
+        meter.read_mv()
+        points.append((meter.count16(), mv))
+    source.mv = 6500
+    uncalibrated = meter.read_mv() - source.mv
+    battery.calibrate(points[0][0], points[0][1], points[1][0], points[1][1])
+    calibrated = meter.read_mv() - source.mv
+    print('unit 3%% high: %+d mV before calibration, %+d mV after' % (uncalibrated, calibrated))
+    state.erase('bt_gain')
+    state.erase('bt_off')
+
+    print()
+    print('checks')
+    check('caller blocked under 5 ms', new_blocked / TRIALS < 0.005)
+    check('trimmed mean beats the plain mean on spikes', rms(new_err) < rms(old_err))
+    check('error within 15 mV rms', rms(new_err) < 15)
+    check('divider off as soon as the samples are in', divider_on == 0)
+    check('divider off after the measurement', pin.value() == 0)
+    check('calibration brings the unit within 15 mV', abs(calibrated) < 15)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
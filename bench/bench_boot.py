@@ -0,0 +1,142 @@
+# bench_boot.py  What the boot path costs before the camera is triggered.
+#
+# CPython:    python bench/bench_boot.py [--log log.bin]
+# unix port:  micropython bench/bench_boot.py [--path build/lib]
+#
+# Imports the modules main.py loads at boot one by one and reports the time and
+# heap each takes, then the modules main.py now imports only when a wake needs
+# them (transport and telering once past the governor, nettime on LTE attach,
+# picture and base64 on capture wakes, upload, timesync with untplib on sync
+# wakes) or no longer at all (urequests).  A skipped wake pays for BOOT only.
+# Under the unix port, --path puts a host/build_mpy.py output directory first on
+# sys.path, to compare precompiled .mpy imports with the sources.
+#
+# With --log, decodes a station log (ringlog records, e.g. a downloaded
+# /flash/log.bin) and reports per wake the RAM free after the imports (the 'mem'
+# event) and the time from reset to the camera trigger ('cam_trigger'; ticks_ms
+# starts at reset), the figures to compare on the GPy itself.
+
+import gc
+import sys
+
+_HOST = sys.implementation.name != 'micropython'
+_HERE = __file__.rpartition('/')[0] or '.'
+if '--path' in sys.argv:
+    sys.path.insert(0, sys.argv[sys.argv.index('--path') + 1])
+sys.path.insert(1, _HERE + '/../lib')
+sys.path.append(_HERE + '/../host')
+
+from checks import check, done
+
+try:
+    from time import perf_counter_ns
+
+    def _now_us():
+        return perf_counter_ns() // 1000
+
+    def _diff_us(end, start):
+        return end - start
+except ImportError:
+    import utime
+    _now_us = utime.ticks_us
+    _diff_us = utime.ticks_diff
+
+# Imported by main.py at boot, in its order
+BOOT = ('ds3231', 'drift', 'schedule', 'cadence', 'power', 'battery',
+        'governor', 'energy', 'state', 'telemetry', 'ringlog', 'bufpool')
+# Imported at boot before, now on demand or not at all
+DEFERRED = ('transport', 'telering', 'nettime', 'picture', 'base64', 'upload', 'timesync', 'urequests')
+
+
+def _heap():
+    gc.collect()
+    if _HOST:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[0]
+    return gc.mem_alloc()
+
+
+def measure(modules):
+    # (module, us, heap bytes) for each import, in order
+    results = []
+    for name in modules:
+        before = _heap()
+        t = _now_us()
+        __import__(name)
+        us = _diff_us(_now_us(), t)
+        results.append((name, us, _heap() - before))
+    return results
+
+
+def top_level_imports(path):
+    # Modules main.py imports outside any function before its entry point, on every wake
+    names = set()
+    with open(path) as f:
+        for line in f:
+            if 'Entry Point' in line:
+                break
+            words = line.split()
+            if line[:1] != ' ' and len(words) > 1 and words[0] in ('import', 'from'):
+                names.add(words[1].rstrip(','))
+    return names
+
+
+def report_log(path):
+    import ringlog
+    with open(path, 'rb') as f:
+        data = f.read()
+    print('%6s %14s %18s' % ('wake', 'mem free', 'reset->trigger ms'))
+    wake = 0
+    mem = trigger = None
+    triggers = []
+    for ticks, level, name, a, b in list(ringlog.decode(data)) + [(0, 0, 'boot', 0, 0)]:
+        if name == 'boot':
+            if wake:
+                print('%6d %14s %18s' % (wake, mem if mem is not None else '-',
+                                         trigger if trigger is not None else '-'))
+                if trigger is not None:
+                    triggers.append(trigger)
+            wake += 1
+            mem = trigger = None
+        elif name == 'mem':
+            mem = b
+        elif name == 'cam_trigger':
+            trigger = b
+    if triggers:
+        triggers.sort()
+        print('median reset->trigger: %d ms over %d captures' % (triggers[len(triggers) // 2], len(triggers)))
+
+
+def main():
+    if _HOST:
+        import tracemalloc
+        tracemalloc.start()
+    boot = measure(BOOT)
+    deferred = measure(DEFERRED)
+    print('%-12s %10s %12s' % ('module', 'ms', 'heap bytes'))
+    for name, us, used in boot + deferred:
+        print('%-12s %10.2f %12d %s' % (name, us / 1000, used, 'deferred' if name in DEFERRED else ''))
+    boot_us = sum(us for _, us, _ in boot)
+    boot_heap = sum(used for _, _, used in boot)
+    lazy_us = sum(us for _, us, _ in deferred)
+    lazy_heap = sum(used for _, _, used in deferred)
+    print('%-12s %10.2f %12d' % ('boot', boot_us / 1000, boot_heap))
+    print('%-12s %10.2f %12d' % ('+ deferred', (boot_us + lazy_us) / 1000, boot_heap + lazy_heap))
+    if _HOST:
+        tracemalloc.stop()
+
+    print()
+    print('checks')
+    imports = top_level_imports(_HERE + '/../main.py')
+    check('main.py imports no deferred module at boot', not imports.intersection(DEFERRED + ('urtc',)))
+    check('deferred modules cost heap at import', lazy_heap > 0)
+
+    if '--log' in sys.argv:
+        print()
+        report_log(sys.argv[sys.argv.index('--log') + 1])
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# bench_ds3231.py  Heap allocation per call of the DS3231 drivers.
+#
+# CPython:    python bench/bench_ds3231.py
+# unix port:  micropython bench/bench_ds3231.py
+#
+# Runs the wake-time RTC calls of lib/ds3231.py, lib/urtc.py and lib/ds3231_port.py
+# on a register-file bus that does not allocate itself, so every byte counted is
+# allocated by the driver.  Under MicroPython the count is gc.mem_alloc() growth
+# with the collector disabled, which is what the GPy heap sees; under CPython it
+# is the tracemalloc peak per call, a rough guide only (every int above 256, such
+# as the year, is a heap object there).  Under MicroPython the lib/ds3231.py calls
+# must not allocate at all.
+
+import sys
+
+_MPY = sys.implementation.name == 'micropython'
+_HERE = __file__.rpartition('/')[0] or '.'
+sys.path.insert(0, _HERE + '/../lib')
+sys.path.append(_HERE + '/../host')
+
+import gc
+import ds3231
+import urtc
+
+CALLS = 200
+ALARM = (None, None, None, None, 19, 5, 0, None)
+
+
+class Bus:
+    def __init__(self):
+        self.regs = bytearray(256)
+        self.regs[0:7] = bytes((0x56, 0x34, 0x12, 0x03, 0x29, 0x09, 0x21))     # 2021-09-29 12:34:56
+        self.regs[0x11] = 25
+
+    def scan(self):
+        return [0x68]
+
+    def readfrom_mem(self, address, register, n):
+        buf = bytearray(n)      # As machine.I2C: a new buffer per read
+        self.readfrom_mem_into(address, register, buf)
+        return buf
+
+    def readfrom_mem_into(self, address, register, buf):
+        regs = self.regs
+        i, n = 0, len(buf)
+        while i < n:           # No range iterator, which CPython would allocate
+            buf[i] = regs[register + i]
+            i += 1
+
+    def writeto_mem(self, address, register, buf):
+        regs = self.regs
+        i, n = 0, len(buf)
+        while i < n:           # No range iterator, which CPython would allocate
+            regs[register + i] = buf[i]
+            i += 1
+
+
+if _MPY:
+    def per_call(fn, calls=CALLS):
+        fn()
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(calls):
+            fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used // calls
+else:
+    import tracemalloc
+
+    def _peak(fn, calls):
+        fn()
+        total = 0
+        tracemalloc.start()
+        for _ in range(calls):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn()
+            total += tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        return total // calls
+
+    def per_call(fn, calls=CALLS):
+        # Less the measurement's own overhead (an empty call)
+        return max(_peak(fn, calls) - _peak(lambda: None, calls), 0)
+
+
+def set_next_alarm_new(rtc, t):
+    rtc.load()
+    rtc.datetime_into(t)
+    rtc.alarm_time(ALARM)
+    rtc.no_interrupt()
+    rtc.no_alarmflag()
+    rtc.interrupt(alarm=0)
+    rtc.commit()
+
+
+def set_next_alarm_urtc(rtc):
+    rtc.load()
+    rtc.datetime()
+    rtc.alarm_time(ALARM)
+    rtc.no_interrupt()
+    rtc.no_alarmflag()
+    rtc.interrupt(alarm=0)
+    rtc.commit()
+
+
+def run():
+    results = []
+    rtc = ds3231.DS3231(Bus())
+    t = rtc.new_datetime()
+    results.append(('ds3231 datetime_into', per_call(lambda: rtc.datetime_into(t)), True))
+    results.append(('ds3231 alarm_time_into', per_call(lambda: rtc.alarm_time_into(t)), True))
+    results.append(('ds3231 alarm_time write', per_call(lambda: rtc.alarm_time(ALARM)), True))
+    results.append(('ds3231 no_alarmflag', per_call(rtc.no_alarmflag), True))
+    results.append(('ds3231 temperature_q', per_call(rtc.temperature_q), True))
+    results.append(('ds3231 set_next_alarm (burst)', per_call(lambda: set_next_alarm_new(rtc, t)), True))
+
+    old = urtc.DS3231(Bus())
+    results.append(('urtc datetime', per_call(old.datetime), False))
+    results.append(('urtc alarm_time read', per_call(old.alarm_time), False))
+    results.append(('urtc alarm_time write', per_call(lambda: old.alarm_time(ALARM)), False))
+    results.append(('urtc no_alarmflag', per_call(old.no_alarmflag), False))
+    results.append(('urtc set_next_alarm (burst)', per_call(lambda: set_next_alarm_urtc(old)), False))
+
+    try:
+        import ds3231_port
+    except ImportError:
+        ds3231_port = None
+    if ds3231_port is not None:
+        port = ds3231_port.DS3231(Bus())
+        results.append(('ds3231_port get_time', per_call(port.get_time), False))
+        results.append(('ds3231_port get_temperature', per_call(port.get_temperature), False))
+    return results
+
+
+def main():
+    results = run()
+    print('%-32s %10s' % ('call', 'bytes/call' if _MPY else 'peak/call'))
+    failed = 0
+    for name, used, zero in results:
+        flag = ''
+        if _MPY and zero and used:
+            flag = 'ALLOCATES'
+            failed += 1
+        print('%-32s %10d %s' % (name, used, flag))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
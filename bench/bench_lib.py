@@ -0,0 +1,224 @@
+# bench_lib.py  Micro-benchmarks for the bundled libraries in lib/.
+#
+# CPython:    python bench/bench_lib.py [--save] [--compare] [--url URL]
+# unix port:  micropython bench/bench_lib.py [--save] [--compare] --url URL
+#
+# Covers base64.b64encode throughput by size, ds3231, urtc and ds3231_port datetime/alarm
+# encode and decode (on an in-memory I2C bus), untplib NTPPacket.to_data/from_data
+# and urequests.request against a local HTTP server.  CPython starts its own
+# server; under the unix port pass --url (e.g. one served by CPython).
+#
+# --save writes bench/lib_baseline.json (one section per implementation) and
+# --compare prints the ratio of every result to that baseline and fails if a
+# result is more than 20 % slower than the baseline or has none.
+
+import sys
+
+_HOST = sys.implementation.name != 'micropython'
+_HERE = __file__.rpartition('/')[0] or '.'
+sys.path.insert(0, _HERE + '/../lib')
+sys.path.append(_HERE + '/../host')
+BASELINE = _HERE + '/lib_baseline.json'
+SLOWER = 1.20
+
+import json
+try:
+    from time import perf_counter_ns
+
+    def _now_us():
+        return perf_counter_ns() // 1000
+
+    def _diff_us(end, start):
+        return end - start
+except ImportError:
+    import utime
+    _now_us = utime.ticks_us
+    _diff_us = utime.ticks_diff
+
+import base64
+import ds3231
+import untplib
+import urtc
+from fake_i2c import I2C, RegisterFile
+from checks import check, done
+
+B64_SIZES = (1024, 16384, 65536)
+TARGET_US = 200000              # Run each benchmark for about this long
+
+
+def timeit(fn, target_us=TARGET_US):
+    # Returns microseconds per call, calibrating the iteration count first
+    n = 1
+    while True:
+        t = _now_us()
+        for _ in range(n):
+            fn()
+        elapsed = _diff_us(_now_us(), t)
+        if elapsed >= target_us // 4 or n >= 1 << 20:
+            break
+        n *= 4
+    n = max(1, n * target_us // max(elapsed, 1))
+    t = _now_us()
+    for _ in range(n):
+        fn()
+    return _diff_us(_now_us(), t) / n
+
+
+def bench_base64(results):
+    for size in B64_SIZES:
+        data = bytes(range(256)) * (size // 256)
+        results['b64encode %dK' % (size // 1024)] = timeit(lambda: base64.b64encode(data))
+
+
+def _rtc_bus():
+    i2c = I2C()
+    regs = i2c.attach(0x68, RegisterFile()).regs
+    regs[0:7] = bytes((0x56, 0x34, 0x12, 0x03, 0x29, 0x09, 0x21))     # 2021-09-29 12:34:56
+    return i2c
+
+
+def bench_urtc(results):
+    rtc = urtc.DS3231(_rtc_bus())
+    now = (2021, 9, 29, 3, 12, 34, 56, 0)
+    alarm = (None, None, None, None, 13, 5, 0, None)
+    results['urtc datetime read'] = timeit(lambda: rtc.datetime())
+    results['urtc datetime write'] = timeit(lambda: rtc.datetime(now))
+    results['urtc alarm_time read'] = timeit(lambda: rtc.alarm_time())
+    results['urtc alarm_time write'] = timeit(lambda: rtc.alarm_time(alarm))
+
+
+def bench_ds3231(results):
+    rtc = ds3231.DS3231(_rtc_bus())
+    t = rtc.new_datetime()
+    now = (2021, 9, 29, 3, 12, 34, 56, 0)
+    alarm = (None, None, None, None, 13, 5, 0, None)
+    results['ds3231 datetime_into'] = timeit(lambda: rtc.datetime_into(t))
+    results['ds3231 set_datetime'] = timeit(lambda: rtc.set_datetime(now))
+    results['ds3231 alarm_time_into'] = timeit(lambda: rtc.alarm_time_into(t))
+    results['ds3231 alarm_time write'] = timeit(lambda: rtc.alarm_time(alarm))
+
+
+def bench_ds3231_port(results):
+    try:
+        import ds3231_port
+    except ImportError:
+        return
+    rtc = ds3231_port.DS3231(_rtc_bus())
+    results['ds3231_port get_time'] = timeit(lambda: rtc.get_time())
+
+
+def bench_untplib(results):
+    packet = untplib.NTPPacket(version=3, mode=4, tx_timestamp=3841862400 << 32)
+    packet.stratum = 2
+    data = packet.to_data()
+    stats = untplib.NTPStats()
+    results['NTPPacket.to_data'] = timeit(packet.to_data)
+    results['NTPPacket.from_data'] = timeit(lambda: stats.from_data(data))
+
+
+def _local_server():
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'{"ok": 1}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/status' % server.server_address[1]
+
+
+def bench_urequests(results, url):
+    import urequests
+    server = None
+    if url is None:
+        if not _HOST:
+            return
+        server, url = _local_server()
+
+    def get():
+        r = urequests.request('GET', url)
+        r.content
+        r.close()
+
+    results['urequests GET'] = timeit(get, TARGET_US * 5)
+    if server is not None:
+        server.shutdown()
+
+
+def run(url=None):
+    results = {}
+    bench_base64(results)
+    bench_ds3231(results)
+    bench_urtc(results)
+    bench_ds3231_port(results)
+    bench_untplib(results)
+    bench_urequests(results, url)
+    return results
+
+
+# Prints the results against 'baseline'; returns the names that are slower and
+#   those without a baseline
+def report(results, baseline):
+    slower = []
+    missing = []
+    print('%-28s %12s %12s %8s' % ('benchmark', 'us/op', 'baseline', 'ratio'))
+    for name in sorted(results):
+        us = results[name]
+        ref = baseline.get(name)
+        if ref:
+            ratio = us / ref
+            if ratio > SLOWER:
+                slower.append(name)
+            print('%-28s %12.2f %12.2f %8.2f %s' % (name, us, ref, ratio, 'SLOWER' if ratio > SLOWER else ''))
+        else:
+            missing.append(name)
+            print('%-28s %12.2f %12s %8s' % (name, us, '-', '-'))
+    for size in B64_SIZES:
+        name = 'b64encode %dK' % (size // 1024)
+        print('%s: %.1f MB/s' % (name, size / results[name]))
+    return slower, missing
+
+
+def main(argv):
+    url = None
+    if '--url' in argv:
+        url = argv[argv.index('--url') + 1]
+    results = run(url)
+
+    try:
+        with open(BASELINE) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    impl = sys.implementation.name
+    baseline = saved.get(impl, {}) if '--compare' in argv else {}
+    slower, missing = report(results, baseline)
+    if slower:
+        # Slower only if the second run is too: a busy moment on the host is not a regression
+        again = run(url)
+        slower = [name for name in slower if again[name] / baseline[name] > SLOWER]
+    if '--compare' in argv:
+        print()
+        print('checks')
+        check('no result over %d %% slower than the baseline' % round((SLOWER - 1) * 100), not slower)
+        check('every result has a baseline', not missing)
+
+    if '--save' in argv:
+        saved[impl] = dict((k, round(v, 3)) for k, v in results.items())
+        with open(BASELINE, 'w') as f:
+            json.dump(saved, f)
+        print('baseline saved to %s' % BASELINE)
+    done()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,178 @@
+# bench_ntp.py  Multi-server NTP synchronization of the emulated DS3231.
+#
+#   python bench/bench_ntp.py
+#
+# Starts local NTP servers on UDP ports of 127.0.0.1, each with its own network
+# delay and clock offset (one of them a slow falseticker), and runs
+# lib/timesync.sync() against a real-time host/ds3231_emu.py that starts off by a
+# few seconds.  Reports how long the sync took, the sample chosen and the DS3231
+# error before and after, and checks them.  Then sets and checks the DS3231 from
+# the network time of a fake LTE modem (lib/nettime.py, AT+CCLK?).
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from calendar import timegm
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import nettime
+import timesync
+from ds3231 import DS3231
+from ds3231_emu import DS3231Emulator
+from fake_i2c import I2C
+from checks import check, done
+
+NTP_DELTA = 2208988800
+# (one-way network delay s, server clock offset s)
+SERVERS = ((0.030, 0.0), (0.004, 0.0), (0.120, 0.300), (0.015, 0.0))
+RTC_ERROR = -3.4                # DS3231 starts this far behind (s)
+
+
+def _ntp(t):
+    secs = int(t)
+    return secs + NTP_DELTA, int((t - secs) * (1 << 32))
+
+
+class Server:
+    def __init__(self, delay, offset):
+        self.delay = delay
+        self.offset = offset
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.requests = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _reply(self, data, peer):
+        time.sleep(self.delay)                      # Request in flight
+        t2 = time.time() + self.offset
+        reply = bytearray(48)
+        reply[0] = 0 << 6 | (data[0] >> 3 & 7) << 3 | 4
+        reply[1] = 2                                # Stratum
+        reply[24:32] = data[40:48]                  # Originate = client transmit
+        struct.pack_into('!II', reply, 32, *_ntp(t2))
+        struct.pack_into('!II', reply, 40, *_ntp(time.time() + self.offset))
+        time.sleep(self.delay)                      # Reply in flight
+        self.sock.sendto(reply, peer)
+
+    def _run(self):
+        while True:
+            data, peer = self.sock.recvfrom(512)
+            self.requests += 1
+            threading.Thread(target=self._reply, args=(data, peer), daemon=True).start()
+
+
+class Modem:
+    # Answers AT+CCLK? like the LTE modem: local time in whole seconds, zone in quarter hours
+    def __init__(self, zone=8, valid=True):
+        self.zone = zone
+        self.valid = valid
+
+    def send_at_cmd(self, cmd):
+        if cmd != 'AT+CCLK?':
+            return '\r\nOK\r\n'
+        if not self.valid:
+            return '\r\n+CCLK: "70/01/01,00:00:00+00"\r\n\r\nOK\r\n'
+        tm = time.gmtime(int(time.time()) + self.zone * 900)
+        return '\r\n+CCLK: "%02d/%02d/%02d,%02d:%02d:%02d%+03d"\r\n\r\nOK\r\n' % (
+            tm[0] % 100, tm[1], tm[2], tm[3], tm[4], tm[5], self.zone)
+
+
+def network_time():
+    # DS3231 after a power loss (oscillator stopped flag set, year 2000)
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    emu = i2c.attach(0x68, DS3231Emulator(realtime=True))
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+
+    start = time.monotonic()
+    result = nettime.check(rtc, t, Modem())
+    elapsed = time.monotonic() - start
+    after = rtc_error(emu)
+    again = nettime.check(rtc, t, Modem(zone=-20))
+    print('%-28s %10.1f ms' % ('network time set', elapsed * 1000))
+    print('%-28s %10.1f ms' % ('DS3231 error after', after * 1000))
+
+    now = time.time()
+    check('CCLK reply parsed', nettime.parse('+CCLK: "21/09/29,12:34:56+08"') ==
+          timegm((2021, 9, 29, 12, 34, 56)) - 8 * 900)
+    check('CCLK without zone parsed', nettime.parse('+CCLK: "21/09/29,12:34:56"') ==
+          timegm((2021, 9, 29, 12, 34, 56)))
+    check('garbled CCLK rejected', nettime.parse('+CCLK: "21/9/29,12:34:56"') is None)
+    check('modem without network time gives None', nettime.check(rtc, t, Modem(valid=False)) is None)
+    check('invalid DS3231 set from network time', result is not None and result[1] and not rtc.lost_power())
+    check('DS3231 within 1 s of network time after setting', abs(after) < 1.0)
+    check('valid DS3231 checked, not written', again is not None and not again[1] and
+          abs(again[0]) <= nettime.TOLERANCE_S)
+    emu.set_time(time.gmtime(int(now) + 10)[:6])
+    off = nettime.check(rtc, t, Modem())
+    check('DS3231 10 s off reported, not written', off is not None and not off[1] and 9 <= off[0] <= 11)
+
+
+def rtc_error(emu):
+    emu.read(0, 1)                                  # Bring the real-time emulator up to date
+    return emu.seconds() - time.time()
+
+
+def main():
+    servers = [Server(d, o) for d, o in SERVERS]
+    addresses = [s.address for s in servers]
+
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    now = time.time() + RTC_ERROR
+    emu = i2c.attach(0x68, DS3231Emulator(time.gmtime(int(now))[:6], realtime=True))
+    emu._frac = now % 1
+    emu._last = time.monotonic()
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+    buf = bytearray(48)
+
+    before = rtc_error(emu)
+    start = time.monotonic()
+    result = timesync.sync(rtc, t, buf, addresses)
+    elapsed = time.monotonic() - start
+    after = rtc_error(emu)
+    error_ms, delay_ms, replies, written = result
+
+    print('%-28s %10.1f ms' % ('sync time', elapsed * 1000))
+    print('%-28s %10d' % ('servers answered', replies))
+    print('%-28s %10d ms' % ('delay of the sample used', delay_ms))
+    print('%-28s %10d ms (true %.1f ms)' % ('DS3231 error measured', error_ms, before * 1000))
+    print('%-28s %10.1f ms' % ('DS3231 error after', after * 1000))
+
+    # Second run: the DS3231 is now within the threshold and is left alone.  Start it
+    #   mid-second; right after the write the next DS3231 transition is a full second away.
+    time.sleep(0.4)
+    start = time.monotonic()
+    again = timesync.sync(rtc, t, buf, addresses)
+    elapsed_again = time.monotonic() - start
+    print('%-28s %10.1f ms' % ('check-only sync time', elapsed_again * 1000))
+
+    print()
+    print('checks')
+    check('all servers answered', replies == len(SERVERS))
+    delays = sorted(2000 * d for d, _ in SERVERS)
+    check('lowest-delay sample used', delay_ms < delays[1])     # Thread scheduling adds a few ms
+    check('measured error within 10 ms of the truth', abs(error_ms - before * 1000) < 10)
+    check('DS3231 written', written)
+    check('DS3231 within 5 ms of NTP after the sync', abs(after) < 0.005)
+    check('second sync leaves the DS3231 alone', again is not None and not again[3])
+    check('sync under 2.2 s (exchange + at most 2 second edges)', elapsed < 2.2)
+    check('check-only sync under 0.8 s', elapsed_again < 0.8)
+    check('no reply gives None', timesync.sync(rtc, t, buf, [('127.0.0.1', 9)], timeout_ms=100) is None)
+
+    print()
+    print('network time')
+    network_time()
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+# bench_pipeline.py  Peak memory of the capture -> encode -> upload path versus picture size.
+#
+# Host:    python bench/bench_pipeline.py [--save] [--check] [--heap BYTES] [--picture-max BYTES]
+#            Peak memory and allocation counts come from tracemalloc; wall time is
+#            taken in a separate run with tracing off.
+# Device:  copy bench_pipeline.py to /flash and run
+#            import bench_pipeline; bench_pipeline.main()
+#            Peak memory is sampled with gc.mem_alloc() after every phase and a size
+#            that raises MemoryError is reported as FAIL.
+#
+# Variants:
+#   legacy  the original process_picture(): bytearray, b64encode(), decode to str,
+#           JSON string concatenation and header + body concatenation
+#   pooled  lib/picture.py running out of a BufferPool reserved before the sweep
+#
+# The UART and the socket are in-memory fakes, so only the pipeline's own
+# allocations are measured.  bench/pipeline_baseline.json (--save) is the
+# regression gate: --check fails if a variant's peak grows more than 10 %.
+
+import gc
+import sys
+
+_HOST = sys.implementation.name != 'micropython'
+if _HOST:
+    import json
+    import os
+    import time
+    import tracemalloc
+    _HERE = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+    sys.path.append(os.path.join(_HERE, '..', 'host'))
+    BASELINE = os.path.join(_HERE, 'pipeline_baseline.json')
+else:
+    import utime
+
+import base64
+import picture
+from bufpool import BufferPool, wake_slots
+
+SIZES_KB = (10, 25, 50, 100, 200, 300, 400, 500)
+PICTURE_MAX = 131072        # Same slot size as main.py
+LARGE = 1024                # Allocations at least this big are counted
+TOLERANCE = 0.10
+
+HOST = "water.roeber.dev"
+PORT = 80
+REPLY = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'
+
+
+class FakeUART:
+    # Delivers n picture bytes in FIFO-sized pieces, like machine.UART.readinto()
+    FIFO = 512
+
+    def __init__(self, n, block):
+        self.left = n
+        self.block = block
+
+    def any(self):
+        return min(self.left, self.FIFO)
+
+    def readinto(self, mv):
+        k = min(len(mv), self.left, self.FIFO)
+        mv[:k] = self.block[:k]
+        self.left -= k
+        return k
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+    def settimeout(self, value):
+        pass
+
+    def recv(self, n):
+        return REPLY[:n]
+
+    def readinto(self, buf):
+        n = min(len(buf), len(REPLY))
+        buf[:n] = REPLY[:n]
+        return n
+
+
+def _concat(header_bytes, data_file):
+    try:
+        return header_bytes + data_file     # MicroPython accepts bytes + str
+    except TypeError:
+        return header_bytes + data_file.encode()
+
+
+def legacy(uart, sock, n, step, pool=None):
+    buf = bytearray(n)
+    mv = memoryview(buf)
+    idx = 0
+    while idx < n:
+        if uart.any():
+            idx += uart.readinto(mv[idx:])
+    step()
+
+    b64_picture_bytes = base64.b64encode(buf)
+    step()
+    del buf, mv
+
+    data_file = "{\"voltage\": " + "648" + ",\"base64File\": \"" + b64_picture_bytes.decode('ascii') + \
+                "\", \"id\": " + "50" + ", \"timeStamp\": \"" + "2021-09-29T13:05:00" + "\"}"
+    step()
+
+    header_bytes = ("POST /file/base64 HTTP/1.1\r\nContent-Type: application/json\r\n"
+                    "Content-Length: %d\r\nHost: %s:%d\r\n\r\n" % (len(data_file), HOST, PORT)).encode('iso-8859-1')
+    payload = _concat(header_bytes, data_file)
+    step()
+
+    sock.sendall(payload)
+    sock.recv(1024)
+    step()
+
+
+def pooled(uart, sock, n, step, pool):
+    buf = pool.borrow('picture', n)
+    picture.receive(uart, buf, n)
+    step()
+
+    b64_buf = pool.borrow('b64', base64.encoded_length(n))
+    b64_len = base64.b64encode_into(memoryview(buf)[:n], b64_buf)
+    pool.give_back('picture')
+    step()
+
+    prefix, suffix = picture.json_parts("648", "50", "2021-09-29T13:05:00")
+    step()
+
+    reply = pool.borrow('net')
+    picture.post(sock, HOST, PORT, prefix, memoryview(b64_buf)[:b64_len], suffix, reply)
+    pool.give_back('net')
+    pool.give_back('b64')
+    step()
+
+
+VARIANTS = (('legacy', legacy), ('pooled', pooled))
+
+
+def _block():
+    try:
+        import os
+        block = bytearray(os.urandom(FakeUART.FIFO))
+    except (ImportError, AttributeError):
+        import urandom
+        block = bytearray(urandom.getrandbits(8) for _ in range(FakeUART.FIFO))
+    block[0:4] = b'\xff\xd8\xff\xe0'       # JPEG SOI + APP0 so the bytes look like a picture
+    return block
+
+
+# Host measurements ########################################################
+
+def _host_time(fn, n, block, pool):
+    t = time.perf_counter()
+    fn(FakeUART(n, block), FakeSocket(), n, lambda: None, pool)
+    return (time.perf_counter() - t) * 1000
+
+
+def _host_peak(fn, n, block, pool):
+    uart, sock = FakeUART(n, block), FakeSocket()
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(uart, sock, n, lambda: None, pool)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak
+
+
+def _host_allocs(fn, n, block, pool):
+    # Count blocks >= LARGE that each phase leaves allocated, from snapshot differences
+    uart, sock = FakeUART(n, block), FakeSocket()
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    count = [0]
+    gc.collect()
+    tracemalloc.start()
+    prev = [tracemalloc.take_snapshot().filter_traces(ignore)]
+
+    def step():
+        snap = tracemalloc.take_snapshot().filter_traces(ignore)
+        for stat in snap.compare_to(prev[0], 'lineno'):
+            if stat.count_diff > 0 and stat.size_diff >= LARGE * stat.count_diff:
+                count[0] += stat.count_diff
+        prev[0] = snap
+
+    fn(uart, sock, n, step, pool)
+    tracemalloc.stop()
+    return count[0]
+
+
+def run_host(sizes_kb, picture_max, heap):
+    block = _block()
+    pool = BufferPool(wake_slots(picture_max))
+    reserved = sum(size for _, size, _, _, _ in pool.stats())
+    results = {}
+    print('pool reserved: %d bytes (picture slot %d)' % (reserved, picture_max))
+    print('%8s %8s %12s %8s %10s %s' % ('size_kb', 'variant', 'peak_bytes', 'allocs', 'ms', ''))
+    for name, fn in VARIANTS:
+        results[name] = {}
+        for kb in sizes_kb:
+            n = kb * 1024
+            ms = _host_time(fn, n, block, pool)
+            peak = _host_peak(fn, n, block, pool)
+            allocs = _host_allocs(fn, n, block, pool)
+            resident = peak + (reserved if name == 'pooled' else 0)
+            flag = 'FAIL' if heap and resident > heap else ''
+            print('%8d %8s %12d %8d %10.2f %s' % (kb, name, peak, allocs, ms, flag))
+            results[name][str(kb)] = {'peak': peak, 'allocs': allocs, 'ms': round(ms, 2)}
+    return results
+
+
+def check(results):
+    try:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    except OSError:
+        print('no baseline at %s; run with --save first' % BASELINE)
+        return False
+    ok = True
+    for name in results:
+        for kb, cell in results[name].items():
+            ref = baseline.get(name, {}).get(kb)
+            if ref is None:
+                continue
+            if cell['peak'] > ref['peak'] * (1 + TOLERANCE) + LARGE:
+                print('REGRESSION %s %s KB: peak %d > baseline %d' % (name, kb, cell['peak'], ref['peak']))
+                ok = False
+    print('peak memory within %d %% of baseline' % (TOLERANCE * 100) if ok else 'peak memory regression')
+    return ok
+
+
+# Device measurements ######################################################
+
+def run_device(sizes_kb, picture_max):
+    block = _block()
+    pool = BufferPool(wake_slots(picture_max))
+    print('pool reserved, mem_free %d' % gc.mem_free())
+    print('%8s %8s %12s %8s %10s' % ('size_kb', 'variant', 'peak_bytes', 'allocs', 'ms'))
+    for name, fn in VARIANTS:
+        for kb in sizes_kb:
+            n = kb * 1024
+            uart, sock = FakeUART(n, block), FakeSocket()
+            gc.collect()
+            base = gc.mem_alloc()
+            peak = [0, 0, base]         # peak, large allocations, last sample
+
+            def step():
+                used = gc.mem_alloc()
+                if used - peak[2] >= LARGE:
+                    peak[1] += 1
+                peak[2] = used
+                if used - base > peak[0]:
+                    peak[0] = used - base
+
+            t = utime.ticks_ms()
+            try:
+                fn(uart, sock, n, step, pool)
+            except MemoryError:
+                print('%8d %8s %12s' % (kb, name, 'FAIL'))
+                continue
+            ms = utime.ticks_diff(utime.ticks_ms(), t)
+            print('%8d %8s %12d %8d %10d' % (kb, name, peak[0], peak[1], ms))
+
+
+def main(sizes_kb=SIZES_KB, picture_max=PICTURE_MAX):
+    if not _HOST:
+        run_device(sizes_kb, picture_max)
+        return
+    import argparse
+    parser = argparse.ArgumentParser(description='Peak memory of the capture -> encode -> upload path')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='fail if peak memory regresses against the baseline')
+    parser.add_argument('--heap', type=int, default=0, help='mark sizes whose resident memory exceeds this heap')
+    parser.add_argument('--picture-max', type=int, default=picture_max, help='BufferPool picture slot size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(sizes_kb), help='picture sizes in KB')
+    args = parser.parse_args()
+
+    results = run_host(args.sizes, args.picture_max, args.heap)
+    if args.save:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print('baseline saved to %s' % BASELINE)
+    if args.check and not check(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
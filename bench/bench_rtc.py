@@ -0,0 +1,183 @@
+# bench_rtc.py  DS3231 driver correctness and I2C bus cost on the emulated DS3231.
+#
+#   python bench/bench_rtc.py
+#
+# Runs the RTC operations of a wake (the set_next_alarm() sequence from main.py,
+# datetime reads and writes) with lib/ds3231.py, lib/urtc.py and lib/ds3231_port.py
+# against host/ds3231_emu.py behind host/fake_i2c.py.
+# Every operation is first checked against the emulator state, then reported
+# with its I2C transaction count, bytes moved and bus time at 100 kHz.
+
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+from ds3231 import DS3231, HOUR
+import urtc
+from ds3231_emu import DS3231Emulator, A1F
+from fake_i2c import I2C
+from checks import check, done
+
+START = (2021, 9, 29, 13, 4, 58)
+
+
+def bus(start=START, century=0):
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    emu = i2c.attach(0x68, DS3231Emulator(start, century=century))
+    return i2c, emu
+
+
+def next_alarm_hour(hour):
+    # Alarm times of main.set_next_alarm(): 0105, 0705, 1305 and 1905
+    if hour < 7:
+        return 7
+    if hour < 13:
+        return 13
+    if hour < 19:
+        return 19
+    return 1
+
+
+def set_next_alarm(ds3231):
+    startup_datetime = ds3231.datetime()
+    next_hour = next_alarm_hour(startup_datetime[4])
+    ds3231.alarm_time((None, None, None, None, next_hour, 5, 0, None))
+    ds3231.alarm_time()
+    ds3231.no_interrupt()
+    ds3231.no_alarmflag()
+    ds3231.interrupt(alarm=0)
+    return startup_datetime
+
+
+def set_next_alarm_burst(ds3231):
+    # main.set_next_alarm(): one burst read, changes on the shadow, one burst write
+    ds3231.load()
+    startup_datetime = set_next_alarm(ds3231)
+    ds3231.commit()
+    return startup_datetime
+
+
+def set_next_alarm_ds3231(rtc, t):
+    rtc.load()
+    rtc.datetime_into(t)
+    rtc.alarm_time((None, None, None, None, next_alarm_hour(t[HOUR]), 5, 0, None))
+    rtc.no_interrupt()
+    rtc.no_alarmflag()
+    rtc.interrupt(alarm=0)
+    rtc.commit()
+    return t
+
+
+def measure(label, i2c, fn):
+    i2c.reset_counters()
+    result = fn()
+    print('%-32s %6d %6d %6d %6d %9d' % (label, i2c.transactions, i2c.reads, i2c.writes,
+                                         i2c.bytes, i2c.bus_time_us()))
+    return result
+
+
+def main():
+    print('%-32s %6s %6s %6s %6s %9s' % ('operation', 'trans', 'reads', 'writes', 'bytes', 'bus_us'))
+
+    i2c, emu = bus()
+    ds3231 = urtc.DS3231(i2c)
+    emu.regs[0x0f] |= A1F                   # Alarm that reset the GPy is still pending
+    measure('urtc set_next_alarm', i2c, lambda: set_next_alarm(ds3231))
+    emu.regs[0x0f] |= A1F
+    measure('urtc set_next_alarm (burst)', i2c, lambda: set_next_alarm_burst(ds3231))
+    burst_transactions = i2c.transactions
+    dt = measure('urtc datetime read', i2c, ds3231.datetime)
+    measure('urtc datetime write', i2c, lambda: ds3231.datetime((2021, 9, 29, 3, 13, 5, 0, 0)))
+    measure('urtc alarm_time read', i2c, ds3231.alarm_time)
+
+    i2c3, emu3 = bus()
+    rtc = DS3231(i2c3)
+    t = rtc.new_datetime()
+    emu3.regs[0x0f] |= A1F
+    measure('ds3231 set_next_alarm (burst)', i2c3, lambda: set_next_alarm_ds3231(rtc, t))
+    measure('ds3231 datetime_into', i2c3, lambda: rtc.datetime_into(t))
+    measure('ds3231 set_datetime', i2c3, lambda: rtc.set_datetime((2021, 9, 29, 3, 13, 5, 0, 0)))
+    measure('ds3231 temperature_q', i2c3, rtc.temperature_q)
+
+    try:
+        import ds3231_port
+    except ImportError:
+        ds3231_port = None
+    if ds3231_port is not None:
+        i2c2, emu2 = bus(century=0x80)      # ds3231_port expects the century bit set for 20xx
+        port = ds3231_port.DS3231(i2c2)
+        port_time = measure('ds3231_port get_time', i2c2, port.get_time)
+        measure('ds3231_port get_temperature', i2c2, port.get_temperature)
+
+    print()
+    print('checks')
+    check('urtc datetime matches the emulator', tuple(dt[:3]) + tuple(dt[4:7]) == START)
+    i2c, emu = bus()
+    ds3231 = urtc.DS3231(i2c)
+    emu.regs[0x0f] |= A1F
+    set_next_alarm(ds3231)
+    check('pending alarm flag cleared, INT released', emu.int_pin() == 1)
+    check('alarm 1 read back as 19:05:00', tuple(ds3231.alarm_time())[4:7] == (19, 5, 0))
+    emu.advance_to_interrupt()
+    check('INT asserted at 19:05:00', emu.now()[3:] == (19, 5, 0) and emu.int_pin() == 0)
+    check('alarm flag visible to the driver', ds3231.alarm(alarm=0))
+    ds3231.no_alarmflag()
+    check('clearing the flag releases INT', emu.int_pin() == 1)
+    ds3231.datetime((2021, 12, 31, 5, 23, 59, 59, 0))
+    emu.advance(1)
+    check('datetime write and rollover to 2022-01-01', tuple(ds3231.datetime()[:3]) == (2022, 1, 1))
+    check('OSF cleared by a datetime write', not ds3231.lost_power())
+
+    i2c, emu = bus()
+    ds3231 = urtc.DS3231(i2c)
+    emu.regs[0x0f] |= A1F
+    dt = set_next_alarm_burst(ds3231)
+    check('burst: datetime from the shadow matches', tuple(dt[:3]) + tuple(dt[4:7]) == START)
+    check('burst: two I2C transactions', burst_transactions == 2)
+    check('burst: flag cleared, INT released', emu.int_pin() == 1)
+    check('burst: alarm 1 at 19:05:00, A1IE set', emu.regs[7:11] == bytes((0, 5, 0x19, 0x80))
+          and emu.regs[0x0e] & 0x07 == 0x05)
+    emu.advance_to_interrupt()
+    check('burst: INT asserted at 19:05:00', emu.now()[3:] == (19, 5, 0) and emu.int_pin() == 0)
+
+    i2c, emu = bus()
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+    emu.regs[0x0f] |= A1F
+    i2c.reset_counters()
+    set_next_alarm_ds3231(rtc, t)
+    check('ds3231: datetime_into matches the emulator', tuple(t[:3]) + tuple(t[4:7]) == START)
+    check('ds3231: set_next_alarm in two I2C transactions', i2c.transactions == 2)
+    check('ds3231: flag cleared, INT released', emu.int_pin() == 1)
+    a = rtc.alarm_time_into(rtc.new_datetime())
+    check('ds3231: alarm 1 read back as 19:05:00', tuple(a[4:7]) == (19, 5, 0) and a[2] is None)
+    emu.advance_to_interrupt()
+    check('ds3231: INT asserted at 19:05:00', emu.now()[3:] == (19, 5, 0) and emu.int_pin() == 0)
+    check('ds3231: alarm flag visible to the driver', rtc.alarm(alarm=0))
+    rtc.set_datetime((2021, 12, 31, 5, 23, 59, 59, 0))
+    emu.advance(1)
+    check('ds3231: set_datetime and rollover to 2022-01-01', tuple(rtc.datetime_into(t)[:3]) == (2022, 1, 1))
+    check('ds3231: OSF cleared by set_datetime', not rtc.lost_power())
+    check('ds3231: reads the time urtc wrote', tuple(DS3231(i2c).datetime_into(t)[:3]) ==
+          tuple(urtc.DS3231(i2c).datetime()[:3]))
+    rtc.aging(-12)
+    check('ds3231: aging register round trip', rtc.aging() == -12 and emu.rate() > 1)
+    check('ds3231: temperature 25.0', rtc.temperature() == 25.0)
+    i2c, emu = bus()
+    emu.realtime = True
+    rtc = DS3231(i2c)
+    rtc.await_transition(t)
+    check('ds3231: await_transition returns on the new second', emu.seconds() % 1 < 0.05)
+
+    if ds3231_port is not None:
+        check('ds3231_port get_time matches the emulator', port_time[:6] == START)
+        check('ds3231_port temperature 25.0', port.get_temperature() == 25.0)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
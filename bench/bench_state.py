@@ -0,0 +1,169 @@
+# bench_state.py  The wake state record (lib/state.py) against one NVS key per value.
+#
+#   python bench/bench_state.py
+#
+# Runs a year of wakes through the modules that keep state (power, governor,
+# cadence, drift, energy), first with each module writing its own NVS key per
+# value (Keys), then through lib/state.py with one commit per wake, and
+# compares the NVS writes (each a flash write and commit on the GPy).  Then
+# checks the record: reload, a damaged record, firmware without NVS strings,
+# an unknown field, large and negative values and the flash file used without
+# pycom.
+
+import binascii
+import os
+import sys
+import tempfile
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import cadence
+import drift
+import energy
+import governor
+import power
+import pycom
+import state
+from checks import check, done
+
+WAKES = 4 * 365
+MODULES = (power, governor, cadence, drift, energy)
+SAMPLE = {'cd_iv': 480, 'cd_at': 28333333, 'dr_r': -5, 'gv_bud': 12000}
+
+
+class Keys:
+    # One signed 32-bit NVS key per value, each put() a write
+    @staticmethod
+    def get(key, default=0):
+        try:
+            value = pycom.nvs_get(key)
+        except ValueError:
+            return default
+        return value - 0x100000000 if value & 0x80000000 else value
+
+    @staticmethod
+    def put(key, value):
+        pycom.nvs_set(key, value & 0xffffffff)
+
+
+def wake(i):
+    # The state traffic of one capture wake, six hours after the last
+    now = 1700000000 + i * 21600
+    power.wake()
+    governor.refill(now)
+    governor.remember_mv(6500 - i % 50)
+    cadence.update(30000 + i * 37 % 2000, 6500, now // 60)
+    if i % 120 == 0:
+        drift.record(now, 150 + i % 7, True)
+    energy.reset()
+    energy.record(energy.ATTACH, 8000)
+    energy.record(energy.CAMERA, 10000)
+    governor.spend(energy.finish(360))
+
+
+def run(store):
+    pycom.nvs_erase_all()
+    for module in MODULES:
+        module.state = store
+    state.load()
+    pycom.writes = 0
+    for i in range(WAKES):
+        wake(i)
+        if store is state:
+            state.commit()
+    return pycom.writes
+
+
+def snapshot():
+    state.load()
+    return dict(state._values)
+
+
+def main():
+    legacy = run(Keys)
+    keys = len(pycom._nvs)
+    store = run(state)
+    print('%-24s %14s %14s' % ('', 'NVS writes/wake', 'stored'))
+    print('%-24s %14.1f %11d keys' % ('one key per value', legacy / WAKES, keys))
+    print('%-24s %14.1f %10d bytes' % ('lib/state.py record', store / WAKES, state.size()))
+
+    print()
+    print('checks')
+    values = dict(state._values)
+    check('fewer NVS writes per wake', store < legacy)
+    check('reload gives the committed values', snapshot() == values)
+    check('unchanged state commits nothing', state.commit() == 0)
+
+    # A damaged record
+    text = pycom._nvs[state.KEY]
+    pycom._nvs[state.KEY] = text[:8] + ('B' if text[8] == 'A' else 'A') + text[9:]
+    state.load()
+    check('damaged record: CORRUPT, defaults', state.status() == state.CORRUPT and
+          cadence.interval() == cadence.START_INTERVAL_MIN)
+    pycom._nvs[state.KEY] = text
+
+    # A record that passes the CRC but whose last varint runs into it
+    record = bytearray(b'\x01\x00\x02\x80')
+    record[1] = len(record) + 2
+    crc = state.crc16(record, len(record))
+    record += bytes((crc >> 8, crc & 0xff))
+    pycom._nvs[state.KEY] = binascii.b2a_base64(bytes(record))[:-1].decode()
+    check('truncated field: CORRUPT, defaults', state.load() == state.CORRUPT and
+          cadence.interval() == cadence.START_INTERVAL_MIN)
+    pycom._nvs[state.KEY] = text
+
+    # Firmware whose NVS only takes integers: the record goes to the file
+    with tempfile.TemporaryDirectory() as tmp:
+        state.FILE = os.path.join(tmp, 'state.bin')
+        nvs_set = pycom.nvs_set
+
+        def integers_only(key, value):
+            if isinstance(value, str):
+                raise TypeError("can't convert str to int")
+            nvs_set(key, value)
+        pycom.nvs_set = integers_only
+        state.load()
+        wake(WAKES)
+        state.commit()
+        latest = dict(state._values)
+        check('no NVS strings: record in the file', state.KEY not in pycom._nvs and
+              os.path.exists(state.FILE) and snapshot() == latest)
+        pycom.nvs_set = nvs_set
+        wake(WAKES + 1)
+        state.commit()
+        latest = dict(state._values)
+        check('back in NVS, the file removed', state.KEY in pycom._nvs and
+              not os.path.exists(state.FILE) and snapshot() == latest)
+
+    # A record from newer firmware with a field this one does not know
+    state.FIELDS['zz_new'] = (60, state.BYTES)
+    state._NAMES[60] = 'zz_new'
+    state._ORDER.append('zz_new')
+    record = state.encode(dict(SAMPLE, zz_new=b'\x00\xff'))
+    del state.FIELDS['zz_new'], state._NAMES[60]
+    state._ORDER.remove('zz_new')
+    check('unknown field skipped', state.decode(record) == SAMPLE)
+    check('negative and large INT round trip',
+          state.decode(state.encode({'dr_r': -123456, 'gv_bud': -1, 'en_tot': 2 ** 40})) ==
+          {'dr_r': -123456, 'gv_bud': -1, 'en_tot': 2 ** 40})
+
+    # The unix port: no pycom, the record is a file
+    with tempfile.TemporaryDirectory() as tmp:
+        state.pycom = None
+        state.FILE = os.path.join(tmp, 'state.bin')
+        check('file: NEW before the first commit', state.load() == state.NEW)
+        for name in SAMPLE:
+            state.put(name, SAMPLE[name])
+        state.commit()
+        check('file: reload gives the committed values', snapshot() == SAMPLE)
+        os.rename(state.FILE, state.FILE + '.new')
+        check('file: reset between remove and rename', snapshot() == SAMPLE)
+        state.pycom = pycom
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# bench_telemetry.py  Size of the binary telemetry record against the same data as JSON.
+#
+#   python bench/bench_telemetry.py
+#
+# Packs one wake's telemetry with lib/telemetry.py and builds the same fields as
+# JSON text, both the way main.py builds its picture JSON (string concatenation,
+# ISO time stamp, centivolt string) and as compact json.dumps() output, and
+# compares the body and the whole HTTP request.  Then posts records to the
+# reference server (host/ref_server.py) the way upload_telemetry() does and
+# checks what it decoded.
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import ref_server
+import telemetry
+import usocket as socket
+from checks import check, done
+
+WAKES_PER_DAY = 8
+FIELDS = {
+    'station': 50, 'time': 1632920700, 'vbat_mv': 6483, 'temp_q': 93, 'rsrp_dbm': -97,
+    'mode': 3, 'wake': 1, 'phase_ms': [1180, 8230, 2040, 90, 10310, 2970, 0], 'length': 30123,
+}
+HEADERS = ('POST /file/telemetry?id=50 HTTP/1.1\r\nContent-Type: application/octet-stream\r\n'
+           'Content-Length: %d\r\nHost: water.roeber.dev:80\r\nConnection: close\r\n\r\n')
+
+
+def record(digest, **changes):
+    f = dict(FIELDS, **changes)
+    buf = bytearray(telemetry.RECORD_SIZE)
+    telemetry.pack_into(buf, 0, f['station'], f['time'], f['vbat_mv'], f['temp_q'], f['rsrp_dbm'],
+                        f['mode'], f['wake'], f['phase_ms'], f['length'], digest)
+    return bytes(buf)
+
+
+def json_concat(digest):
+    # As main.py builds the picture JSON
+    t = time.gmtime(FIELDS['time'])
+    time_stamp = '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}'.format(*t[:6])
+    voltage_level = '{:d}'.format((FIELDS['vbat_mv'] + 5) // 10)
+    phases = ', '.join(str(ms) for ms in FIELDS['phase_ms'])
+    return ("{\"voltage\": " + voltage_level + ", \"id\": " + str(FIELDS['station']) +
+            ", \"timeStamp\": \"" + time_stamp + "\", \"temperature\": " + str(FIELDS['temp_q'] / 4) +
+            ", \"rsrp\": " + str(FIELDS['rsrp_dbm']) + ", \"mode\": " + str(FIELDS['mode']) +
+            ", \"wake\": " + str(FIELDS['wake']) + ", \"phases\": [" + phases + "]" +
+            ", \"length\": " + str(FIELDS['length']) + ", \"hash\": \"" + digest.hex() + "\"}").encode()
+
+
+def json_compact(digest):
+    return json.dumps(dict(FIELDS, hash=digest.hex()), separators=(',', ':')).encode()
+
+
+def post(port, body):
+    s = socket.socket()
+    s.settimeout(10)
+    s.connect(socket.getaddrinfo('127.0.0.1', port)[0][-1])
+    s.sendall((HEADERS % len(body)).encode('iso-8859-1'))
+    s.sendall(body)
+    reply = b''
+    while True:
+        part = s.recv(1024)
+        if not part:
+            break
+        reply += part
+    s.close()
+    return int(reply.split(b' ', 2)[1]), json.loads(reply.split(b'\r\n\r\n', 1)[1])
+
+
+def main():
+    digest = telemetry.image_hash(bytes(range(256)) * 100)
+    forms = (('telemetry record', record(digest)), ('JSON, concatenated', json_concat(digest)),
+             ('JSON, compact', json_compact(digest)))
+    print('%-20s %8s %10s %14s' % ('form', 'body', 'request', 'bytes/day'))
+    for name, body in forms:
+        request = len(HEADERS % len(body)) + len(body)
+        print('%-20s %8d %10d %14d' % (name, len(body), request, request * WAKES_PER_DAY))
+
+    print()
+    print('checks')
+    with tempfile.TemporaryDirectory() as tmp:
+        server = ref_server.serve(tmp)
+        port = server.server_address[1]
+        status, reply = post(port, record(digest))
+        with open(os.path.join(tmp, '50.telemetry.jsonl')) as f:
+            stored = json.loads(f.readline())
+        check('server accepts the record', status == 200 and reply['records'] == 1)
+        check('server decodes every field', stored['station'] == 50 and stored['time'] == FIELDS['time'] and
+              stored['vbat_mv'] == 6483 and stored['temp_c'] == 23.25 and stored['rsrp_dbm'] == -97 and
+              stored['attach_ms'] == 8230 and stored['camera_ms'] == 10310 and
+              stored['length'] == 30123 and stored['hash'] == digest.hex())
+        status, reply = post(port, record(None, wake=2, length=0, mode=1) * 3)
+        check('several records in one body', status == 200 and reply['records'] == 3)
+        status, reply = post(port, b'\x09' + record(None)[1:])
+        check('unknown version refused', status == 400)
+        server.shutdown()
+    check('record under a quarter of the concatenated JSON', len(forms[0][1]) * 4 < len(forms[1][1]))
+    check('long phases clamp instead of wrapping',
+          ref_server.decode_telemetry(record(None, phase_ms=[10 ** 7] * 7))[0]['attach_ms'] == 655350)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
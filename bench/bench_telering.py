@@ -0,0 +1,134 @@
+# bench_telering.py  Telemetry of every wake through the flash ring (lib/telering.py).
+#
+#   python bench/bench_telering.py
+#
+# Runs a month of wakes (hourly captures and the telemetry wakes) against the
+# reference server (host/ref_server.py), with stretches where the station
+# cannot connect.  Every wake appends its record to the ring; a connected wake
+# posts all pending records in one request, as main.py does.  Compares the
+# records the server holds and the HTTP requests made with one request per
+# connected wake carrying only its own record, and checks the order, an outage
+# longer than the ring and a ring file that was lost.
+
+import json
+import os
+import sys
+import tempfile
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import pycom
+import ref_server
+import state
+import telemetry
+import telering
+import usocket as socket
+from checks import check, done, failures
+
+WAKES_PER_DAY = 28          # 24 capture slots and 4 telemetry wakes
+DAYS = 30
+OUTAGES = ((3 * 28, 3 * 28 + 60), (12 * 28, 12 * 28 + 5), (20 * 28, 20 * 28 + 200))   # Wakes without a connection
+START = 1700000000
+HEADERS = ('POST /file/telemetry?id=50 HTTP/1.1\r\nContent-Type: application/octet-stream\r\n'
+           'Content-Length: %d\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n')
+
+
+def http_status(buf, n):
+    if n < 12 or buf[:5] != b'HTTP/':
+        return 0
+    return int(bytes(buf[9:12]))
+
+
+def upload(port, net):
+    # upload_telemetry() of main.py: every pending record in one POST
+    pending = telering.pending()
+    s = socket.socket()
+    s.settimeout(10)
+    s.connect(socket.getaddrinfo('127.0.0.1', port)[0][-1])
+    s.sendall((HEADERS % telering.size()).encode('iso-8859-1'))
+    sent = telering.upload(s.sendall, net)
+    status = http_status(net, s.readinto(net)) if sent == pending else 0
+    s.close()
+    if 200 <= status < 300:
+        telering.acknowledge(sent)
+    return status
+
+
+def offline(i):
+    return any(start <= i < end for start, end in OUTAGES)
+
+
+def wake(i, port, net, record):
+    # One wake: load the state, append this wake's record, upload if connected, commit
+    state.load()
+    telemetry.pack_into(record, 0, 50, START + i * 3600 * 24 // WAKES_PER_DAY, 6400 - i % 90, 80, -95,
+                        3, 1 + (i % 7 == 0), [1200, 8000, 2000, 100, 10000 * (i % 7 != 0), 3000, 0],
+                        30000 + i)
+    telering.append(record)
+    requests = 0
+    if not offline(i):
+        status = upload(port, net)
+        requests = 1
+        if status != 200:
+            failures.append('upload status %d' % status)
+    state.commit()
+    return requests
+
+
+def stored(directory):
+    try:
+        with open(os.path.join(directory, '50.telemetry.jsonl')) as f:
+            return [json.loads(line) for line in f]
+    except OSError:
+        return []
+
+
+def main():
+    net = bytearray(1024)                   # The pool's 'net' slot
+    record = bytearray(telemetry.RECORD_SIZE)
+    wakes = WAKES_PER_DAY * DAYS
+    with tempfile.TemporaryDirectory() as tmp:
+        telering.FILE = os.path.join(tmp, 'telemetry.bin')
+        state.FILE = os.path.join(tmp, 'state.bin')
+        pycom.nvs_erase_all()
+        server = ref_server.serve(os.path.join(tmp, 'server'))
+        port = server.server_address[1]
+
+        requests = sum(wake(i, port, net, record) for i in range(wakes))
+        records = stored(os.path.join(tmp, 'server'))
+        times = [r['time'] for r in records]
+        connected = sum(1 for i in range(wakes) if not offline(i))
+        lost = sum(max(0, end - start - telering.SLOTS + 1) for start, end in OUTAGES)
+
+        print('%-36s %10s %10s' % ('', 'per wake', 'ring'))
+        print('%-36s %10d %10d' % ('records on the server', connected, len(records)))
+        print('%-36s %10d %10d' % ('HTTP requests', connected, requests))
+        print('%-36s %10d %10d' % ('wakes missing from the time series', wakes - connected, wakes - len(records)))
+        print('%-36s %10s %10d' % ('ring file (bytes)', '-', os.path.getsize(telering.FILE)))
+        print('%-36s %10s %10d' % ('state record (bytes)', '-', state.size()))
+
+        print()
+        print('checks')
+        check('one request per connected wake', requests == connected)
+        check('only the overflow of the long outage is lost', len(records) == wakes - lost)
+        check('records arrive in wake order, once', times == sorted(set(times)))
+        check('nothing pending after the last wake', telering.pending() == 0)
+        check('ring file keeps its size', os.path.getsize(telering.FILE) == telering.SLOTS * telemetry.RECORD_SIZE)
+
+        # A lost ring file drops what it held instead of sending empty slots
+        state.load()
+        for i in range(3):
+            telering.append(record)
+        os.remove(telering.FILE)
+        telering.append(record)
+        check('lost ring file: only the new record is pending', telering.pending() == 1)
+        check('and the server takes it', upload(port, net) == 200 and telering.pending() == 0)
+        server.shutdown()
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
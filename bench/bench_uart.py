@@ -0,0 +1,112 @@
+# bench_uart.py  GPy picture receive path against the ESP32-CAM emulator.
+#
+#   python bench/bench_uart.py [--size BYTES] [--bauds 38400 115200 ...]
+#
+# Runs lib/picture.py handshake() and receive() on a pty served by
+# host/esp32cam_emu.py, first across baud rates and then with injected faults
+# (slow boot, dropped bytes, corrupted bytes, short and long stalls).  For each
+# run it reports the handshake time, the transfer time, the throughput as a
+# fraction of the line rate and whether the picture arrived intact, then checks
+# the outcome of each run.
+
+import os
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import picture
+from esp32cam_emu import CameraEmulator, synthetic_jpeg
+from pty_uart import PtyUART
+from checks import check, done
+
+BAUDS = (38400, 115200, 230400, 460800, 921600)
+FILENAME = '50_202109291305_648\0'
+
+
+def run_once(jpeg, baudrate, stall_ms=picture.STALL_MS, **faults):
+    cam = CameraEmulator([jpeg], baudrate, seed=1, **faults).start()
+    uart = PtyUART(cam.port, baudrate)
+    try:
+        t0 = time.monotonic()
+        cam.trigger()
+        time.sleep(0.01)            # camera_trigger pulse in main.py
+        hello_try, length = picture.handshake(uart, FILENAME)
+        t1 = time.monotonic()
+        if not length:
+            return hello_try, (t1 - t0) * 1000, 0, 0, 'no answer'
+        buf = bytearray(length)
+        n = picture.receive(uart, buf, length, stall_ms)
+        t2 = time.monotonic()
+        cam.done.wait(5)
+    finally:
+        uart.deinit()
+        cam.stop()
+
+    if n < length:
+        status = 'short %d' % n
+    elif buf == jpeg:
+        status = 'intact'
+    elif cam.sent and buf[:len(cam.sent[0])] == cam.sent[0]:
+        status = 'corrupt %d' % (cam.dropped + cam.corrupted)
+    else:
+        status = 'mismatch'
+    return hello_try, (t1 - t0) * 1000, (t2 - t1) * 1000, n, status
+
+
+def report(label, baudrate, result):
+    hello_try, handshake_ms, transfer_ms, n, status = result
+    rate = n / (transfer_ms / 1000) if transfer_ms else 0
+    line_rate = baudrate / 10
+    print('%-18s %7d %6d %10.0f %10.0f %10.0f %6.1f%%  %s' % (
+        label, baudrate, hello_try, handshake_ms, transfer_ms, rate, 100 * rate / line_rate, status))
+    return result + (rate / line_rate,)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='GPy receive path against the ESP32-CAM emulator')
+    parser.add_argument('--size', type=int, default=20000, help='picture size in bytes')
+    parser.add_argument('--bauds', type=int, nargs='+', default=list(BAUDS))
+    args = parser.parse_args()
+    jpeg = synthetic_jpeg(args.size)
+
+    print('%-18s %7s %6s %10s %10s %10s %7s  %s' % (
+        'scenario', 'baud', 'hellos', 'hs_ms', 'xfer_ms', 'B/s', 'line', 'status'))
+    clean = [report('clean', baudrate, run_once(jpeg, baudrate, boot_delay=0.2)) for baudrate in args.bauds]
+
+    baudrate = 115200
+    scenarios = (
+        ('slow boot 3 s', {'boot_delay': 3.0}),
+        ('drop 1e-4', {'boot_delay': 0.2, 'drop_rate': 1e-4}),
+        ('corrupt 1e-4', {'boot_delay': 0.2, 'corrupt_rate': 1e-4}),
+        ('stall 1 s', {'boot_delay': 0.2, 'stall_at': 0.5, 'stall_s': 1.0}),
+        ('stall > timeout', {'boot_delay': 0.2, 'stall_at': 0.5, 'stall_s': 1.0, 'stall_ms': 500}),
+    )
+    results = {}
+    for label, faults in scenarios:
+        results[label] = report(label, baudrate, run_once(jpeg, baudrate, **faults))
+
+    # A dropped byte leaves the transfer one short: receive() waits out STALL_MS, no longer
+    line_ms = args.size * 10 * 1000 / baudrate
+    print()
+    print('checks')
+    check('clean: intact at every baud rate', all(r[4] == 'intact' for r in clean))
+    check('clean: over 90% of the line rate', all(r[5] > 0.9 for r in clean))
+    check('clean: handshake under 1 s', all(r[1] < 1000 for r in clean))
+    check('slow boot: intact, within HELLO_TRIES', results['slow boot 3 s'][4] == 'intact' and
+          results['slow boot 3 s'][0] < picture.HELLO_TRIES)
+    drop = results['drop 1e-4']
+    check('dropped byte: short, given up after STALL_MS', drop[4].startswith('short') and
+          drop[2] < line_ms + picture.STALL_MS + 1000)
+    check('corrupted byte: full length', results['corrupt 1e-4'][3] == args.size)
+    check('stall under STALL_MS: intact', results['stall 1 s'][4] == 'intact')
+    stall = results['stall > timeout']
+    check('stall over stall_ms: short, given up in time', stall[4].startswith('short') and
+          stall[2] < line_ms + 500 + 1000)
+    done()
+
+if __name__ == '__main__':
+    main()
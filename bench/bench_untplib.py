@@ -0,0 +1,186 @@
+# bench_untplib.py  untplib packet codec against the original float-era class.
+#
+# CPython:    python bench/bench_untplib.py
+# unix port:  micropython bench/bench_untplib.py
+#
+# Times and counts the heap allocation of NTPPacket.to_data(), from_data() and
+# the NTPStats offset/delay for
+#   legacy  the original class: a 15-field struct.pack/unpack, a slice of the
+#           input, _to_int/_to_frac/_to_time per timestamp, a new bytes per packet
+#   codec   lib/untplib.py: one 48-byte buffer, pack_into/unpack_from and each
+#           timestamp as a (seconds, fraction) pair of 32-bit ints, with
+#           offset/delay in integer milliseconds
+# Allocation is measured as in bench_ds3231.py: exact under MicroPython, where
+# from_data() makes only the unpack_from tuple and offset/delay nothing (on a
+# 64-bit port); the tracemalloc peak under CPython, where every int above 256
+# is a heap object, so the millisecond results cost more there than the
+# legacy whole seconds.
+
+import sys
+
+_MPY = sys.implementation.name == 'micropython'
+_HERE = __file__.rpartition('/')[0] or '.'
+sys.path.insert(0, _HERE)
+sys.path.insert(0, _HERE + '/../lib')
+sys.path.append(_HERE + '/../host')
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+import untplib
+from bench_ds3231 import per_call
+from bench_lib import timeit
+from checks import check, done
+
+TX = 3841862400                 # 2021-09-29 in NTP seconds
+
+
+# The original untplib classes, trimmed to what the benchmark calls
+class LegacyPacket:
+    _PACKET_FORMAT = "!BBBbIIIIIIIIIII"
+
+    def __init__(self, version=2, mode=3, tx_timestamp=0):
+        self.leap = 0
+        self.version = version
+        self.mode = mode
+        self.stratum = 0
+        self.poll = 0
+        self.precision = 0
+        self.root_delay = 0
+        self.root_dispersion = 0
+        self.ref_id = 0
+        self.ref_timestamp = 0
+        self.orig_timestamp = 0
+        self.recv_timestamp = 0
+        self.tx_timestamp = tx_timestamp
+
+    def to_data(self):
+        return struct.pack(LegacyPacket._PACKET_FORMAT,
+            (self.leap << 6 | self.version << 3 | self.mode),
+            self.stratum,
+            self.poll,
+            self.precision,
+            _to_int(self.root_delay) << 16 | _to_frac(self.root_delay, 16),
+            _to_int(self.root_dispersion) << 16 |
+            _to_frac(self.root_dispersion, 16),
+            self.ref_id,
+            _to_int(self.ref_timestamp),
+            _to_frac(self.ref_timestamp),
+            _to_int(self.orig_timestamp),
+            _to_frac(self.orig_timestamp),
+            _to_int(self.recv_timestamp),
+            _to_frac(self.recv_timestamp),
+            _to_int(self.tx_timestamp),
+            _to_frac(self.tx_timestamp))
+
+    def from_data(self, data):
+        unpacked = struct.unpack(LegacyPacket._PACKET_FORMAT,
+                data[0:struct.calcsize(LegacyPacket._PACKET_FORMAT)])
+        self.leap = unpacked[0] >> 6 & 0x3
+        self.version = unpacked[0] >> 3 & 0x7
+        self.mode = unpacked[0] & 0x7
+        self.stratum = unpacked[1]
+        self.poll = unpacked[2]
+        self.precision = unpacked[3]
+        self.root_delay = (unpacked[4])//2**16
+        self.root_dispersion = (unpacked[5])//2**16
+        self.ref_id = unpacked[6]
+        self.ref_timestamp = _to_time(unpacked[7], unpacked[8])
+        self.orig_timestamp = _to_time(unpacked[9], unpacked[10])
+        self.recv_timestamp = _to_time(unpacked[11], unpacked[12])
+        self.tx_timestamp = _to_time(unpacked[13], unpacked[14])
+
+
+class LegacyStats(LegacyPacket):
+    def __init__(self):
+        LegacyPacket.__init__(self)
+        self.dest_timestamp = 0
+
+    @property
+    def offset(self):
+        return ((self.recv_timestamp - self.orig_timestamp) +
+                (self.tx_timestamp - self.dest_timestamp))//2
+
+    @property
+    def delay(self):
+        return ((self.dest_timestamp - self.orig_timestamp) -
+                (self.tx_timestamp - self.recv_timestamp))
+
+
+def _to_int(timestamp):
+    return timestamp
+
+
+def _to_frac(timestamp, n=32):
+    return 0
+
+
+def _to_time(integ, frac, n=32):
+    return integ
+
+
+def reply(tx):
+    # A server reply with all four timestamps set
+    p = untplib.NTPPacket(version=3, mode=4, tx_timestamp=tx << 32 | 0x40000000)
+    p.stratum = 2
+    p.ref_timestamp = (tx - 60) << 32
+    p.orig_timestamp = (tx - 1) << 32 | 0x80000000
+    p.recv_timestamp = tx << 32 | 0x20000000
+    return bytes(p.to_data())
+
+
+def run():
+    data = reply(TX)
+    results = []
+
+    old = LegacyPacket(version=3, mode=3, tx_timestamp=TX)
+    old_stats = LegacyStats()
+    old_stats.from_data(data)
+    old_stats.dest_timestamp = TX + 1
+    new = untplib.NTPPacket(version=3, mode=3, tx_timestamp=TX << 32)
+    new_stats = untplib.NTPStats()
+    new_stats.from_data(data)
+    new_stats.dest_timestamp = (TX + 1) << 32
+
+    def old_offset_delay():
+        return old_stats.offset, old_stats.delay
+
+    def new_offset_delay():
+        return new_stats.offset, new_stats.delay
+
+    for name, old_fn, new_fn in (('to_data', old.to_data, new.to_data),
+                                 ('from_data', lambda: old_stats.from_data(data),
+                                  lambda: new_stats.from_data(data)),
+                                 ('offset + delay', old_offset_delay, new_offset_delay)):
+        results.append((name, timeit(old_fn), per_call(old_fn), timeit(new_fn), per_call(new_fn)))
+    return results, old_stats, new_stats
+
+
+def main():
+    results, old_stats, new_stats = run()
+    print('%-16s %12s %12s %12s %12s' % ('', 'legacy us', 'legacy B', 'codec us', 'codec B'))
+    for name, old_us, old_b, new_us, new_b in results:
+        print('%-16s %12.2f %12d %12.2f %12d' % (name, old_us, old_b, new_us, new_b))
+    print()
+    print('offset: legacy %d s, codec %d ms' % (old_stats.offset, new_stats.offset))
+    print('delay:  legacy %d s, codec %d ms' % (old_stats.delay, new_stats.delay))
+
+    # reply(): orig = TX - 0.5 s, recv = TX + 0.125 s, xmt = TX + 0.25 s; dest = TX + 1 s
+    timing = dict((name, (old_us, old_b, new_us, new_b)) for name, old_us, old_b, new_us, new_b in results)
+    print()
+    print('checks')
+    check('offset within 1 ms of -62.5 ms', -64 <= new_stats.offset <= -62)
+    check('delay within 1 ms of 1375 ms', 1374 <= new_stats.delay <= 1375)
+    check('to_data: faster than legacy, no allocation',
+          timing['to_data'][2] < timing['to_data'][0] and timing['to_data'][3] == 0)
+    check('from_data: faster than legacy, no more heap',
+          timing['from_data'][2] < timing['from_data'][0] and timing['from_data'][3] <= timing['from_data'][1])
+    if _MPY:
+        check('offset + delay: no allocation', timing['offset + delay'][3] == 0)
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# bench_upload.py  Idempotent picture uploads (lib/upload.py) against a faulty server.
+#
+#   python bench/bench_upload.py
+#
+# Posts a picture to the reference server (host/ref_server.py) the way
+# process_picture() does, with the server losing replies, answering 503 or
+# refusing, or the reply timing out, and compares the bytes sent and the
+# outcome of three clients: one
+# post without looking at the reply (the old process_picture()), resending the
+# whole picture until a reply comes, and upload.deliver() with the idempotency
+# key and the existence check.  The backoff is scaled down so the bench runs
+# in seconds.
+
+import os
+import sys
+import tempfile
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import base64
+import picture
+import ref_server
+import telemetry
+import transport
+import upload
+import utime
+from checks import check, done
+
+HOST = '127.0.0.1'
+STATION = '50'
+
+
+class Counting:
+    # A socket that counts what goes out; the reply to the next lost[0] pictures comes too late
+    def __init__(self, s, counter, lost):
+        self._s = s
+        self._counter = counter
+        self._lost = lost
+        self._sent = 0
+
+    def sendall(self, data):
+        self._counter[0] += len(data)
+        self._sent += len(data)
+        self._s.sendall(data)
+
+    def readinto(self, buf):
+        n = self._s.readinto(buf)
+        if self._lost[0] and self._sent > 1024:
+            self._lost[0] -= 1
+            raise OSError(110)      # ETIMEDOUT
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._s, name)
+
+
+def counting_sockets(counter, lost):
+    open_socket = transport.sockets()
+
+    def open_counting(host, port, timeout=30):
+        return Counting(open_socket(host, port, timeout), counter, lost)
+    return open_counting
+
+
+class Station:
+    # One picture of one wake, ready to post
+    def __init__(self, port, capture_seconds, jpeg):
+        self.port = port
+        self.time_stamp = '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}'.format(*utime.gmtime(capture_seconds)[:6])
+        self.key = upload.key(STATION, capture_seconds, telemetry.image_hash(jpeg))
+        self.b64 = bytearray(base64.encoded_length(len(jpeg)))
+        self.b64_len = base64.b64encode_into(jpeg, self.b64)
+        self.reply = bytearray(1024)
+        self.counter = [0]
+        self.lost = [0]
+        self.open_socket = counting_sockets(self.counter, self.lost)
+
+    def send(self, s, key=True, prefix=None):
+        s.settimeout(10)
+        prefix_bytes, suffix = picture.json_parts('648', STATION, self.time_stamp)
+        return picture.post(s, HOST, self.port, prefix or prefix_bytes, memoryview(self.b64)[:self.b64_len],
+                            suffix, self.reply, self.key if key else None, 10)[:2]
+
+    def once(self):
+        # The old process_picture(): post, never look at the reply
+        s = self.open_socket(HOST, self.port)
+        self.send(s, key=False)
+        s.close()
+        return 'unknown', 1
+
+    def resend(self, tries=upload.TRIES):
+        # Resend the whole picture until a reply comes
+        for attempt in range(1, tries + 1):
+            s = self.open_socket(HOST, self.port)
+            sent, n = self.send(s, key=False)
+            s.close()
+            code = upload.status(self.reply, n)
+            if code:
+                return code, attempt
+        return 0, tries
+
+    def deliver(self, deadline_ms=60000, prefix=None):
+        result, code, tries, sent, n = upload.deliver(self.open_socket, HOST, self.port, self.key,
+                                                      lambda s: self.send(s, prefix=prefix), self.reply,
+                                                      utime.ticks_add(utime.ticks_ms(), deadline_ms))
+        self.sent = sent
+        self.reply_len = n
+        return ('sent', 'exists', 'refused', 'failed')[result], tries
+
+
+def stored(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.jpg'))
+
+
+def main():
+    upload.BACKOFF_MS = 20
+    upload.BACKOFF_MAX_MS = 200
+    jpeg = bytes((i * 7919 + i // 13) & 0xff for i in range(30000))
+    scenarios = (('clean', {}), ('reply lost once', {'drop': 1}), ('503 twice', {'unavailable': 2}))
+    print('%-18s %-14s %10s %8s %12s %8s' % ('server', 'client', 'bytes', 'tries', 'outcome', 'stored'))
+    outcomes = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, (scenario, faults) in enumerate(scenarios):
+            for client in ('once', 'resend', 'deliver'):
+                directory = os.path.join(tmp, '%d_%s' % (n, client))
+                server = ref_server.serve(directory)
+                server.faults.update(faults)
+                station = Station(server.server_address[1], 1632920700 + n * 3600, jpeg)
+                outcome, tries = getattr(station, client)()
+                copies = len(stored(directory))
+                outcomes[(scenario, client)] = (station.counter[0], tries, outcome, copies)
+                print('%-18s %-14s %10d %8d %12s %8d' % (scenario, client, station.counter[0], tries, outcome, copies))
+                server.shutdown()
+
+        print()
+        print('checks')
+        clean = outcomes[('clean', 'deliver')]
+        check('clean: one existence check, one attempt', clean[1] == 1 and clean[2] == 'sent' and
+              0 < clean[0] - outcomes[('clean', 'once')][0] - len('Idempotency-Key: \r\n') - len(station.key) < 200)
+        lost = outcomes[('reply lost once', 'deliver')]
+        resent = outcomes[('reply lost once', 'resend')]
+        check('lost reply: found stored, not sent again', lost[2] == 'exists' and lost[0] < clean[0] + 200)
+        check('lost reply: resending costs the picture twice', resent[0] >= 2 * outcomes[('clean', 'once')][0])
+        busy = outcomes[('503 twice', 'deliver')]
+        check('503 twice: sent on the third attempt', busy[2] == 'sent' and busy[1] == 3 and busy[3] == 1)
+
+        directory = os.path.join(tmp, 'faults')
+        server = ref_server.serve(directory)
+        port = server.server_address[1]
+        station = Station(port, 1632930000, jpeg)
+        server.faults['unavailable'] = 100
+        start = utime.ticks_ms()
+        outcome, tries = station.deliver(deadline_ms=150)
+        elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        check('always 503: gives up within the deadline', outcome == 'failed' and tries < upload.TRIES and
+              elapsed < 150 + 100)
+        server.faults['unavailable'] = 0
+        outcome, tries = station.deliver(prefix=b'{"voltage": 648 "base64File": "')   # Not JSON: the server refuses it
+        check('refused (400): one attempt', outcome == 'refused' and tries == 1)
+        check('reply length returned', upload.status(station.reply, station.reply_len) == 400)
+        check('then sent', station.deliver() == ('sent', 1))
+        check('same key again: found stored, not sent', station.deliver() == ('exists', 0) and
+              station.sent == 0 and len(stored(directory)) == 1)
+
+        station = Station(port, 1632933600, jpeg)
+        station.lost[0] = 1
+        outcome, tries = station.deliver()
+        check('reply timed out: the bytes count, found stored', outcome == 'exists' and tries == 1 and
+              station.sent > len(station.b64) and len(stored(directory)) == 2)
+        server.shutdown()
+
+        server = ref_server.serve(directory)
+        code = upload.exists(transport.sockets(), HOST, server.server_address[1], station.key, station.reply)
+        check('keys kept across a server restart', code == 200)
+        code = upload.exists(transport.sockets(), HOST, server.server_address[1], station.key + '0', station.reply)
+        check('unknown key: 404', code == 404)
+        server.shutdown()
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
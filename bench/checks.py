@@ -0,0 +1,24 @@
+# checks.py  Pass/fail checks shared by the benches.
+#
+#   from checks import check, done
+#   check('picture arrives whole', received == length)
+#   done()          # Exits with status 1 if any check failed
+#
+# Runs under CPython and the unix MicroPython port.
+
+import sys
+
+failures = []
+
+
+def check(label, ok):
+    if not ok:
+        failures.append(label)
+    print('  %-52s %s' % (label, 'ok' if ok else 'FAIL'))
+    return ok
+
+
+def done():
+    if failures:
+        print('%d check(s) failed' % len(failures))
+        sys.exit(1)
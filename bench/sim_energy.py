@@ -0,0 +1,125 @@
+# sim_energy.py  Charge per wake and battery life of station configurations.
+#
+#   python bench/sim_energy.py
+#
+# Models the duration of every wake phase from a configuration (LTE attach time,
+# camera UART baud rate, picture size, uplink throughput, NTP syncs, wakes per
+# day) and runs it through lib/energy.py - the same current table and the same
+# finish() the GPy uses - to print the charge per phase, per wake and per day
+# and the battery life on governor.CAPACITY_MAH.  Edit CONFIGS to compare others.
+
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import energy
+import governor
+import state
+from checks import check, done
+
+BASE = {
+    'captures': 4,          # Capture wakes per day
+    'telemetry': 0,         # Telemetry-only wakes per day
+    'boot_s': 1.2,          # Firmware boot and imports
+    'attach_s': 8.0,
+    'connect_s': 2.0,
+    'ntp_per_day': 1 / 30,  # NTP syncs per day (drift model: about monthly)
+    'ntp_s': 0.8,
+    'camera_boot_s': 2.5,   # Camera reset to 'ready', including the 1 s wait
+    'baud': 38400,
+    'picture': 30000,       # JPEG bytes
+    'uplink': 30000,        # Bytes per second over LTE-M
+    'http_s': 1.5,          # DNS, TCP connect and the server reply
+    'log_bytes': 4096,
+    'shutdown_s': 0.3,
+}
+
+CONFIGS = (
+    ('baseline: 4 captures/day, 38400 baud', {}),
+    ('115200 baud camera UART', {'baud': 115200}),
+    ('reduced frame (12 kB)', {'picture': 12000}),
+    ('+ 4 telemetry wakes/day', {'telemetry': 4}),
+    ('NTP on every wake', {'ntp_per_day': 4}),
+    ('slow attach (25 s)', {'attach_s': 25.0}),
+    ('idle meter: 1 capture/day', {'captures': 1}),
+)
+
+
+def wake(c, capture, sleep_min):
+    # One wake through lib/energy.py; returns (charge uAh, [(phase, ms, uAh)])
+    energy.reset()
+    wakes = c['captures'] + c['telemetry']
+    energy.record(energy.BOOT, int(c['boot_s'] * 1000))
+    energy.record(energy.ATTACH, int(c['attach_s'] * 1000))
+    energy.record(energy.CONNECT, int(c['connect_s'] * 1000))
+    net_s = c['ntp_s'] * c['ntp_per_day'] / wakes
+    upload = c['log_bytes']
+    if capture:
+        uart_s = c['picture'] * 10 / c['baud']
+        energy.record(energy.CAMERA, int((c['camera_boot_s'] + uart_s) * 1000))
+        upload += c['picture'] * 4 // 3                     # Base64
+        net_s += c['picture'] / 400000                      # Base64 encoding on the GPy
+    energy.record(energy.NET, int(net_s * 1000))
+    energy.record(energy.UPLOAD, int((c['http_s'] + upload / c['uplink']) * 1000))
+    energy.record(energy.SHUTDOWN, int(c['shutdown_s'] * 1000))
+    total = energy.finish(sleep_min)
+    return total, list(energy.phases())
+
+
+def day(c):
+    # Charge of one day (uAh) and the per-phase split of a capture wake
+    wakes = c['captures'] + c['telemetry']
+    sleep_min = 1440 // wakes
+    capture_uah, phases = wake(c, True, sleep_min)
+    total = capture_uah * c['captures']
+    if c['telemetry']:
+        total += wake(c, False, sleep_min)[0] * c['telemetry']
+    return total, capture_uah, phases
+
+
+def main():
+    print('%-40s %10s %10s %8s' % ('configuration', 'uAh/wake', 'mAh/day', 'days'))
+    results = {}
+    for name, changes in CONFIGS:
+        c = dict(BASE, **changes)
+        per_day, per_wake, phases = day(c)
+        results[name] = per_day
+        print('%-40s %10d %10.1f %8.0f' % (name, per_wake, per_day / 1000,
+                                            governor.CAPACITY_MAH * 1000 / per_day))
+
+    print()
+    print('baseline capture wake by phase')
+    total, phases = wake(dict(BASE), True, 360)
+    for p, ms, uah in phases:
+        print('  %-10s %8d ms %8d uAh %5.1f%%' % (energy.NAMES[p], ms, uah, 100 * uah / total))
+    sleep_uah = total - sum(uah for _, _, uah in phases)
+    print('  %-10s %8d min %7d uAh %5.1f%%' % ('sleep', 360, sleep_uah, 100 * sleep_uah / total))
+
+    print()
+    print('checks')
+    before = state.get('en_tot')
+    again, _ = wake(dict(BASE), True, 360)
+    check('finish() = sum of the phases + the sleep', total == sum(u for _, _, u in phases) + sleep_uah)
+    check('same configuration, same charge', again == total)
+    check('running total kept in the wake state', state.get('en_tot') - before == again and state.get('en_last') == again)
+    baseline = results[CONFIGS[0][0]]
+    check('115200 baud costs less than 38400', results['115200 baud camera UART'] < baseline)
+    check('telemetry wakes cost more per day', results['+ 4 telemetry wakes/day'] > baseline)
+
+    # 15 s of WiFi that never associates, then the LTE attach
+    energy.reset()
+    energy.wifi(True)
+    energy.record(energy.ATTACH, 15000)
+    energy.wifi(False)
+    energy.record(energy.ATTACH, 8000)
+    check('failed WiFi attempt charged at the WiFi currents', energy.charge_uah(energy.ATTACH) ==
+          (energy.PHASE_UA_WIFI[energy.ATTACH] * 15000 + energy.PHASE_UA[energy.ATTACH] * 8000) // 3600000)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+# sim_schedule.py  A year of DS3231 wakes driven by lib/schedule.py.
+#
+#   python bench/sim_schedule.py
+#
+# First checks Schedule.next() against a minute-by-minute scan of the cron fields
+# for every minute of the day, several guards and offsets.  Then runs a year
+# (2024, a leap year) of virtual time on host/ds3231_emu.py: at every wake the
+# GPy side reads the wake reason and programs both alarms as main.py does, the
+# emulator skips to shortly before the wake the scan expects and ticks until INT
+# goes low.  Every wake must come at the expected minute with the expected
+# reason, and every day must have the expected number of wakes of each kind.
+# Then checks main.py's hourly slots never take Alarm 2 on a capture minute and
+# that a stretched wake leaves no telemetry wake behind.
+#
+# Last, a year of adaptive captures (lib/cadence.py) on main.py's hourly slots,
+# with the telemetry wakes in between, against a meter that is busy mornings and
+# evenings, idle at night and for two weeks of holiday, compared with the fixed
+# six-hour schedule: captures made and how long a change of the meter waits for
+# a picture.  Then a month each at the low and critical battery floors.
+
+import calendar
+import os
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import random
+
+import cadence
+import pycom
+import schedule
+import state
+from ds3231 import DS3231, HOUR, MINUTE
+from ds3231_emu import DS3231Emulator
+from fake_i2c import I2C
+from checks import check, done
+
+CAPTURE = '5 1/6'
+TELEMETRY = '5 4/6'
+OFFSET = 50 % 30            # main.py: station id modulo 30
+AWAKE_S = 150               # How long a wake keeps the GPy up before it sleeps
+YEAR = 2024
+
+
+def slots(spec, offset):
+    # Minutes of the day of a cron-style 'minute hour' spec, by brute force
+    def field(text, size):
+        values = set()
+        for part in text.split(','):
+            step, stepped = 1, '/' in part
+            if stepped:
+                part, step = part.split('/')
+                step = int(step)
+            if part == '*':
+                first, last = 0, size - 1
+            elif '-' in part:
+                first, last = map(int, part.split('-'))
+            else:
+                first = int(part)
+                last = size - 1 if stepped else first
+            values.update(range(first, last + 1, step))
+        return values
+    minutes, hours = spec.split()
+    return {(h * 60 + m + offset) % 1440 for h in field(hours, 24) for m in field(minutes, 60)}
+
+
+def scan_next(allowed, now, guard):
+    wait = guard + 1
+    while (now + wait) % 1440 not in allowed:
+        wait += 1
+    return (now + wait) % 1440, wait
+
+
+def check_next():
+    specs = (CAPTURE, TELEMETRY, '*/15 *', '0,30 8-17', '59 23', '0 0', '7-9,40/7 2-4,20/2', '* *')
+    mismatches = 0
+    for spec in specs:
+        for offset in (0, 20, 1439, -7):
+            s = schedule.Schedule(spec, offset)
+            allowed = slots(spec, offset % 1440)
+            for guard in (0, 10, 200):
+                for now in range(1440):
+                    if s.next(now, guard) != scan_next(allowed, now, guard):
+                        mismatches += 1
+    check('next() matches a minute scan (%d specs)' % len(specs), mismatches == 0)
+
+    bad = 0
+    for spec in ('5', '5 24', '60 1', '5-3 1', '*/0 *', 'x 1', '1 2 3'):
+        try:
+            schedule.Schedule(spec)
+        except ValueError:
+            bad += 1
+    check('malformed specs raise ValueError', bad == 7)
+
+    # Constant time: a dense and a sparse schedule cost the same per call
+    costs = []
+    for spec in ('* *', '59 23'):
+        s = schedule.Schedule(spec)
+        start = time.perf_counter()
+        for now in range(1440):
+            s.next(now, 10)
+        costs.append((time.perf_counter() - start) / 1440 * 1e6)
+    print('  next(): %.2f us dense, %.2f us sparse' % tuple(costs))
+    check('next() cost independent of the schedule', max(costs) < 2 * min(costs))
+
+
+def run_year():
+    capture = schedule.Schedule(CAPTURE, OFFSET)
+    telemetry = schedule.Schedule(TELEMETRY, OFFSET)
+    capture_slots = slots(CAPTURE, OFFSET)
+    telemetry_slots = slots(TELEMETRY, OFFSET)
+
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    emu = i2c.attach(0x68, DS3231Emulator((YEAR, 1, 1, 0, 0, 0)))
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+    end = calendar.timegm((YEAR + 1, 1, 1, 0, 0, 0))
+
+    wakes = {schedule.CAPTURE: 0, schedule.TELEMETRY: 0}
+    per_day = {}
+    late = wrong_reason = wrong_alarm = 0
+    reason = 0
+    while True:
+        # GPy boot: read the wake reason and program the alarms (main.set_next_alarm)
+        emu.advance(AWAKE_S if reason else 1)
+        rtc.load()
+        reason = schedule.wake_reason(rtc)
+        rtc.datetime_into(t)
+        capture_wake, telemetry_wake = schedule.program(rtc, t, capture, telemetry)
+        rtc.commit()
+
+        now = t[HOUR] * 60 + t[MINUTE]
+        first = scan_next(capture_slots, now, schedule.GUARD_MIN)
+        second = scan_next(telemetry_slots, now, schedule.GUARD_MIN)
+        if capture_wake != first[0] or telemetry_wake != second[0]:
+            wrong_alarm += 1
+        expected, wait = min(first, second, key=lambda w: w[1])
+
+        # Sleep: skip to a minute before the expected wake, then tick until INT goes low
+        target = emu.seconds() - emu.seconds() % 60 + wait * 60
+        if target >= end:
+            break
+        emu.set_time(time.gmtime(target - 60)[:6])
+        if emu.advance_to_interrupt(limit=120) is None or emu.seconds() != target:
+            late += 1
+            emu.set_time(time.gmtime(target)[:6])
+            continue
+
+        rtc.load()
+        reason = schedule.wake_reason(rtc)
+        want = schedule.CAPTURE if expected in capture_slots else schedule.TELEMETRY
+        if reason != want:
+            wrong_reason += 1
+        wakes[reason] = wakes.get(reason, 0) + 1
+        day = time.gmtime(target)[7]
+        per_day.setdefault(day, [0, 0])[reason == schedule.TELEMETRY] += 1
+
+    print('  %d capture and %d telemetry wakes over %d days' %
+          (wakes[schedule.CAPTURE], wakes[schedule.TELEMETRY], len(per_day)))
+    check('alarms programmed at the scanned minutes', wrong_alarm == 0)
+    check('every wake at the expected second', late == 0)
+    check('every wake reports the expected alarm', wrong_reason == 0)
+    check('every day of the year has wakes', len(per_day) == 366)
+    check('every full day: 4 capture + 4 telemetry wakes',
+          all(v == [4, 4] for d, v in per_day.items() if d != 1))
+
+
+def main_alarms():
+    # main.py's hourly captures with the telemetry wakes: a telemetry slot that is also
+    #   a capture slot takes no alarm of its own
+    capture = schedule.Schedule('5 *', OFFSET)
+    telemetry = schedule.Schedule(TELEMETRY, OFFSET)
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    emu = i2c.attach(0x68, DS3231Emulator((YEAR, 1, 1, 0, 0, 0)))
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+    same = folded = 0
+    for now in range(1440):
+        t[HOUR], t[MINUTE] = divmod(now, 60)
+        rtc.load()
+        wake, second = schedule.program(rtc, t, capture, telemetry)
+        same += wake == second or (second >= 0) != rtc.interrupt_enabled(alarm=1)
+        folded += second < 0
+        rtc.commit()
+    check('main.py slots: no telemetry alarm on a capture minute', same == 0 and folded > 0)
+
+    # A stretched wake drops the telemetry alarm; the old Alarm 2 match must not pass
+    #   for a telemetry wake when the GPy next wakes for another reason
+    emu.set_time((YEAR, 1, 1, 0, 0, 0))
+    rtc.load()
+    rtc.datetime_into(t)
+    schedule.program(rtc, t, schedule.Schedule(CAPTURE, OFFSET), telemetry)
+    rtc.commit()
+    rtc.load()
+    rtc.datetime_into(t)
+    schedule.program(rtc, t, schedule.Schedule(CAPTURE, OFFSET), None, interval=600)
+    rtc.commit()
+    emu.advance(5 * 3600)                   # Past the old telemetry minute, before the capture
+    rtc.load()
+    check('stretched: a stale Alarm 2 match is no telemetry wake',
+          rtc.alarm(alarm=1) and schedule.wake_reason(rtc) == 0)
+
+
+def used(minute):
+    # Water use in this minute of the year: 06-09 and 17-22 on most days, none on holiday
+    day, hour = minute // 1440, minute // 60 % 24
+    if 200 <= day < 214:
+        return False
+    return (6 <= hour < 9 or 17 <= hour < 22) and (minute * 2654435761) % 7 < 3
+
+
+def alarm_seconds(now, minute):
+    # The first time at or after 'now' (s) whose minute of the day is 'minute', past 'now'
+    target = now - now % 86400 + minute * 60
+    return target + 86400 if target <= now else target
+
+
+def adaptive(days, battery):
+    # 'days' of capture (Alarm 1) and telemetry (Alarm 2) wakes as main.py programs them,
+    #   with the picture size following the meter and battery(rng) the voltage
+    pycom.nvs_erase_all()
+    state.load()
+    grid = schedule.Schedule('5 *', OFFSET)
+    telemetry = schedule.Schedule(TELEMETRY, OFFSET)
+    i2c = I2C(0, I2C.MASTER, baudrate=100000)
+    emu = i2c.attach(0x68, DS3231Emulator((YEAR, 1, 1, 0, 0, 0)))
+    rtc = DS3231(i2c)
+    t = rtc.new_datetime()
+    start = calendar.timegm((YEAR, 1, 1, 0, 0, 0))
+    end = start + days * 86400
+    rng = random.Random(1)
+
+    run = {'captures': 0, 'telemetry': 0, 'short': 0, 'long': 0, 'waits': [],
+           'decisions': [0, 0, 0, 0], 'per_day': {}}
+    size = 24000
+    pending = []                # Minutes of changes not pictured yet
+    minute = 0
+    previous = None             # Time and interval of the last capture
+    reason = schedule.CAPTURE
+    while True:
+        now = int(emu.seconds())
+        if reason == schedule.CAPTURE:
+            # The picture size moves a few percent when the dial turned
+            while minute < (now - start) // 60:
+                if used(minute):
+                    pending.append(minute)
+                minute += 1
+            changed = bool(pending)
+            run['waits'].extend(minute - m for m in pending)
+            pending = []
+            size += int(size * rng.uniform(0.03, 0.06)) * rng.choice((-1, 1)) if changed else rng.randint(-60, 60)
+            decision, interval, _ = cadence.update(size, battery(rng), now // 60)
+            run['decisions'][decision] += 1
+            if previous is not None:
+                spacing = (now - previous[0]) // 60
+                run['short'] += spacing < min(previous[1], 1440 - grid.gap)
+                run['long'] += spacing > 1440
+            previous = now, interval
+            run['captures'] += 1
+            day = (now - start) // 86400
+            run['per_day'][day] = run['per_day'].get(day, 0) + 1
+        else:
+            run['telemetry'] += 1
+
+        # Every wake re-arms both alarms (main.set_next_alarm)
+        rtc.load()
+        rtc.datetime_into(t)
+        wakes = schedule.program(rtc, t, grid, telemetry, interval=cadence.interval(),
+                                 since=cadence.elapsed(now // 60))
+        rtc.commit()
+        target = min(alarm_seconds(now, w) for w in wakes if w >= 0)
+        if target >= end:
+            break
+        emu.set_time(time.gmtime(target - 60)[:6])
+        emu.advance_to_interrupt(limit=120)
+        rtc.load()
+        reason = schedule.wake_reason(rtc)
+        emu.advance(AWAKE_S)
+    return run
+
+
+def adaptive_year():
+    run = adaptive(366, lambda rng: 6500 if rng.random() < 0.97 else 6150)
+    captures, waits, per_day = run['captures'], run['waits'], run['per_day']
+    fixed = 4 * 366
+    fixed_wait = sum(360 - (m - 65 - OFFSET) % 360 for m in range(366 * 1440) if used(m))
+    changes = sum(1 for m in range(366 * 1440) if used(m))
+    holiday = max(per_day.get(d, 0) for d in range(203, 214))
+    busy = sum(per_day.get(d, 0) for d in range(366) if not 200 <= d < 216) / 350
+    print('  %d adaptive captures (fixed six hours: %d, %+d%%), %d telemetry wakes' %
+          (captures, fixed, 100 * captures // fixed - 100, run['telemetry']))
+    print('  %.1f captures per normal day, at most %d per holiday day' % (busy, holiday))
+    print('  decisions: %d slower, %d faster, %d battery' % tuple(run['decisions'][1:]))
+    print('  a change waits %.0f min for a picture (fixed: %.0f min)' %
+          (sum(waits) / len(waits), fixed_wait / changes))
+    check('no capture earlier than the interval allows', run['short'] == 0)
+    check('no capture more than a day apart', run['long'] == 0)
+    check('backs off to one capture a day when idle', holiday == 1)
+    check('captures more often than four a day when busy', busy > 4)
+    check('telemetry wakes in between', run['telemetry'] > 366)
+
+    # Battery floors: the telemetry wakes must not push the capture back past the
+    #   first hourly slot after the floor
+    low = adaptive(30, lambda rng: 6150)
+    check('low battery: a capture every 12-13 h', low['captures'] >= 30 * 1440 // (cadence.LOW_BATTERY_MIN + 60))
+    critical = adaptive(30, lambda rng: 5900)
+    check('critical battery: a capture a day', critical['long'] == 0 and critical['captures'] >= 30)
+
+
+def main():
+    print('Schedule.next()')
+    check_next()
+    print()
+    print('year %d, capture %r, telemetry %r, offset %d min' % (YEAR, CAPTURE, TELEMETRY, OFFSET))
+    start = time.monotonic()
+    run_year()
+    print('  simulated in %.1f s' % (time.monotonic() - start))
+    main_alarms()
+    print()
+    print('adaptive cadence, hourly slots, %d-%d min' % (cadence.MIN_INTERVAL_MIN, cadence.MAX_INTERVAL_MIN))
+    adaptive_year()
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# sim_transport.py  WiFi or LTE for each wake (lib/transport.py) as the links change.
+#
+#   python bench/sim_transport.py
+#
+# Two months of capture wakes against modelled links: LTE always comes up, the
+# WiFi network is good, then out of range, then barely usable, then good
+# again.  Compares the modelled charge of bringing a link up and uploading the
+# picture for LTE only, a fixed WiFi-then-LTE order, and transport.connect()
+# choosing from the history it keeps.  Time is simulated; the currents are
+# those of lib/energy.py.
+
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, '..', 'lib'))
+sys.path.append(os.path.join(_HERE, '..', 'host'))
+
+import energy
+import pycom
+import state
+import transport
+from checks import check, done
+
+DAYS = 60
+WAKES_PER_DAY = 4
+PAYLOAD = 40000             # Base64 picture and telemetry (bytes)
+START = 1700000000
+DEADLINE_MS = 300000
+WIFI_TIMEOUT_MS = 15000     # As main.py
+LTE = {'up_ms': 12000, 'bps': 20000}
+# (first day, WiFi up time in ms or None when out of range, throughput in bytes/s)
+WIFI_PERIODS = ((0, 5000, 60000), (15, None, 0), (25, 9000, 1500), (45, 5000, 60000))
+UP_UA = {transport.WIFI: energy.GPY_ACTIVE_UA + energy.WIFI_CONNECT_UA,
+         transport.LTE: energy.GPY_ACTIVE_UA + energy.LTE_ATTACH_UA}
+TX_UA = {transport.WIFI: energy.GPY_ACTIVE_UA + energy.WIFI_TX_UA,
+         transport.LTE: energy.GPY_ACTIVE_UA + energy.LTE_TX_UA}
+
+
+class Clock:
+    # Simulated ticks_ms for transport.connect()
+    def __init__(self):
+        self.ms = 0
+
+    def ticks_ms(self):
+        return self.ms
+
+    def ticks_diff(self, end, start):
+        return end - start
+
+
+def wifi_now(day):
+    for first, up_ms, bps in WIFI_PERIODS:
+        if day >= first:
+            current = {'up_ms': up_ms, 'bps': bps}
+    return current
+
+
+class World:
+    # The two radios of one wake: up()/down() as main.py hands them to transport
+    def __init__(self, clock, day):
+        self.clock = clock
+        self.wifi = wifi_now(day)
+        self.uah_ms = 0     # uA * ms
+        self.tried = []
+        self.downs = []
+
+    def _up(self, link, spec, limit_ms, timeout_ms):
+        self.tried.append(link)
+        ok = spec['up_ms'] is not None and spec['up_ms'] <= min(limit_ms, timeout_ms)
+        ms = spec['up_ms'] if ok else min(limit_ms, timeout_ms)
+        self.clock.ms += ms
+        self.uah_ms += UP_UA[link] * ms
+        return ok
+
+    def links(self):
+        return {transport.WIFI: (lambda ms: self._up(transport.WIFI, self.wifi, ms, WIFI_TIMEOUT_MS),
+                                 lambda: self.downs.append(transport.WIFI)),
+                transport.LTE: (lambda ms: self._up(transport.LTE, LTE, ms, ms),
+                                lambda: self.downs.append(transport.LTE))}
+
+    def upload(self, link):
+        ms = PAYLOAD * 1000 // (self.wifi if link == transport.WIFI else LTE)['bps']
+        self.clock.ms += ms
+        self.uah_ms += TX_UA[link] * ms
+        return ms
+
+
+def fixed(world, order):
+    # Try the links in a fixed order within the deadline
+    start = world.clock.ms
+    links = world.links()
+    for link in order:
+        if links[link][0](DEADLINE_MS - (world.clock.ms - start)):
+            return link
+    return -1
+
+
+def run(policy):
+    pycom.nvs_erase_all()
+    state.load()
+    clock = Clock()
+    transport.utime = clock
+    total = 0
+    uses = []               # (day, link, WiFi tried)
+    downs_ok = True
+    for i in range(DAYS * WAKES_PER_DAY):
+        day = i // WAKES_PER_DAY
+        now = START + i * 86400 // WAKES_PER_DAY
+        world = World(clock, day)
+        if policy == 'lte':
+            link = fixed(world, (transport.LTE,))
+        elif policy == 'fixed':
+            link = fixed(world, (transport.WIFI, transport.LTE))
+        else:
+            link, open_socket = transport.connect(world.links(), PAYLOAD, lambda: now, DEADLINE_MS)
+            downs_ok &= sorted(world.downs) == sorted(set((transport.WIFI, transport.LTE)) - set([link]))
+        if link >= 0:
+            ms = world.upload(link)
+            if policy == 'transport':
+                transport.transferred(link, PAYLOAD, ms)
+        total += world.uah_ms // 3600000
+        uses.append((day, link, transport.WIFI in world.tried))
+    return total, uses, downs_ok
+
+
+def main():
+    results = {}
+    print('%-24s %12s %10s %10s' % ('policy', 'charge mAh', 'wifi', 'lte'))
+    for policy, name in (('lte', 'LTE only'), ('fixed', 'WiFi, then LTE'), ('transport', 'transport.connect')):
+        results[policy] = total, uses, downs_ok = run(policy)
+        print('%-24s %12.1f %10d %10d' % (name, total / 1000,
+                                          sum(1 for _, link, _ in uses if link == transport.WIFI),
+                                          sum(1 for _, link, _ in uses if link == transport.LTE)))
+
+    total, uses, downs_ok = results['transport']
+    print()
+    print('%-12s %10s %10s %12s' % ('days', 'wifi', 'lte', 'wifi tries'))
+    bounds = [first for first, _, _ in WIFI_PERIODS] + [DAYS]
+    periods = []
+    for first, last in zip(bounds, bounds[1:]):
+        period = [u for u in uses if first <= u[0] < last]
+        periods.append(period)
+        print('%-12s %10d %10d %12d' % ('%d-%d' % (first, last - 1),
+                                        sum(1 for _, link, _ in period if link == transport.WIFI),
+                                        sum(1 for _, link, _ in period if link == transport.LTE),
+                                        sum(1 for _, _, tried in period if tried)))
+
+    print()
+    print('checks')
+    check('transport costs less than either fixed policy',
+          total < results['lte'][0] and total < results['fixed'][0])
+    check('every wake gets a link', all(link >= 0 for _, link, _ in uses))
+    check('losing radios turned off, the chosen one kept', downs_ok)
+    out_of_range = periods[1]
+    check('out of range: WiFi tried about once a day',
+          sum(1 for _, _, tried in out_of_range if tried) <= (bounds[2] - bounds[1]) + 1)
+    weak = periods[2]
+    check('weak WiFi: LTE but for about one retry a day',
+          sum(1 for _, link, _ in weak if link == transport.WIFI) <= (bounds[3] - bounds[2]) + WAKES_PER_DAY + 1)
+    recovered = periods[3]
+    check('WiFi back within a day of recovering',
+          all(link == transport.WIFI for _, link, _ in recovered[WAKES_PER_DAY + 1:]))
+
+    # A deadline shorter than the LTE attach: nothing comes up, and no later than the deadline
+    pycom.nvs_erase_all()
+    state.load()
+    clock = Clock()
+    transport.utime = clock
+    world = World(clock, 15)
+    link, open_socket = transport.connect(world.links(), PAYLOAD, lambda: START, 20000)
+    check('deadline: no link and both radios off',
+          link < 0 and open_socket is None and sorted(world.downs) == [transport.WIFI, transport.LTE])
+    check('deadline kept', clock.ms <= 20000)
+
+    done()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# build_mpy.py  Precompile lib/ and main.py to .mpy bytecode for the GPy.
+#
+#   python host/build_mpy.py [--mpy-cross PATH] [--out build] [-- extra mpy-cross options]
+#
+# Imported from .py, every module is parsed and compiled on the GPy at each
+# boot, which costs time and leaves heap fragments behind.  This writes
+#
+#   <out>/lib/*.mpy     every module of lib/
+#   <out>/lib/wake.mpy  main.py, compiled as a module
+#   <out>/main.py       'import wake'
+#   <out>/boot.py       copied
+#
+# to be copied to /flash in place of the sources (remove the lib/*.py there, as
+# a .py next to a .mpy is imported first).  mpy-cross must be the version of the
+# MicroPython the Pycom firmware is built from, or import fails with 'incompatible
+# .mpy file'; pass it with --mpy-cross.  The same module list can be frozen into
+# a custom firmware build instead.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(_HERE, '..')
+
+
+def mpy_cross_command(path):
+    if path:
+        return [path]
+    if shutil.which('mpy-cross'):
+        return ['mpy-cross']
+    try:
+        import mpy_cross        # noqa: F401  pip install mpy-cross==<firmware version>
+    except ImportError:
+        sys.exit('mpy-cross not found: pass --mpy-cross or pip install mpy-cross')
+    return [sys.executable, '-m', 'mpy_cross']
+
+
+def compile_one(command, src, dst, extra):
+    subprocess.run(command + extra + ['-s', os.path.basename(dst)[:-4] + '.py', '-o', dst, src], check=True)
+    return os.path.getsize(src), os.path.getsize(dst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompile lib/ and main.py to .mpy')
+    parser.add_argument('--mpy-cross', help='mpy-cross executable')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'build'), help='output directory')
+    parser.add_argument('extra', nargs='*', help='options passed to mpy-cross (after --)')
+    args = parser.parse_args()
+
+    command = mpy_cross_command(args.mpy_cross)
+    version = subprocess.run(command + ['--version'], capture_output=True, text=True).stdout.strip()
+    print(version or ' '.join(command))
+
+    lib_out = os.path.join(args.out, 'lib')
+    os.makedirs(lib_out, exist_ok=True)
+    lib = os.path.join(ROOT, 'lib')
+    sources = [(os.path.join(lib, name), os.path.join(lib_out, name[:-3] + '.mpy'))
+               for name in sorted(os.listdir(lib)) if name.endswith('.py')]
+    sources.append((os.path.join(ROOT, 'main.py'), os.path.join(lib_out, 'wake.mpy')))
+
+    total_py = total_mpy = 0
+    for src, dst in sources:
+        py, mpy = compile_one(command, src, dst, args.extra)
+        total_py += py
+        total_mpy += mpy
+        print('%-28s %8d %8d' % (os.path.relpath(dst, args.out), py, mpy))
+    print('%-28s %8d %8d' % ('total', total_py, total_mpy))
+
+    with open(os.path.join(args.out, 'main.py'), 'w') as f:
+        f.write('import wake      # main.py, precompiled by host/build_mpy.py\n')
+    shutil.copy(os.path.join(ROOT, 'boot.py'), os.path.join(args.out, 'boot.py'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# ds3231_emu.py  Register-accurate DS3231 emulator for host/fake_i2c.py.
+#
+#   i2c = I2C()
+#   rtc = i2c.attach(0x68, DS3231Emulator((2021, 9, 29, 13, 4, 58)))
+#   ...drive it with lib/urtc.py or lib/ds3231_port.py...
+#   rtc.advance(2)            # virtual seconds; alarms fire, INT goes low
+#   rtc.int_pin()             # 0 while an enabled alarm flag is set (INTCN = 1)
+#
+# Registers 0x00-0x12: time/date (BCD, 12/24 hour, century bit), Alarm 1 and
+# Alarm 2 with all mask modes, control, status (OSF, EN32kHz, BSY, A2F, A1F),
+# the century bit (kept as written, toggled on a 99 -> 00 rollover),
+# aging offset and temperature.  The register pointer wraps from 0x12 to 0x00.
+# Writing the seconds register restarts the 1 Hz countdown, as on the chip.
+# 'ppm' sets the oscillator error; each aging LSB adds about -0.1 ppm.
+
+import calendar
+import time
+
+REG_COUNT = 0x13
+CONTROL = 0x0e
+STATUS = 0x0f
+AGING = 0x10
+TEMP_MSB = 0x11
+
+# Control register
+EOSC = 0x80
+CONV = 0x20
+INTCN = 0x04
+A2IE = 0x02
+A1IE = 0x01
+
+# Status register
+OSF = 0x80
+EN32KHZ = 0x08
+BSY = 0x04
+A2F = 0x02
+A1F = 0x01
+
+
+def _bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def _dec(value):
+    return (value >> 4) * 10 + (value & 0x0f)
+
+
+class DS3231Emulator:
+    def __init__(self, datetime=(2000, 1, 1, 0, 0, 0), ppm=0.0, temperature=25.0, realtime=False,
+                 century=0):
+        self.regs = bytearray(REG_COUNT)
+        self.regs[CONTROL] = INTCN | 0x18                     # Power-on: RS2, RS1 and INTCN set
+        self.regs[STATUS] = OSF | EN32KHZ                     # Oscillator stopped flag set at power-up
+        self.ppm = ppm
+        self.temperature = temperature
+        self.realtime = realtime
+        self._secs = 0              # Time of day as seconds since 1970
+        self._frac = 0.0            # Fraction of the current second elapsed
+        self._last = time.monotonic()
+        self._listeners = []
+        self._century = century     # Century bit (month register bit 7) as last written
+        self.alarms_fired = [0, 0]
+        self.set_time(datetime)
+        self._update_temperature()
+
+    # Host side helpers #####################################################
+
+    def set_time(self, datetime):
+        y, mo, d, h, mi, s = datetime[:6]
+        self._secs = calendar.timegm((y, mo, d, h, mi, s, 0, 0, 0))
+        self._frac = 0.0
+
+    def now(self):
+        t = time.gmtime(self._secs)
+        return t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec
+
+    def seconds(self):
+        return self._secs + self._frac
+
+    def rate(self):
+        # DS3231 seconds per true second
+        aging = self.regs[AGING] - 256 if self.regs[AGING] & 0x80 else self.regs[AGING]
+        return 1 + (self.ppm - 0.1 * aging) * 1e-6
+
+    def advance(self, seconds):
+        # Let 'seconds' of true time pass, ticking the clock and the alarms
+        if self.regs[CONTROL] & EOSC:
+            return
+        self._frac += seconds * self.rate()
+        while self._frac >= 1.0:
+            self._frac -= 1.0
+            self._tick()
+
+    def advance_to_interrupt(self, limit=400 * 86400):
+        # Skip ahead to the next INT assertion; returns the seconds advanced or None
+        waited = 0
+        step = 1.0 - self._frac
+        while waited < limit:
+            self.advance(step / self.rate())
+            waited += step
+            step = 1.0
+            if not self.int_pin():
+                return waited
+        return None
+
+    def int_pin(self):
+        control, status = self.regs[CONTROL], self.regs[STATUS]
+        if not control & INTCN:
+            return 1
+        if (control & A1IE and status & A1F) or (control & A2IE and status & A2F):
+            return 0
+        return 1
+
+    def on_int(self, callback):
+        # callback(level) is called on every INT transition
+        self._listeners.append(callback)
+
+    # Device side (called by fake_i2c.I2C) ##################################
+
+    def read(self, register, n):
+        self._sync()
+        self._update_time_registers()
+        out = bytes(self.regs[(register + i) % REG_COUNT] for i in range(n))
+        return out
+
+    def write(self, register, data):
+        self._sync()
+        self._update_time_registers()
+        level = self.int_pin()
+        time_written = False
+        for i, b in enumerate(data):
+            reg = (register + i) % REG_COUNT
+            if reg < 7:
+                time_written = True
+                if reg == 0:
+                    self._frac = 0.0            # Writing seconds restarts the countdown
+            if reg == STATUS:
+                # OSF, A2F and A1F can only be cleared; BSY is read only
+                b = (self.regs[STATUS] & b & (OSF | A2F | A1F)) | (b & EN32KHZ) | (self.regs[STATUS] & BSY)
+            elif reg == CONTROL and b & CONV:
+                self._update_temperature()
+                b &= ~CONV                      # Conversion completes immediately
+            elif reg >= TEMP_MSB:
+                continue                        # Temperature registers are read only
+            self.regs[reg] = b & 0xff
+        if time_written:
+            self._load_time_registers()
+        self._notify(level)
+
+    # Internals ############################################################
+
+    def _sync(self):
+        if self.realtime:
+            now = time.monotonic()
+            self.advance(now - self._last)
+            self._last = now
+
+    def _update_temperature(self):
+        q = int(round(self.temperature * 4)) & 0x3ff
+        self.regs[TEMP_MSB] = q >> 2
+        self.regs[TEMP_MSB + 1] = (q & 0x03) << 6
+
+    def _update_time_registers(self):
+        t = time.gmtime(self._secs)
+        r = self.regs
+        r[0] = _bcd(t.tm_sec)
+        r[1] = _bcd(t.tm_min)
+        if r[2] & 0x40:                                 # 12 hour mode
+            h = t.tm_hour % 12 or 12
+            r[2] = 0x40 | (0x20 if t.tm_hour >= 12 else 0) | _bcd(h)
+        else:
+            r[2] = _bcd(t.tm_hour)
+        r[3] = (r[3] & 0x07) or 1                       # Day of week is a free running 1-7 counter
+        r[4] = _bcd(t.tm_mday)
+        r[5] = (0x80 if self._century else 0) | _bcd(t.tm_mon)
+        r[6] = _bcd(t.tm_year % 100)
+
+    def _load_time_registers(self):
+        r = self.regs
+        if r[2] & 0x40:
+            h = _dec(r[2] & 0x1f) % 12 + (12 if r[2] & 0x20 else 0)
+        else:
+            h = _dec(r[2] & 0x3f)
+        # The century bit is stored as written; urtc leaves it clear while ds3231_port sets it for 20xx
+        self._century = r[5] & 0x80
+        year = 2000 + _dec(r[6])
+        month = min(max(_dec(r[5] & 0x1f), 1), 12)
+        day = min(max(_dec(r[4] & 0x3f), 1), calendar.monthrange(year, month)[1])
+        self._secs = calendar.timegm((year, month, day, h % 24, _dec(r[1] & 0x7f) % 60,
+                                      _dec(r[0] & 0x7f) % 60, 0, 0, 0))
+
+    def _alarm_hour(self, value):
+        if value & 0x40:
+            return _dec(value & 0x1f) % 12 + (12 if value & 0x20 else 0)
+        return _dec(value & 0x3f)
+
+    def _day_matches(self, value, t):
+        if value & 0x40:
+            return (value & 0x0f) == self.regs[3]       # Day of week
+        return _dec(value & 0x3f) == t.tm_mday          # Date
+
+    def _alarm1_matches(self, t):
+        r = self.regs
+        m1, m2, m3, m4 = r[7] & 0x80, r[8] & 0x80, r[9] & 0x80, r[10] & 0x80
+        if not m1 and _dec(r[7] & 0x7f) != t.tm_sec:
+            return False
+        if m1 and not (m2 and m3 and m4):
+            return False        # A1M1 set is only valid as 'once per second'
+        if not m2 and _dec(r[8] & 0x7f) != t.tm_min:
+            return False
+        if not m3 and self._alarm_hour(r[9]) != t.tm_hour:
+            return False
+        if not m4 and not self._day_matches(r[10], t):
+            return False
+        return True
+
+    def _alarm2_matches(self, t):
+        r = self.regs
+        if t.tm_sec != 0:
+            return False        # Alarm 2 has no seconds register; it matches at ss = 00
+        m2, m3, m4 = r[11] & 0x80, r[12] & 0x80, r[13] & 0x80
+        if not m2 and _dec(r[11] & 0x7f) != t.tm_min:
+            return False
+        if not m3 and self._alarm_hour(r[12]) != t.tm_hour:
+            return False
+        if not m4 and not self._day_matches(r[13], t):
+            return False
+        return True
+
+    def _tick(self):
+        level = self.int_pin()
+        self._secs += 1
+        t = time.gmtime(self._secs)
+        if t.tm_hour == 0 and t.tm_min == 0 and t.tm_sec == 0:
+            self.regs[3] = self.regs[3] % 7 + 1
+            if t.tm_mon == 1 and t.tm_mday == 1 and t.tm_year % 100 == 0:
+                self._century ^= 0x80               # Toggles when the year rolls over from 99 to 00
+        if self._alarm1_matches(t):
+            self.regs[STATUS] |= A1F
+            self.alarms_fired[0] += 1
+        if self._alarm2_matches(t):
+            self.regs[STATUS] |= A2F
+            self.alarms_fired[1] += 1
+        if self._secs % 64 == 0:
+            self._update_temperature()      # Automatic conversion every 64 s
+        self._notify(level)
+
+    def _notify(self, before):
+        after = self.int_pin()
+        if after != before:
+            for callback in self._listeners:
+                callback(after)
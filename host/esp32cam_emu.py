@@ -0,0 +1,197 @@
+# esp32cam_emu.py  ESP32-CAM emulator on a pseudo-terminal.
+#
+# Plays the camera side of the picture protocol (see lib/picture.py):
+#   boot banner -> wait for 'Hello\0' -> 'ready' -> read '<filename>\0'
+#   -> '<length>\r\n' -> <length> JPEG bytes paced at the configured baud rate
+#
+# Fault injection: boot delay, dropped bytes, corrupted bytes and stalls in the
+# middle of the transfer.  The GPy side opens the pty slave with host/pty_uart.py.
+#
+#   python host/esp32cam_emu.py --baud 115200 --corpus pictures/ --drop 0.0001
+#
+# prints the slave path and serves pictures back to back.  Programs drive it with
+# trigger(), the equivalent of pulsing the camera RESET line.
+
+import os
+import random
+import threading
+import time
+import tty
+
+BANNER = b'ets Jun  8 2016 00:22:57\r\n\r\nrst:0x1 (POWERON_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)\r\n'
+
+
+def synthetic_jpeg(size, seed=0):
+    # Incompressible bytes framed by JPEG SOI/APP0 and EOI markers
+    rnd = random.Random(seed)
+    body = bytes(rnd.getrandbits(8) for _ in range(max(size - 6, 0)))
+    return (b'\xff\xd8\xff\xe0' + body + b'\xff\xd9')[:size]
+
+
+def load_corpus(path):
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith(('.jpg', '.jpeg')))
+    corpus = []
+    for name in names:
+        with open(os.path.join(path, name), 'rb') as f:
+            corpus.append(f.read())
+    return corpus
+
+
+class CameraEmulator:
+    def __init__(self, corpus=None, baudrate=38400, boot_delay=0.5, drop_rate=0.0,
+                 corrupt_rate=0.0, stall_at=None, stall_s=0.0, chunk=64, seed=None):
+        self.corpus = corpus or [synthetic_jpeg(20000)]
+        self.baudrate = baudrate
+        self.boot_delay = boot_delay
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.stall_at = stall_at            # Byte offset (or fraction < 1) of the transfer to stall at
+        self.stall_s = stall_s
+        self.chunk = chunk
+        self.rnd = random.Random(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.filenames = []
+        self.sent = []                      # Pictures as sent on the wire (after faults)
+        self.dropped = 0
+        self.corrupted = 0
+        self.stalls = 0
+        self._picture = 0
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+        self.done = threading.Event()       # Set after every served (or abandoned) picture
+        self._thread = None
+
+    # GPIO reset of the camera (camera_trigger in main.py)
+    def trigger(self):
+        self._trigger.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._trigger.set()
+        if self._thread:
+            self._thread.join(2)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _write_paced(self, data):
+        # Write at the line rate: 10 bit times per byte (8N1)
+        byte_time = 10.0 / self.baudrate
+        t0 = time.monotonic()
+        for i in range(0, len(data), self.chunk):
+            os.write(self.master, data[i:i + self.chunk])
+            delay = t0 + (i + self.chunk) * byte_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _read_until(self, terminator, timeout):
+        data = b''
+        deadline = time.monotonic() + timeout
+        os.set_blocking(self.master, False)
+        while not data.endswith(terminator) and time.monotonic() < deadline and not self._stop.is_set():
+            try:
+                data += os.read(self.master, 1)
+            except BlockingIOError:
+                time.sleep(0.001)
+        return data
+
+    def _drain(self):
+        os.set_blocking(self.master, False)
+        try:
+            while os.read(self.master, 256):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _apply_faults(self, picture):
+        out = bytearray()
+        for b in picture:
+            r = self.rnd.random()
+            if r < self.drop_rate:
+                self.dropped += 1
+                continue
+            if r < self.drop_rate + self.corrupt_rate:
+                self.corrupted += 1
+                b ^= 1 << self.rnd.randrange(8)
+            out.append(b)
+        return bytes(out)
+
+    def _serve_one(self):
+        # Boot: ROM banner at the wrong baud rate shows up as noise, then silence
+        os.write(self.master, bytes(self.rnd.getrandbits(8) for _ in range(len(BANNER))))
+        time.sleep(self.boot_delay)
+        self._drain()                       # Greetings sent while booting are lost
+
+        if not self._read_until(b'Hello\0', 30).endswith(b'Hello\0'):
+            return
+        os.write(self.master, b'ready')
+        filename = self._read_until(b'\0', 10)
+        self.filenames.append(filename.rstrip(b'\0').decode('ascii', 'replace'))
+
+        picture = self.corpus[self._picture % len(self.corpus)]
+        self._picture += 1
+        self._write_paced(b'%d\r\n' % len(picture))
+
+        wire = self._apply_faults(picture)
+        self.sent.append(wire)
+        stall_at = self.stall_at
+        if stall_at is not None:
+            stall_at = int(len(wire) * stall_at if stall_at < 1 else stall_at)
+        if stall_at is None:
+            self._write_paced(wire)
+        else:
+            self._write_paced(wire[:stall_at])
+            self.stalls += 1
+            time.sleep(self.stall_s)
+            self._write_paced(wire[stall_at:])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._trigger.wait()
+            self._trigger.clear()
+            if self._stop.is_set():
+                break
+            self._serve_one()
+            self.done.set()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='ESP32-CAM emulator on a pty')
+    parser.add_argument('--baud', type=int, default=38400)
+    parser.add_argument('--corpus', help='directory of .jpg files (default: one synthetic 20 KB picture)')
+    parser.add_argument('--size', type=int, default=20000, help='synthetic picture size')
+    parser.add_argument('--boot-delay', type=float, default=0.5)
+    parser.add_argument('--drop', type=float, default=0.0, help='probability of dropping each byte')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='probability of flipping a bit in each byte')
+    parser.add_argument('--stall-at', type=float, help='stall at this byte offset (or fraction of the picture)')
+    parser.add_argument('--stall', type=float, default=0.0, help='stall duration in seconds')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else [synthetic_jpeg(args.size)]
+    cam = CameraEmulator(corpus, args.baud, args.boot_delay, args.drop, args.corrupt,
+                         args.stall_at, args.stall, seed=args.seed).start()
+    print(cam.port)
+    try:
+        while True:
+            cam.trigger()
+            cam.done.wait()
+            cam.done.clear()
+            print('served %s (%d dropped, %d corrupted, %d stalls)' % (
+                cam.filenames[-1] if cam.filenames else '-', cam.dropped, cam.corrupted, cam.stalls))
+    except KeyboardInterrupt:
+        cam.stop()
+
+
+if __name__ == '__main__':
+    main()
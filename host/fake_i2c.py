@@ -0,0 +1,78 @@
+# fake_i2c.py  In-memory machine.I2C for running the RTC drivers on the host.
+#
+# Each attached device is an object with read(register, n) and write(register, data).
+# A plain bytearray register file (RegisterFile) is enough for the micro-benchmarks;
+# host/ds3231_emu.py is a register-accurate DS3231.  The bus counts transactions,
+# bytes and bit times so driver changes can be measured in bus time.
+
+
+class RegisterFile:
+    def __init__(self, size=256):
+        self.regs = bytearray(size)
+
+    def read(self, register, n):
+        return bytes(self.regs[register + i & 0xff] for i in range(n))
+
+    def write(self, register, data):
+        for i, b in enumerate(data):
+            self.regs[register + i & 0xff] = b
+
+
+class I2C:
+    MASTER = 0
+
+    def __init__(self, bus=0, mode=MASTER, baudrate=100000, pins=None):
+        self.baudrate = baudrate
+        self.devices = {}
+        self.reset_counters()
+
+    def attach(self, address, device):
+        self.devices[address] = device
+        return device
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.reads = 0
+        self.writes = 0
+        self.bytes = 0
+        self.bits = 0
+
+    # Time the counted transactions occupied the bus at the configured clock rate
+    def bus_time_us(self):
+        return self.bits * 1000000 // self.baudrate
+
+    def _device(self, address):
+        try:
+            return self.devices[address]
+        except KeyError:
+            raise OSError(19, 'I2C bus error: no device at 0x%02x' % address)   # ENODEV
+
+    def _account(self, nbytes, read):
+        # START, address + W, register, [repeated START, address + R], data, STOP; 9 bits per byte
+        self.transactions += 1
+        if read:
+            self.reads += 1
+            self.bits += 1 + 9 + 9 + 1 + 9 + 9 * nbytes + 1
+        else:
+            self.writes += 1
+            self.bits += 1 + 9 + 9 + 9 * nbytes + 1
+        self.bytes += nbytes
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def readfrom_mem(self, address, register, n):
+        data = self._device(address).read(register, n)
+        self._account(n, True)
+        return data
+
+    def readfrom_mem_into(self, address, register, buf):
+        buf[:] = self._device(address).read(register, len(buf))
+        self._account(len(buf), True)
+
+    def writeto_mem(self, address, register, buf):
+        self._device(address).write(register, bytes(buf))
+        self._account(len(buf), False)
+
+    def deinit(self):
+        pass
@@ -0,0 +1,136 @@
+# machine.py  CPython stand-in for the parts of the Pycom machine module used by lib/.
+
+import threading
+
+from fake_i2c import I2C        # noqa: F401
+
+
+class Pin:
+    # Logic-level pin.  Emulated devices call drive(); e.g. connect the DS3231 INT
+    # output with DS3231Emulator.on_int(Pin('P22').drive)
+    IN = 1
+    OUT = 2
+    OPEN_DRAIN = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 1 if value is None else value
+        self._trigger = 0
+        self._handler = None
+        self._arg = None
+        self.held = False
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self.drive(value)
+
+    def hold(self, hold=None):
+        if hold is None:
+            return self.held
+        self.held = bool(hold)
+
+    def callback(self, trigger, handler=None, arg=None):
+        self._trigger = trigger
+        self._handler = handler
+        self._arg = arg
+
+    def drive(self, level):
+        level = 1 if level else 0
+        before, self._value = self._value, level
+        if self._handler is None or before == level:
+            return
+        if (level == 0 and self._trigger & self.IRQ_FALLING) or (level and self._trigger & self.IRQ_RISING):
+            self._handler(self if self._arg is None else self._arg)
+
+
+class ADC:
+    # Counts come from ADC.source(pin), set by the bench; 12 bits, clipped
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    source = staticmethod(lambda pin: 0)
+
+    def __init__(self, id=0, bits=12):
+        self._vref = 1100
+
+    def vref(self, vref=None):
+        if vref is None:
+            return self._vref
+        self._vref = vref
+
+    def channel(self, pin, attn=ATTN_0DB):
+        return _ADCChannel(pin)
+
+    def deinit(self):
+        pass
+
+
+class _ADCChannel:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def __call__(self):
+        return max(0, min(4095, int(ADC.source(self.pin))))
+
+    value = __call__
+
+    def deinit(self):
+        pass
+
+
+class Timer:
+    class Alarm:
+        # Calls handler(alarm) every 'ms' on a host thread
+        def __init__(self, handler, s=None, ms=None, us=None, arg=None, periodic=False):
+            self._handler = handler
+            self._period = s if s is not None else (ms / 1000 if ms is not None else us / 1e6)
+            self._periodic = periodic
+            self._cancelled = threading.Event()
+            threading.Thread(target=self._run, daemon=True).start()
+
+        def _run(self):
+            while not self._cancelled.wait(self._period):
+                self._handler(self)
+                if not self._periodic:
+                    break
+
+        def cancel(self):
+            self._cancelled.set()
+
+
+# Deep sleep.  The stand-in records the request in 'sleeps' and raises SystemExit,
+# as the GPy never returns from machine.deepsleep(); set 'wake' for the next boot.
+PWRON_WAKE = 0
+PIN_WAKE = 1
+RTC_WAKE = 2
+ULP_WAKE = 3
+WAKEUP_ALL_LOW = 0
+WAKEUP_ANY_HIGH = 1
+
+wake = (PWRON_WAKE, None)
+sleeps = []
+_wake_pins = None
+
+
+def wake_reason():
+    return wake
+
+
+def pin_sleep_wakeup(pins, mode, enable_pull=False):
+    global _wake_pins
+    _wake_pins = (list(pins), mode, enable_pull)
+
+
+def deepsleep(time_ms=0):
+    sleeps.append((time_ms, _wake_pins))
+    raise SystemExit
@@ -0,0 +1,9 @@
+# micropython.py  CPython stand-in for the MicroPython 'micropython' module.
+#
+# The host/ directory lets the modules in lib/ run unchanged on CPython for the
+# benchmarks in bench/ and the emulators in host/.  Put it at the END of sys.path
+# so that real MicroPython modules always win under the unix port.
+
+
+def const(value):
+    return value
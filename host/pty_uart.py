@@ -0,0 +1,45 @@
+# pty_uart.py  machine.UART stand-in on a serial device or pty (GPy side of host/esp32cam_emu.py).
+#
+# Implements the calls lib/picture.py makes: any(), readinto(), readline(), write().
+# Like the Pycom UART, readline() returns whatever is buffered up to the first
+# newline, or None when nothing has arrived.
+
+import fcntl
+import os
+import struct
+import termios
+import tty
+
+
+class PtyUART:
+    def __init__(self, port, baudrate=38400):
+        self.fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(self.fd)
+        self.baudrate = baudrate
+
+    def any(self):
+        buf = fcntl.ioctl(self.fd, termios.FIONREAD, struct.pack('i', 0))
+        return struct.unpack('i', buf)[0]
+
+    def readinto(self, mv):
+        n = min(len(mv), self.any())
+        if not n:
+            return None
+        return os.readv(self.fd, [mv[:n]])
+
+    def readline(self):
+        line = b''
+        while self.any():
+            c = os.read(self.fd, 1)
+            line += c
+            if c == b'\n':
+                break
+        return line or None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        return os.write(self.fd, data)
+
+    def deinit(self):
+        os.close(self.fd)
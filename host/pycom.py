@@ -0,0 +1,40 @@
+# pycom.py  CPython stand-in for the Pycom pycom module (heartbeat LED and NVS).
+#
+# The non-volatile store is a dict; nvs_get() raises ValueError for a missing
+# key as current firmware does.  'writes' counts nvs_set() calls (each one is a
+# flash write and commit on the GPy).
+
+_nvs = {}
+writes = 0
+
+
+def heartbeat(state=None):
+    return False
+
+
+def nvs_set(key, value):
+    global writes
+    if len(key) > 15:
+        raise ValueError('key too long')
+    if isinstance(value, int) and not 0 <= value <= 0xffffffff:
+        raise OverflowError('value out of range')
+    _nvs[key] = value
+    writes += 1
+
+
+def nvs_get(key):
+    try:
+        return _nvs[key]
+    except KeyError:
+        raise ValueError('no such key')
+
+
+def nvs_erase(key):
+    try:
+        del _nvs[key]
+    except KeyError:
+        raise ValueError('no such key')
+
+
+def nvs_erase_all():
+    _nvs.clear()
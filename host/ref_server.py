@@ -0,0 +1,188 @@
+# ref_server.py  Local reference server for the station's uploads.
+#
+#   python host/ref_server.py [--port 8080] [--dir received] [--drop-replies N] [--unavailable N]
+#
+# Accepts what main.py sends and keeps it under --dir:
+#
+#   POST /file/base64            JSON with the Base64 picture   <id>_<time>.jpg
+#   POST /file/log?id=<id>       ringlog records                <id>.log.bin (appended)
+#   POST /file/telemetry?id=<id> telemetry records              <id>.telemetry.jsonl (one JSON per record)
+#   GET  /file/exists?key=<key>  200 if a picture with that idempotency key is stored, else 404
+#
+# A picture posted with an Idempotency-Key header (lib/upload.py) is stored once:
+# the key and the file go to keys.jsonl, and a second post with the same key
+# gets 200 with 'duplicate' and is not stored again.
+#
+# Point the station (or a bench) at it instead of the production server to see
+# exactly what arrives.  decode_telemetry() is the server side of
+# lib/telemetry.py: it keeps the layout of every record VERSION, so stations on
+# older firmware keep reporting.  For the retry paths, --drop-replies stores the
+# next N pictures but closes the connection without a reply, and --unavailable
+# answers the next N with 503; a bench sets server.faults instead.
+
+import argparse
+import base64
+import json
+import os
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# version: (struct layout, field names); the first byte of a record is its version
+TELEMETRY = {
+    1: ('<BBHIHhhBB7HI8s',
+        ('version', 'flags', 'station', 'time', 'vbat_mv', 'temp_q', 'rsrp_dbm', 'mode', 'wake',
+         'boot_ms', 'attach_ms', 'connect_ms', 'net_ms', 'camera_ms', 'upload_ms', 'shutdown_ms',
+         'length', 'hash')),
+}
+_PHASE_UNIT_MS = 10
+KEYS_FILE = 'keys.jsonl'
+FLAG_IMAGE = 0x01
+FLAG_WIFI = 0x02
+
+
+# Telemetry records in 'data' (any number, any versions) as a list of dicts.
+#   Raises ValueError on an unknown version or a truncated record.
+def decode_telemetry(data):
+    records = []
+    offset = 0
+    while offset < len(data):
+        version = data[offset]
+        if version not in TELEMETRY:
+            raise ValueError('unknown telemetry version %d at byte %d' % (version, offset))
+        layout, names = TELEMETRY[version]
+        size = struct.calcsize(layout)
+        if offset + size > len(data):
+            raise ValueError('truncated telemetry record at byte %d' % offset)
+        record = dict(zip(names, struct.unpack_from(layout, data, offset)))
+        for name in names:
+            if name.endswith('_ms'):
+                record[name] *= _PHASE_UNIT_MS
+        record['temp_c'] = record.pop('temp_q') / 4
+        record['hash'] = record['hash'].hex() if record['flags'] & FLAG_IMAGE else None
+        record['link'] = 'wifi' if record['flags'] & FLAG_WIFI else 'lte'
+        records.append(record)
+        offset += size
+    return records
+
+
+class Handler(BaseHTTPRequestHandler):
+    directory = 'received'
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _fault(self, name):
+        with self.server.lock:
+            if self.server.faults.get(name, 0) > 0:
+                self.server.faults[name] -= 1
+                return True
+        return False
+
+    def _picture(self, body):
+        key = self.headers.get('Idempotency-Key')
+        if self._fault('unavailable'):
+            self._reply(503, {'ok': 0, 'error': 'unavailable'})
+            return
+        with self.server.lock:
+            if key and key in self.server.keys:
+                self._reply(200, {'ok': 1, 'file': self.server.keys[key], 'duplicate': 1})
+                return
+            upload = json.loads(body)
+            name = '%s_%s.jpg' % (upload['id'], upload['timeStamp'].replace(':', ''))
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(base64.b64decode(upload['base64File']))
+            if key:
+                self.server.keys[key] = name
+                with open(os.path.join(self.directory, KEYS_FILE), 'a') as f:
+                    f.write(json.dumps({'key': key, 'file': name}) + '\n')
+        if self._fault('drop'):
+            self.close_connection = True        # Stored, but the station never hears of it
+            return
+        self._reply(200, {'ok': 1, 'file': name})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/file/exists':
+            self._reply(404, {'ok': 0, 'error': 'no such endpoint'})
+            return
+        key = parse_qs(url.query).get('key', [''])[0]
+        name = self.server.keys.get(key)
+        if name:
+            self._reply(200, {'ok': 1, 'file': name})
+        else:
+            self._reply(404, {'ok': 0})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        station = parse_qs(url.query).get('id', ['0'])[0]
+        body = self._body()
+        try:
+            if url.path == '/file/base64':
+                self._picture(body)
+            elif url.path == '/file/log':
+                with open(os.path.join(self.directory, '%s.log.bin' % station), 'ab') as f:
+                    f.write(body)
+                self._reply(200, {'ok': 1, 'bytes': len(body)})
+            elif url.path == '/file/telemetry':
+                records = decode_telemetry(body)
+                with open(os.path.join(self.directory, '%s.telemetry.jsonl' % station), 'a') as f:
+                    for record in records:
+                        f.write(json.dumps(record) + '\n')
+                self._reply(200, {'ok': 1, 'records': len(records)})
+            else:
+                self._reply(404, {'ok': 0, 'error': 'no such endpoint'})
+        except (ValueError, KeyError) as e:
+            self._reply(400, {'ok': 0, 'error': str(e)})
+
+    def log_message(self, *args):
+        pass
+
+
+# Start a server on 'port' (0: any free port) in a thread; returns it
+#   (server.server_address[1] is the port, server.faults the injected faults)
+def serve(directory, port=0, host='127.0.0.1', drop_replies=0, unavailable=0):
+    os.makedirs(directory, exist_ok=True)
+    handler = type('Handler', (Handler,), {'directory': directory})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.lock = threading.Lock()
+    server.faults = {'drop': drop_replies, 'unavailable': unavailable}
+    server.keys = {}
+    try:
+        with open(os.path.join(directory, KEYS_FILE)) as f:
+            for line in f:
+                entry = json.loads(line)
+                server.keys[entry['key']] = entry['file']
+    except FileNotFoundError:
+        pass
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local reference server for station uploads')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--dir', default='received', help='where the uploads are kept')
+    parser.add_argument('--drop-replies', type=int, default=0, help='store the next N pictures without replying')
+    parser.add_argument('--unavailable', type=int, default=0, help='answer the next N pictures with 503')
+    args = parser.parse_args()
+    server = serve(args.dir, args.port, args.host, args.drop_replies, args.unavailable)
+    print('listening on %s:%d, keeping uploads in %s' % (args.host, server.server_address[1], args.dir))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
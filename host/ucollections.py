@@ -0,0 +1,3 @@
+# ucollections.py  CPython stand-in for the MicroPython ucollections module.
+
+from collections import *       # noqa: F401,F403
@@ -0,0 +1,3 @@
+# uhashlib.py  CPython stand-in for the MicroPython uhashlib module.
+
+from hashlib import sha1, sha256        # noqa: F401
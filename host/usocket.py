@@ -0,0 +1,90 @@
+# usocket.py  CPython stand-in for the MicroPython usocket module.
+#
+# MicroPython sockets are also streams (write/read/readinto/readline) and accept
+# str wherever they accept bytes; this wrapper adds that on top of CPython sockets.
+
+import socket as _socket
+from socket import (AF_INET, AF_INET6, SOCK_STREAM, SOCK_DGRAM,   # noqa: F401
+                    IPPROTO_TCP, IPPROTO_UDP, SOL_SOCKET, SO_REUSEADDR, timeout)
+
+
+def _b(data):
+    return data.encode() if isinstance(data, str) else data
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    return _socket.getaddrinfo(host, port, af, type, proto, flags)
+
+
+class socket:
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=0, sock=None):
+        self._s = sock if sock is not None else _socket.socket(af, type, proto)
+        self._f = None
+
+    def _file(self):
+        if self._f is None:
+            self._f = self._s.makefile('rb')
+        return self._f
+
+    def connect(self, address):
+        self._s.connect(address)
+
+    def bind(self, address):
+        self._s.bind(address)
+
+    def listen(self, backlog=1):
+        self._s.listen(backlog)
+
+    def accept(self):
+        s, address = self._s.accept()
+        return socket(sock=s), address
+
+    def settimeout(self, value):
+        self._s.settimeout(value)
+
+    def setblocking(self, flag):
+        self._s.setblocking(flag)
+
+    def setsockopt(self, level, option, value):
+        self._s.setsockopt(level, option, value)
+
+    def fileno(self):
+        return self._s.fileno()
+
+    def send(self, data):
+        return self._s.send(_b(data))
+
+    def sendall(self, data):
+        self._s.sendall(_b(data))
+
+    def sendto(self, data, address):
+        return self._s.sendto(_b(data), address)
+
+    def recv(self, n):
+        return self._s.recv(n)
+
+    def recvfrom(self, n):
+        return self._s.recvfrom(n)
+
+    def write(self, data):
+        data = _b(data)
+        self._s.sendall(data)
+        return len(data)
+
+    def read(self, n=-1):
+        return self._file().read(n)
+
+    def readinto(self, buf, nbytes=None):
+        if self._s.type == SOCK_DGRAM:
+            return self._s.recv_into(buf, nbytes or 0)
+        mv = memoryview(buf)
+        return self._file().readinto(mv[:nbytes] if nbytes else mv)
+
+    def readline(self):
+        return self._file().readline()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        self._s.close()
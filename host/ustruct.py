@@ -0,0 +1,3 @@
+# ustruct.py  CPython stand-in for the MicroPython ustruct module.
+
+from struct import *        # noqa: F401,F403
@@ -0,0 +1,56 @@
+# utime.py  CPython stand-in for the Pycom utime module.
+#
+# Pycom firmware counts time from the 1970 epoch, so mktime()/localtime() here
+# are plain UTC conversions.  ticks_*() wrap like the firmware does.
+
+import calendar
+import time as _time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return int(_time.monotonic() * 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return int(_time.monotonic() * 1000000) & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(end, start):
+    return ((end - start + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def sleep(seconds):
+    _time.sleep(seconds)
+
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    _time.sleep(us / 1000000)
+
+
+def time():
+    return int(_time.time())
+
+
+def mktime(t):
+    return calendar.timegm((t[0], t[1], t[2], t[3], t[4], t[5], 0, 0, 0))
+
+
+def localtime(secs=None):
+    t = _time.gmtime(time() if secs is None else secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+            t.tm_wday, t.tm_yday)
+
+
+gmtime = localtime
@@ -19,6 +19,8 @@ __all__ = [
     'b16encode', 'b16decode',
     # Standard Base64 encoding
     'standard_b64encode', 'standard_b64decode',
+    # Base64 encoding into caller buffers, whole or in pieces
+    'encoded_length', 'b64encode_into', 'Encoder',
     # Some common Base64 alternatives.  As referenced by RFC 3458, see thread
     # starting at:
     #
@@ -140,6 +142,85 @@ def urlsafe_b64decode(s):
 
 
 
+# Base64 encoding into caller buffers.  binascii.b2a_base64() returns a new
+# object as long as its input plus a newline, and b64encode() copies that again
+# to drop the newline; these encode CHUNK bytes at a time, so only a line-sized
+# object is ever allocated whatever the size of the data.
+
+CHUNK = 768 # Multiple of 3, so no padding appears mid-stream
+
+def encoded_length(n):
+    """Length of the Base64 text of n bytes, padding included."""
+    return (n + 2) // 3 * 4
+
+
+def b64encode_into(src, dst):
+    """Encode the bytes-like src using Base64 into the writable buffer dst.
+
+    dst (a bytearray or a memoryview of one) must hold at least
+    encoded_length(len(src)) bytes; ValueError is raised otherwise.  Returns
+    the number of bytes written.  No newline is added.
+    """
+    if len(dst) < encoded_length(len(src)):
+        raise ValueError('destination too small')
+    src = memoryview(src)
+    out = 0
+    for start in range(0, len(src), CHUNK):
+        line = binascii.b2a_base64(src[start:start + CHUNK])
+        n = len(line) - 1       # Drop the trailing newline
+        dst[out:out + n] = memoryview(line)[:n]
+        out += n
+    return out
+
+
+class Encoder:
+    """Incremental Base64 encoder writing into a caller buffer.
+
+    Data can arrive in pieces of any size, e.g. as read from a UART:
+
+        enc = Encoder(dst)
+        enc.update(chunk)       # As often as needed
+        n = enc.finalize()      # dst[:n] is the Base64 text
+
+    Up to two bytes that do not complete a 3-byte group are carried to the
+    next update(); finalize() encodes them with padding.  dst must hold
+    encoded_length() of all the data.
+    """
+
+    def __init__(self, dst):
+        self.dst = memoryview(dst)
+        self.length = 0         # Bytes written to dst so far
+        self._tail = bytearray(3)
+        self._n = 0             # Bytes carried in _tail
+
+    def update(self, data):
+        """Encode data; returns the number of bytes written to dst by this call."""
+        data = memoryview(data)
+        start = self.length
+        if self._n:
+            take = min(3 - self._n, len(data))
+            self._tail[self._n:self._n + take] = data[:take]
+            self._n += take
+            data = data[take:]
+            if self._n < 3:
+                return 0
+            self.length += b64encode_into(self._tail, self.dst[self.length:])
+            self._n = 0
+        whole = len(data) - len(data) % 3
+        if whole:
+            self.length += b64encode_into(data[:whole], self.dst[self.length:])
+        self._n = len(data) - whole
+        self._tail[:self._n] = data[whole:]
+        return self.length - start
+
+    def finalize(self):
+        """Encode the carried bytes; returns the total length written to dst."""
+        if self._n:
+            self.length += b64encode_into(memoryview(self._tail)[:self._n], self.dst[self.length:])
+            self._n = 0
+        return self.length
+
+
 # Base32 encoding/decoding must be done in Python
 _b32alphabet = {
     0: b'A',  9: b'J', 18: b'S', 27: b'3',
@@ -0,0 +1,114 @@
+# battery.py  Battery voltage measured in the background.
+#
+#   battery = Battery(Pin('P19', mode=Pin.OUT))
+#   battery.start()             # Divider on; samples are taken by a Timer.Alarm
+#   ...attach to LTE...
+#   mv = battery.read_mv()      # Waits only for samples still missing
+#
+# The battery reaches the ADC (P18, 0 dB) through a 352k/56k divider that is only
+# powered while P19 is high.  start() turns it on and a periodic Timer.Alarm takes
+# SAMPLES readings PERIOD_MS apart into a preallocated array; the first one comes
+# after the divider has settled, and the divider is turned off again as soon as
+# the last one is in.  read_mv() sorts the samples and averages the middle half (a trimmed mean: ADC spikes and the odd
+# radio burst are dropped, the noise of the rest averages out), then converts
+# with the unit calibration:
+#
+#   mV = (count * gain_uv + offset_uv) / 1000
+#
+# The default gain and offset are the factory fit of the first stations
+# (1.754703 mV per count + 544.5 mV).  A unit calibrated against a meter keeps its
+# own in the wake state (lib/state.py: bt_gain, bt_off; see calibrate()), and an
+# ADC reference measured with ADC.vref_to_pin() in bt_vref (mV) replaces the
+# eFuse Vref.
+
+from array import array
+import utime
+from machine import ADC, Timer
+import state
+
+SAMPLES = 16
+PERIOD_MS = 5
+GAIN_UV = 1755              # Factory fit, microvolts per ADC count
+OFFSET_UV = 544529
+
+
+class Battery:
+    def __init__(self, enable_pin, adc_pin='P18', samples=SAMPLES, period_ms=PERIOD_MS):
+        self.enable_pin = enable_pin
+        self.adc_pin = adc_pin
+        self.period_ms = period_ms
+        self._samples = array('H', [0] * samples)
+        self._n = 0
+        self._alarm = None
+        self._channel = None
+
+    def start(self):
+        self._n = 0
+        self.enable_pin.value(1)
+        adc = ADC(0)
+        vref = state.get('bt_vref')
+        if vref:
+            adc.vref(vref)
+        self._channel = adc.channel(pin=self.adc_pin, attn=ADC.ATTN_0DB)
+        self._alarm = Timer.Alarm(self._sample, ms=self.period_ms, periodic=True)
+
+    # Timer.Alarm handler: no allocation.  The divider goes off with the last sample.
+    def _sample(self, alarm):
+        n = self._n
+        if n < len(self._samples):
+            self._samples[n] = self._channel()
+            n += 1
+            self._n = n
+        if n >= len(self._samples):
+            alarm.cancel()
+            self.enable_pin.value(0)
+
+    def done(self):
+        return self._n >= len(self._samples)
+
+    def _stop(self):
+        if self._alarm is not None:
+            self._alarm.cancel()
+            self._alarm = None
+        self.enable_pin.value(0)
+
+    # Trimmed mean of the samples in ADC counts x 16 (call after the samples are in)
+    def count16(self):
+        s = self._samples
+        n = self._n
+        for i in range(1, n):               # Insertion sort in place
+            v = s[i]
+            j = i - 1
+            while j >= 0 and s[j] > v:
+                s[j + 1] = s[j]
+                j -= 1
+            s[j + 1] = v
+        trim = n // 4
+        total = 0
+        for i in range(trim, n - trim):
+            total += s[i]
+        return total * 16 // (n - 2 * trim)
+
+    # Battery voltage in mV.  Waits for the samples of the measurement start()ed (or
+    #   takes a new one).
+    def read_mv(self):
+        if self._alarm is None:
+            self.start()
+        while not self.done():
+            utime.sleep_ms(1)
+        self._stop()
+        count16 = self.count16()
+        gain = state.get('bt_gain', GAIN_UV)
+        offset = state.get('bt_off', OFFSET_UV)
+        return (count16 * gain // 16 + offset) // 1000
+
+
+# Store a two-point unit calibration: trimmed-mean counts x 16 (Battery.count16())
+#   read at two battery voltages measured with a meter (mV).  Run from the REPL,
+#   so it commits the wake state itself.
+def calibrate(count16_low, mv_low, count16_high, mv_high):
+    gain = (mv_high - mv_low) * 16000 // (count16_high - count16_low)
+    state.put('bt_gain', gain)
+    state.put('bt_off', mv_low * 1000 - count16_low * gain // 16)
+    state.commit()
+    return gain
@@ -0,0 +1,80 @@
+# bufpool.py  Fixed-size buffers reserved once at boot.
+#
+# Every wake allocates the same large temporaries in turn (picture, Base64 text,
+# socket and NTP buffers).  On a long-running heap those allocations fragment
+# memory until a large picture no longer fits even though gc.mem_free() looks
+# fine.  The pool reserves one buffer per slot right after boot, while the heap
+# is still empty, and hands the same buffers out for the life of the program.
+#
+# Usage:
+#   pool = BufferPool((('picture', 131072), ('net', 1024)))
+#   buf = pool.borrow('picture', length)     # bytearray of the slot size
+#   ...
+#   pool.give_back('picture')
+#
+# wake_slots() lists the slots of a station wake; main.py reserves them before
+# it imports the modules that use them.
+
+import gc
+
+
+class BufferPool:
+    def __init__(self, slots):
+        gc.collect()
+        self._names = []
+        self._bufs = []
+        self._in_use = []
+        self._hwm = []          # Largest number of bytes requested from each slot
+        self._borrows = []
+        self._misses = []       # Requests that did not fit and fell back to the allocator
+        for name, size in slots:
+            self._names.append(name)
+            self._bufs.append(bytearray(size))
+            self._in_use.append(False)
+            self._hwm.append(0)
+            self._borrows.append(0)
+            self._misses.append(0)
+
+    def _index(self, name):
+        try:
+            return self._names.index(name)
+        except ValueError:
+            raise KeyError(name)
+
+    def size(self, name):
+        return len(self._bufs[self._index(name)])
+
+    # Borrow the buffer of slot 'name'.  'nbytes' is the number of bytes the caller
+    # will use; it feeds the high-water mark.  Requests larger than the slot (or for
+    # a slot that is already lent out) get a fresh bytearray and count as a miss.
+    def borrow(self, name, nbytes=0):
+        i = self._index(name)
+        buf = self._bufs[i]
+        if nbytes > self._hwm[i]:
+            self._hwm[i] = nbytes
+        self._borrows[i] += 1
+        if self._in_use[i] or nbytes > len(buf):
+            self._misses[i] += 1
+            return bytearray(max(nbytes, len(buf)))
+        self._in_use[i] = True
+        return buf
+
+    def give_back(self, name):
+        self._in_use[self._index(name)] = False
+
+    # (name, size, high-water mark, borrows, misses) for each slot
+    def stats(self):
+        return [(self._names[i], len(self._bufs[i]), self._hwm[i],
+                 self._borrows[i], self._misses[i]) for i in range(len(self._names))]
+
+
+# BufferPool slots of a station wake for a given largest picture size
+#   picture: largest JPEG accepted from the ESP32-CAM
+#   b64:     Base64 text of the largest picture
+#   net:     HTTP reply and log upload blocks
+#   ntp:     NTP request/reply packet
+def wake_slots(picture_max):
+    return (('picture', picture_max),
+            ('b64', (picture_max + 2) // 3 * 4),      # base64.encoded_length()
+            ('net', 1024),
+            ('ntp', 48))
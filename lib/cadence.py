@@ -0,0 +1,87 @@
+# cadence.py  Adaptive capture interval.
+#
+# After every picture the time to the next capture follows how much the meter
+# picture changed since the last one.  The GPy cannot decode the JPEG, so the
+# change signal is the compressed size: a turning dial or new digits change the
+# entropy of the picture, an idle meter gives nearly the same size every time.
+#
+#   changed    (size moved CHANGE_PERMILLE or more)  the interval halves
+#   unchanged                                        the interval grows by half
+#
+# within MIN_INTERVAL_MIN and MAX_INTERVAL_MIN, so a busy meter is read hourly
+# and an idle one backs off to once a day.  A low battery holds the interval at
+# LOW_BATTERY_MIN or more and a critical one at MAX_INTERVAL_MIN.  The next
+# capture is the first capture schedule slot at least the interval after the last
+# one (elapsed(), schedule.program()), so wakes in between (telemetry, skipped or
+# failed ones) that program the alarm again do not push it back.  The interval,
+# the last picture size and the time of the last capture live in the wake state
+# (lib/state.py):
+#
+#   cd_iv   capture interval (minutes)      cd_len  last picture size (bytes)
+#   cd_at   last capture (utime.mktime() minutes)
+
+import state
+
+MIN_INTERVAL_MIN = 60
+MAX_INTERVAL_MIN = 1440
+START_INTERVAL_MIN = 360    # The fixed six hours this replaces
+LOW_BATTERY_MIN = 720
+CHANGE_PERMILLE = 20        # Size change that counts as a changed picture
+VBAT_LOW_MV = 6200          # 2 LiFePO4 cells
+VBAT_CRITICAL_MV = 6000
+
+# Decisions
+HOLD = 0                    # No picture: interval unchanged
+SLOWER = 1
+FASTER = 2
+BATTERY = 3                 # Held back by the battery
+
+
+def interval():
+    return min(MAX_INTERVAL_MIN, max(MIN_INTERVAL_MIN, state.get('cd_iv', START_INTERVAL_MIN)))
+
+
+# Minutes from the last capture to 'now' (utime.mktime() minutes); MAX_INTERVAL_MIN
+#   before the first capture or when the clock went back past it
+def elapsed(now):
+    last = state.get('cd_at', None)
+    if last is None or now < last:
+        return MAX_INTERVAL_MIN
+    return now - last
+
+
+# Size of the last picture (bytes), 0 before the first
+def last_length():
+    return state.get('cd_len')
+
+
+# Change of a picture of 'length' bytes against the last one, in permille
+def change_permille(length):
+    last = state.get('cd_len')
+    if not last:
+        return 1000
+    return min(abs(length - last) * 1000 // last, 32767)
+
+
+# Adjust the interval after a capture at 'now' (utime.mktime() minutes).  'length' is
+#   the size of the picture received (0 if none) and 'vbat_mv' the battery voltage in mV.
+#   Returns (decision, interval in minutes, change in permille)
+def update(length, vbat_mv, now):
+    state.put('cd_at', now)
+    current = interval()
+    change = 0
+    decision = HOLD
+    if length:
+        change = change_permille(length)
+        state.put('cd_len', length)
+        if change >= CHANGE_PERMILLE:
+            current, decision = current // 2, FASTER
+        else:
+            current, decision = current * 3 // 2, SLOWER
+        current = min(MAX_INTERVAL_MIN, max(MIN_INTERVAL_MIN, current))
+
+    floor = MAX_INTERVAL_MIN if vbat_mv < VBAT_CRITICAL_MV else LOW_BATTERY_MIN if vbat_mv < VBAT_LOW_MV else 0
+    if current < floor:
+        current, decision = floor, BATTERY
+    state.put('cd_iv', current)
+    return decision, current, change
@@ -0,0 +1,101 @@
+# drift.py  DS3231 drift model that decides when the clock needs an NTP sync.
+#
+# Every sync measures the DS3231 error (DS3231 minus NTP time) before it corrects
+# the clock.  The error gained since the previous sync over the time between them
+# is one drift measurement, taken the way DS3231.rtc_test() does it: clock
+# difference over elapsed time, here over days instead of minutes.  The rate is
+# the sum of the gains over the sum of the intervals, so long intervals weigh
+# more; the sums are halved once they span WINDOW_S so the estimate follows
+# temperature and aging.  Everything lives in the wake state (lib/state.py):
+#
+#   dr_t   DS3231 time of the last sync (s)       dr_se  sum of error gains (ms)
+#   dr_r   error left after the last sync (ms)    dr_sd  sum of intervals (s)
+#
+# A sync is due when the predicted error passes THRESHOLD_MS, MIN_FIT_S after the
+# last sync while there is no rate yet, and at MAX_INTERVAL_S in any case.  With
+# CORRECT_AGING the measured rate is also trimmed out through the DS3231 aging
+# register (about 0.1 ppm per LSB), after which the sums restart.
+
+import state
+
+THRESHOLD_MS = 500          # Sync when the predicted error reaches this
+MAX_INTERVAL_S = 30 * 86400     # Sync at least this often
+MIN_FIT_S = 7 * 86400       # Intervals needed before the rate is trusted
+WINDOW_S = 180 * 86400      # Halve the sums when they span more than this
+RESET_MS = 60000            # Larger errors are a clock reset, not drift
+CORRECT_AGING = True
+AGING_MIN_PPB = 300         # Leave the aging register alone below this rate
+_PPB_PER_LSB = 100
+
+
+# Drift rate in ppb (DS3231 gains this many ns per s), or None before MIN_FIT_S of data
+def rate_ppb():
+    span = state.get('dr_sd')
+    if span < MIN_FIT_S:
+        return None
+    return state.get('dr_se') * 1000000 // span
+
+
+# Predicted DS3231 error (ms) at DS3231 time 'now' (s), or None without a model
+def predicted_error_ms(now):
+    last = state.get('dr_t')
+    rate = rate_ppb()
+    if not last or rate is None:
+        return None
+    return state.get('dr_r') + rate * (now - last) // 1000000
+
+
+# Returns (due, predicted error in ms or None)
+def sync_due(now, threshold_ms=THRESHOLD_MS):
+    last = state.get('dr_t')
+    if not last or now < last:
+        return True, None
+    error = predicted_error_ms(now)
+    if now - last >= MAX_INTERVAL_S:
+        return True, error
+    if error is None:
+        return now - last >= MIN_FIT_S, None     # Collect the first measurement interval
+    return abs(error) >= threshold_ms, error
+
+
+# Record a sync at DS3231 time 'now' (s) that measured 'error_ms' and wrote the
+#   DS3231 if 'written'.  Trims the aging register of 'rtc' when enabled.
+#   Returns (rate in ppb or None, aging LSBs applied)
+def record(now, error_ms, written, rtc=None):
+    last = state.get('dr_t')
+    if last and 0 < now - last and abs(error_ms) < RESET_MS:
+        gain = error_ms - state.get('dr_r')
+        se = state.get('dr_se') + gain
+        sd = state.get('dr_sd') + now - last
+        if sd > WINDOW_S:
+            se //= 2
+            sd //= 2
+        state.put('dr_se', se)
+        state.put('dr_sd', sd)
+    else:
+        _restart()                  # First sync, or the DS3231 was reset
+    state.put('dr_t', now)
+    state.put('dr_r', 0 if written else error_ms)
+
+    rate = rate_ppb()
+    applied = 0
+    if CORRECT_AGING and rtc is not None and rate is not None and abs(rate) >= AGING_MIN_PPB:
+        # A fast DS3231 (positive rate) needs a larger aging value to slow down
+        aging = rtc.aging()
+        target = min(127, max(-128, aging + (rate + _PPB_PER_LSB // 2) // _PPB_PER_LSB))
+        if target != aging:
+            rtc.aging(target)
+            applied = target - aging
+            _restart()              # The old rate no longer applies
+    return rate, applied
+
+
+# The DS3231 was set from a coarser source: drop the last sync so the next one
+#   starts a new fit, and make that sync due now
+def forget():
+    state.put('dr_t', 0)
+
+
+def _restart():
+    state.put('dr_se', 0)
+    state.put('dr_sd', 0)
@@ -0,0 +1,294 @@
+# ds3231.py  Zero-allocation driver for the DS3231 real time clock.
+#
+# Merges lib/urtc.py (alarms, interrupt control, burst register access) and
+# lib/ds3231_port.py (readfrom_mem_into a reused buffer, await_transition,
+# temperature, rtc_test).  All bus traffic goes through one 19-byte register
+# buffer allocated in the constructor and fixed memoryviews into it, and times
+# are decoded into a caller supplied list, so the wake-time calls do not
+# allocate (see bench/bench_ds3231.py).
+#
+# A date/time is a list indexed by YEAR .. SECOND, in urtc order:
+#   t = ds3231.new_datetime()   # [year, month, day, weekday, hour, minute, second, millisecond]
+#   ds3231.datetime_into(t)
+#
+# Years are 2000-2099.  The century bit is ignored on read and written clear, as
+# urtc did, so clocks set by either driver read back the same.
+
+from micropython import const
+
+ADDRESS = const(0x68)
+
+YEAR = const(0)
+MONTH = const(1)
+DAY = const(2)
+WEEKDAY = const(3)
+HOUR = const(4)
+MINUTE = const(5)
+SECOND = const(6)
+
+_TIME = const(0x00)
+_ALARM1 = const(0x07)
+_ALARM2 = const(0x0b)
+_CONTROL = const(0x0e)
+_STATUS = const(0x0f)
+_AGING = const(0x10)
+_TEMPERATURE = const(0x11)
+_REGISTERS = const(0x13)
+
+# Control register
+_EOSC = const(0x80)
+_INTCN = const(0x04)
+_AIE = const(0x03)          # A2IE | A1IE
+# Status register
+_OSF = const(0x80)
+_AF = const(0x03)           # A2F | A1F
+
+
+def _bcd2bin(value):
+    return value - 6 * (value >> 4)
+
+
+def _bin2bcd(value):
+    return value + 6 * (value // 10)
+
+
+def _alarm_bcd(value):
+    return 0x80 if value is None else _bin2bcd(value)
+
+
+def _hour(value):
+    if value & 0x40:                        # 12 hour mode
+        return _bcd2bin(value & 0x1f) % 12 + (12 if value & 0x20 else 0)
+    return _bcd2bin(value & 0x3f)
+
+
+class DS3231:
+    def __init__(self, i2c, address=ADDRESS):
+        self.i2c = i2c
+        self.address = address
+        self._regs = bytearray(_REGISTERS)
+        mv = memoryview(self._regs)
+        self._time = mv[_TIME:_ALARM1]
+        self._config = mv[_ALARM1:_TEMPERATURE]     # Alarms, control, status and aging
+        self._alarm1 = mv[_ALARM1:_ALARM2]
+        self._alarm2 = mv[_ALARM2:_CONTROL]
+        self._temperature = mv[_TEMPERATURE:_REGISTERS]
+        self._views = tuple(mv[r:r + 1] for r in range(_REGISTERS))    # Single registers
+        self._loaded = False
+        self._dirty = False
+
+    @staticmethod
+    def new_datetime():
+        return [2000, 1, 1, 1, 0, 0, 0, 0]
+
+    # Burst access.  load() reads the whole register file in one transaction.
+    #   Until commit(), the flag, alarm and aging helpers work on the loaded copy
+    #   and commit() writes registers 0x07-0x10 back in one transaction.
+    #   datetime_into() returns the time at load() without touching the bus.
+    def load(self):
+        self.i2c.readfrom_mem_into(self.address, _TIME, self._regs)
+        self._loaded = True
+        self._dirty = False
+        return self._regs
+
+    def commit(self):
+        if self._loaded and self._dirty:
+            self.i2c.writeto_mem(self.address, _ALARM1, self._config)
+        self._loaded = False
+        self._dirty = False
+
+    def _get(self, register):
+        if not self._loaded:
+            self.i2c.readfrom_mem_into(self.address, register, self._views[register])
+        return self._regs[register]
+
+    def _set(self, register, value):
+        self._regs[register] = value
+        if self._loaded:
+            self._dirty = True
+        else:
+            self.i2c.writeto_mem(self.address, register, self._views[register])
+
+    def _flag(self, register, mask, value=None):
+        data = self._get(register)
+        if value is None:
+            return bool(data & mask)
+        self._set(register, data | mask if value else data & ~mask)
+
+    # Time ###################################################################
+
+    def _decode(self, t):
+        r = self._regs
+        t[YEAR] = 2000 + _bcd2bin(r[6])
+        t[MONTH] = _bcd2bin(r[5] & 0x1f)
+        t[DAY] = _bcd2bin(r[4] & 0x3f)
+        t[WEEKDAY] = r[3] & 0x07
+        t[HOUR] = _hour(r[2])
+        t[MINUTE] = _bcd2bin(r[1] & 0x7f)
+        t[SECOND] = _bcd2bin(r[0] & 0x7f)
+        return t
+
+    def datetime_into(self, t):
+        if not self._loaded:
+            self.i2c.readfrom_mem_into(self.address, _TIME, self._time)
+        return self._decode(t)
+
+    # Set the time from t (year, month, day, weekday, hour, minute, second) and
+    #   clear the oscillator stop flag
+    def set_datetime(self, t):
+        r = self._regs
+        r[0] = _bin2bcd(t[SECOND])
+        r[1] = _bin2bcd(t[MINUTE])
+        r[2] = _bin2bcd(t[HOUR])                    # 24 hour mode
+        r[3] = t[WEEKDAY]
+        r[4] = _bin2bcd(t[DAY])
+        r[5] = _bin2bcd(t[MONTH])
+        r[6] = _bin2bcd(t[YEAR] % 100)
+        self.i2c.writeto_mem(self.address, _TIME, self._time)
+        self._flag(_STATUS, _OSF, 0)
+
+    # Wait until the seconds register changes, then decode that time into t.
+    #   The new second started less than one bus transaction ago.
+    def await_transition(self, t=None):
+        i2c, address, buf = self.i2c, self.address, self._time
+        i2c.readfrom_mem_into(address, _TIME, buf)
+        ss = buf[0]
+        while buf[0] == ss:
+            i2c.readfrom_mem_into(address, _TIME, buf)
+        if t is not None:
+            self._decode(t)
+        return t
+
+    def lost_power(self):
+        return self._flag(_STATUS, _OSF)
+
+    def stop(self, value=None):
+        return self._flag(_CONTROL, _EOSC, value)
+
+    # Alarms and interrupts ##################################################
+
+    # Alarm fields that are None do not take part in the match, as in urtc.
+    #   Alarm 1 (alarm=0) matches on seconds too; Alarm 2 matches at ss = 00.
+    def alarm_time(self, t, alarm=0):
+        if t[DAY] is not None and t[WEEKDAY] is not None:
+            raise ValueError("can't specify both day and weekday")
+        r = self._regs
+        i = _ALARM1
+        if alarm == 0:
+            r[i] = _alarm_bcd(t[SECOND])
+            i += 1
+        else:
+            i = _ALARM2
+        r[i] = _alarm_bcd(t[MINUTE])
+        r[i + 1] = _alarm_bcd(t[HOUR])
+        if t[DAY] is not None:
+            r[i + 2] = _bin2bcd(t[DAY])
+        elif t[WEEKDAY] is not None:
+            r[i + 2] = _bin2bcd(t[WEEKDAY]) | 0x40
+        else:
+            r[i + 2] = 0x80
+        if self._loaded:
+            self._dirty = True
+        else:
+            self.i2c.writeto_mem(self.address, _ALARM1 if alarm == 0 else _ALARM2,
+                                 self._alarm1 if alarm == 0 else self._alarm2)
+
+    # Read an alarm into t; fields that do not take part in the match are None
+    def alarm_time_into(self, t, alarm=0):
+        buf = self._alarm1 if alarm == 0 else self._alarm2
+        if not self._loaded:
+            self.i2c.readfrom_mem_into(self.address, _ALARM1 if alarm == 0 else _ALARM2, buf)
+        r = self._regs
+        i = _ALARM1
+        if alarm == 0:
+            t[SECOND] = None if r[i] & 0x80 else _bcd2bin(r[i] & 0x7f)
+            i += 1
+        else:
+            i = _ALARM2
+            t[SECOND] = 0
+        t[YEAR] = t[MONTH] = None
+        t[MINUTE] = None if r[i] & 0x80 else _bcd2bin(r[i] & 0x7f)
+        t[HOUR] = None if r[i + 1] & 0x80 else _hour(r[i + 1])
+        day = r[i + 2]
+        t[DAY] = t[WEEKDAY] = None
+        if not day & 0x80:
+            if day & 0x40:
+                t[WEEKDAY] = day & 0x0f
+            else:
+                t[DAY] = _bcd2bin(day & 0x3f)
+        return t
+
+    # Status flag of an alarm; pass value=0 to clear it
+    def alarm(self, value=None, alarm=0):
+        return self._flag(_STATUS, 1 << alarm, value)
+
+    def control(self):
+        return self._get(_CONTROL)
+
+    # Route an alarm to the INT pin (INTCN and AxIE)
+    def interrupt(self, alarm=0):
+        return self._flag(_CONTROL, _INTCN | (1 << alarm), 1)
+
+    # True if an alarm is routed to the INT pin
+    def interrupt_enabled(self, alarm=0):
+        return self._flag(_CONTROL, 1 << alarm)
+
+    def no_interrupt(self):
+        return self._flag(_CONTROL, _AIE, 0)
+
+    def no_alarmflag(self):
+        return self._flag(_STATUS, _AF, 0)
+
+    # Aging offset register, signed; one LSB is about 0.1 ppm and positive values
+    #   slow the oscillator
+    def aging(self, value=None):
+        if value is None:
+            value = self._get(_AGING)
+            return value - 256 if value & 0x80 else value
+        self._set(_AGING, value & 0xff)
+
+    # Temperature ############################################################
+
+    # Temperature in quarter degrees Celsius (updated by the DS3231 every 64 s)
+    def temperature_q(self):
+        if not self._loaded:
+            self.i2c.readfrom_mem_into(self.address, _TEMPERATURE, self._temperature)
+        q = self._regs[_TEMPERATURE] << 2 | self._regs[_TEMPERATURE + 1] >> 6
+        return q - 1024 if q & 0x200 else q
+
+    def temperature(self):
+        return self.temperature_q() * 0.25
+
+    # Measure the GPy RTC against the DS3231 for 'runtime' seconds.  Returns the
+    #   amount by which the DS3231 leads the RTC in ppm, or seconds per year.
+    #   Both ends of the measurement are taken on DS3231 one-second transitions and
+    #   the RTC is read with its microseconds, so a 10 minute run resolves about
+    #   0.01 ppm; the DS3231 itself is only good for +-2 ppm over 0-40 C.
+    def rtc_test(self, runtime=600, ppm=False, verbose=True):
+        import machine
+        import utime
+        try:
+            rtc = machine.RTC()
+        except AttributeError:
+            raise RuntimeError('machine.RTC does not exist')
+        verbose and print('Waiting {} minutes for result'.format(runtime // 60))
+        factor = 1000000 if ppm else 31536000    # seconds per year
+        t = self.new_datetime()
+
+        def mark():
+            self.await_transition(t)
+            now = rtc.now()                     # (y, m, d, h, m, s, us, tz)
+            rtc_us = utime.mktime(now[:6] + (0, 0)) * 1000000 + now[6]
+            ds_us = utime.mktime((t[YEAR], t[MONTH], t[DAY], t[HOUR], t[MINUTE], t[SECOND], 0, 0)) * 1000000
+            return ds_us, rtc_us
+
+        ds_start, rtc_start = mark()
+        utime.sleep(runtime)
+        ds_end, rtc_end = mark()
+
+        d_ds3231 = ds_end - ds_start
+        d_rtc = rtc_end - rtc_start
+        ratio = (d_ds3231 - d_rtc) / d_ds3231
+        verbose and print('DS3231 leads RTC by {:4.1f}ppm {:4.1f}mins/yr'.format(ratio * 1000000,
+                                                                                ratio * 525600))
+        return ratio * factor
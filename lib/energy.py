@@ -0,0 +1,137 @@
+# energy.py  Modelled charge drawn per wake phase.
+#
+# main.py marks where each phase of a wake begins with phase(); the time spent
+# in each is multiplied by the current the powered parts draw in it (PHASE_UA,
+# built from the per-part table below) to estimate the charge of the wake.
+# finish() adds the deep sleep that follows, keeps the running total in the
+# wake state (lib/state.py) and returns the wake's charge:
+#
+#   en_tot  charge since the counters were cleared (uAh)    en_wake  wakes counted
+#   en_last charge of the last wake (uAh)
+#
+# Time spent while WiFi is up (wifi()) is charged from PHASE_UA_WIFI instead;
+# the network phases then mean association, DHCP and WiFi traffic.  A wake that
+# tries WiFi and falls back to LTE pays each radio's currents for its own time.
+#
+# bench/sim_energy.py feeds the same table with modelled phase durations through
+# record(), so configurations can be compared offline.  The currents are typical
+# datasheet and bench figures at the 3.3-3.6 V rail; correct them from a
+# measurement of a real station.
+
+from array import array
+import utime
+import state
+
+# Current per part and state (uA)
+GPY_ACTIVE_UA = 45000       # ESP32 running, WiFi off
+GPY_SLEEP_UA = 25           # Deep sleep, modem off
+LTE_ATTACH_UA = 110000      # Cell search and attach (average of the bursts)
+LTE_IDLE_UA = 35000         # Attached or connected, no traffic
+LTE_TX_UA = 190000          # Uploading
+WIFI_CONNECT_UA = 120000    # WiFi station: scan, association and DHCP
+WIFI_IDLE_UA = 30000        # Associated, power save, no traffic
+WIFI_TX_UA = 150000         # Uploading
+CAM_ACTIVE_UA = 160000      # ESP32-CAM boot, capture and UART transfer, flash off
+DIVIDER_UA = 18             # Battery divider while enabled
+DS3231_UA = 110             # On the 3.3 V rail, awake or asleep
+
+# Phases
+BOOT = 0
+ATTACH = 1
+CONNECT = 2
+NET = 3                     # Connected between transfers: NTP, DNS, waiting
+CAMERA = 4
+UPLOAD = 5
+SHUTDOWN = 6
+SLEEP = 7
+PHASES = 8
+NAMES = ('boot', 'attach', 'connect', 'net', 'camera', 'upload', 'shutdown', 'sleep')
+
+PHASE_UA = (GPY_ACTIVE_UA + DIVIDER_UA + DS3231_UA,                 # Boot (battery sampling)
+            GPY_ACTIVE_UA + LTE_ATTACH_UA + DIVIDER_UA + DS3231_UA,
+            GPY_ACTIVE_UA + LTE_ATTACH_UA + DS3231_UA,
+            GPY_ACTIVE_UA + LTE_IDLE_UA + DS3231_UA,
+            GPY_ACTIVE_UA + LTE_IDLE_UA + CAM_ACTIVE_UA + DS3231_UA,   # The modem stays connected
+            GPY_ACTIVE_UA + LTE_TX_UA + DS3231_UA,
+            GPY_ACTIVE_UA + DS3231_UA,
+            GPY_SLEEP_UA + DS3231_UA)
+PHASE_UA_WIFI = (PHASE_UA[BOOT],
+                 GPY_ACTIVE_UA + WIFI_CONNECT_UA + DIVIDER_UA + DS3231_UA,
+                 GPY_ACTIVE_UA + WIFI_CONNECT_UA + DS3231_UA,
+                 GPY_ACTIVE_UA + WIFI_IDLE_UA + DS3231_UA,
+                 GPY_ACTIVE_UA + WIFI_IDLE_UA + CAM_ACTIVE_UA + DS3231_UA,
+                 GPY_ACTIVE_UA + WIFI_TX_UA + DS3231_UA,
+                 PHASE_UA[SHUTDOWN],
+                 PHASE_UA[SLEEP])
+
+_ms = array('i', [0] * PHASES)     # Time spent in each phase this wake
+_wifi_ms = array('i', [0] * PHASES)    # The part of it spent with WiFi up
+_phase = BOOT
+_since = 0                  # Boot began at ticks_ms() 0
+_table = PHASE_UA
+
+
+# Enter phase 'p'; the current phase ends now
+def phase(p):
+    global _phase, _since
+    now = utime.ticks_ms()
+    record(_phase, utime.ticks_diff(now, _since))
+    _phase, _since = p, now
+
+
+# Add 'ms' spent in phase 'p' (the host simulator drives this directly)
+def record(p, ms):
+    _ms[p] += ms
+    if _table is PHASE_UA_WIFI:
+        _wifi_ms[p] += ms
+
+
+# Charge from now on from the WiFi currents (True) or the LTE ones (False); the
+#   time already spent keeps the currents it was spent at
+def wifi(on):
+    global _table
+    phase(_phase)
+    _table = PHASE_UA_WIFI if on else PHASE_UA
+
+
+# Charge of phase 'p' so far this wake (uAh)
+def charge_uah(p):
+    return (PHASE_UA[p] * (_ms[p] - _wifi_ms[p]) + PHASE_UA_WIFI[p] * _wifi_ms[p]) // 3600000
+
+
+# Close the wake: 'sleep_min' of deep sleep follow.  Updates the stored totals and
+#   returns the charge of the wake (uAh), sleep included.
+def finish(sleep_min):
+    phase(SLEEP)
+    total = _table[SLEEP] * sleep_min // 60
+    for p in range(SLEEP):
+        total += charge_uah(p)
+    state.put('en_tot', state.get('en_tot') + total)
+    state.put('en_wake', state.get('en_wake') + 1)
+    state.put('en_last', total)
+    return total
+
+
+# Time spent in phase 'p' so far this wake (ms)
+def ms(p):
+    return _ms[p]
+
+
+# (phase, ms, uAh) for the phases of this wake that took any time
+def phases():
+    for p in range(SLEEP):
+        if _ms[p]:
+            yield p, _ms[p], charge_uah(p)
+
+
+# Start a new wake now, in BOOT
+def reset():
+    global _phase, _since
+    for p in range(PHASES):
+        _ms[p] = _wifi_ms[p] = 0
+    _phase, _since = BOOT, utime.ticks_ms()
+    wifi(False)
+
+
+def total_uah():
+    return state.get('en_tot')
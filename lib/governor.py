@@ -0,0 +1,81 @@
+# governor.py  Chooses what a wake may do from the battery, temperature and energy budget.
+#
+# Modes, cheapest first:
+#
+#   SKIP        no network, no camera; the next capture is STRETCH_MIN away
+#   TELEMETRY   attach and send the event log, no camera
+#   REDUCED     capture at the camera's reduced frame size and upload it
+#   FULL        the full capture and upload
+#
+# A mode needs the battery at or above its threshold in MODE_MV.  Cold raises the
+# internal resistance of the LiFePO4 cells and the LTE transmit bursts pull the
+# voltage down further, so below COLD_C each degree counts as COLD_MV_PER_C less;
+# below MIN_TX_C the radio is not used at all.
+#
+# The energy budget is a bucket in the wake state (lib/state.py) that fills at
+# DAILY_UAH (the pack capacity spread over the target lifetime), holds at most
+# BUCKET_UAH and is drawn down by every wake.  A mode also needs its cost (COST_UAH) in the bucket,
+# so a run of expensive wakes makes the following ones cheaper however good the
+# battery looks.  Only a DS3231 time known to be good refills it: after the
+# clock lost power it reads year 2000 until the wake sets it.
+#
+#   gv_bud  budget (uAh)    gv_t  DS3231 time of the last refill (s)    gv_mv  last battery reading (mV)
+
+import state
+
+SKIP = 0
+TELEMETRY = 1
+REDUCED = 2
+FULL = 3
+
+MODE_MV = (0, 6100, 6250, 6400)     # Battery needed for each mode
+COST_UAH = (50, 2000, 3500, 5000)   # Estimated charge per wake in each mode
+CAPACITY_MAH = 3000
+LIFETIME_DAYS = 180
+DAILY_UAH = CAPACITY_MAH * 1000 // LIFETIME_DAYS
+BUCKET_UAH = 2 * DAILY_UAH
+COLD_C = 10
+COLD_MV_PER_C = 4
+MIN_TX_C = -20
+STRETCH_MIN = 1440          # Next capture after a skipped wake
+
+
+# Fill the bucket up to DS3231 time 'now' (s); returns the budget in uAh.  With 'now'
+#   None (the DS3231 time is not valid) the bucket and its time stay as they are, and
+#   the next refill at a valid time covers the gap.
+def refill(now=None):
+    budget = state.get('gv_bud', BUCKET_UAH)
+    if now is None:
+        return budget
+    last = state.get('gv_t')
+    if last and now > last:
+        budget = min(BUCKET_UAH, budget + (now - last) * DAILY_UAH // 86400)
+    state.put('gv_t', now)
+    state.put('gv_bud', budget)
+    return budget
+
+
+def spend(uah):
+    state.put('gv_bud', state.get('gv_bud', BUCKET_UAH) - uah)
+
+
+def last_mv():
+    return state.get('gv_mv', MODE_MV[FULL])
+
+
+def remember_mv(mv):
+    state.put('gv_mv', mv)
+
+
+# Most capable mode the battery ('vbat_mv'), the DS3231 temperature ('temp_q',
+#   quarter degrees C) and 'budget' (uAh) allow; at most TELEMETRY when 'telemetry_only'
+def decide(vbat_mv, temp_q, budget, telemetry_only=False):
+    temp_c = temp_q // 4
+    if temp_c < MIN_TX_C:
+        return SKIP
+    if temp_c < COLD_C:
+        vbat_mv -= (COLD_C - temp_c) * COLD_MV_PER_C
+    mode = TELEMETRY if telemetry_only else FULL
+    while mode > SKIP and (vbat_mv < MODE_MV[mode] or budget < COST_UAH[mode]):
+        mode -= 1
+    return mode
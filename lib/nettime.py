@@ -0,0 +1,93 @@
+# nettime.py  Network time (NITZ) from the LTE modem as a DS3231 time source.
+#
+# The network sends its time (NITZ) while the GPy attaches and the modem keeps it
+# running in its clock, read with AT+CCLK? - no data session, DNS lookup or round
+# trip needed.  The reply is local time in whole seconds with the time zone in
+# quarter hours:
+#
+#   +CCLK: "21/09/29,12:34:56+08"
+#
+# so it is good to about a second, not to the milliseconds of NTP.  It sets the
+# DS3231 when the DS3231 time is invalid (oscillator stopped or a year before
+# MIN_YEAR); otherwise it only checks the DS3231, and one more than TOLERANCE_S
+# off is left for NTP to settle.  A modem that has no network time reports a
+# year before MIN_YEAR, which is rejected.
+
+import utime
+from ds3231 import YEAR, MONTH, DAY, WEEKDAY, HOUR, MINUTE, SECOND
+
+MIN_YEAR = 2021
+TOLERANCE_S = 2             # The DS3231 agrees with the network time within this
+_MID_MS = 500               # The modem second is half over this long after the reply
+
+
+# Let the modem take the network time into its clock.  Call before attaching.
+def enable(lte):
+    try:
+        lte.send_at_cmd('AT+CTZU=1')
+    except OSError:
+        pass
+
+
+# Network time in seconds (UTC, utime epoch) from a +CCLK reply, or None
+def parse(reply):
+    i = reply.find('+CCLK: "')
+    if i < 0:
+        return None
+    s = reply[i + 8:i + 30]
+    end = s.find('"')
+    if end < 17 or s[2] != '/' or s[8] != ',' or s[11] != ':':
+        return None
+    try:
+        year = int(s[0:2])
+        month = int(s[3:5])
+        day = int(s[6:8])
+        hour = int(s[9:11])
+        minute = int(s[12:14])
+        second = int(s[15:17])
+        zone = int(s[17:end]) if end > 17 else 0    # Quarter hours east of UTC
+    except ValueError:
+        return None
+    year += 2000 if year < 70 else 1900     # Modems without network time count from 1970 or 1980
+    if year < MIN_YEAR or not (1 <= month <= 12 and 1 <= day <= 31 and hour < 24 and minute < 60 and second < 60):
+        return None
+    return utime.mktime((year, month, day, hour, minute, second, 0, 0)) - zone * 900
+
+
+# Returns (network time in seconds, ticks_ms of the reply) or None
+def read(lte):
+    try:
+        reply = lte.send_at_cmd('AT+CCLK?')
+    except OSError:
+        return None
+    tick = utime.ticks_ms()
+    seconds = parse(reply)
+    if seconds is None:
+        return None
+    return seconds, tick
+
+
+# Check the DS3231 'rtc' against the network time and set it when its time is
+#   invalid.  't' is a DS3231 date/time list, reused.  Returns None when the modem
+#   has no network time, else (error_s, written): the DS3231 minus network time
+#   and whether the DS3231 was written.
+def check(rtc, t, lte):
+    net = read(lte)
+    if net is None:
+        return None
+    seconds, tick = net
+    rtc.datetime_into(t)
+    error_s = utime.mktime((t[YEAR], t[MONTH], t[DAY], t[HOUR], t[MINUTE], t[SECOND], 0, 0)) - seconds
+    if t[YEAR] >= MIN_YEAR and not rtc.lost_power():
+        return error_s, False
+
+    # The modem second began up to a second before the reply.  Write the next second
+    #   when this one is half over, which centres the error on zero.
+    tm = utime.localtime(seconds + 1)
+    t[YEAR], t[MONTH], t[DAY], t[HOUR], t[MINUTE], t[SECOND] = tm[0], tm[1], tm[2], tm[3], tm[4], tm[5]
+    t[WEEKDAY] = tm[6] + 1              # DS3231 weekday 1-7
+    wait = _MID_MS - utime.ticks_diff(utime.ticks_ms(), tick)
+    if wait > 0:
+        utime.sleep_ms(wait)
+    rtc.set_datetime(t)
+    return error_s, True
@@ -0,0 +1,117 @@
+# picture.py  Capture-to-upload path for pictures sent by the ESP32-CAM.
+#
+# The phases (UART receive, HTTP upload; the Base64 encode in between is
+# base64.b64encode_into()) work on caller supplied buffers so that main.py can
+# run them out of the boot-time BufferPool (bufpool.wake_slots()) and
+# bench/bench_pipeline.py can run the same code on the host.
+#
+# Camera protocol (host/esp32cam_emu.py plays the camera side on a pty):
+#   GPy: 'Hello\0' every 200 ms until   CAM: 'ready'
+#   GPy: '<filename>\0'                 CAM: '<length>\r\n' followed by <length> JPEG bytes
+# A filename ending in REDUCED_SUFFIX asks for the reduced frame size; camera
+# firmware that does not know it just keeps the name.
+
+import utime
+
+HELLO_TRIES = 60        # 'Hello' attempts (200 ms apart) before giving up on the camera
+LENGTH_TIMEOUT_MS = 5000
+REDUCED_SUFFIX = '_r'
+REPLY_TIMEOUT_S = 60    # Wait for the server's reply to a post; the sends keep the caller's timeout
+STALL_MS = 5000         # Give up on a transfer when no byte arrives for this long
+
+
+# Greet the camera, send the picture filename and read the picture length.
+#   Returns (hello tries, picture length); the length is 0 if the camera did not answer.
+def handshake(uart, filename, tries=HELLO_TRIES, timeout_ms=LENGTH_TIMEOUT_MS):
+    # Transmit 'Hello' until 'ready' is received
+    hello_try = 0
+    while True:
+        if hello_try == tries:
+            return hello_try, 0
+        hello_try += 1
+        uart.write('Hello\0')
+        utime.sleep_ms(200)
+        if uart.readline() == b'ready':
+            break
+
+    # Send the picture filename.  The ESP32-CAM uses it for the SD-Card filename.
+    utime.sleep_ms(200)
+    uart.write(filename)
+
+    # Read the picture length line, e.g. b'48213\r\n'
+    line = b''
+    start = utime.ticks_ms()
+    while utime.ticks_diff(utime.ticks_ms(), start) < timeout_ms:
+        part = uart.readline()
+        if part:
+            line += part
+            if line.endswith(b'\n'):
+                break
+    try:
+        return hello_try, int(line.strip())
+    except ValueError:
+        return hello_try, 0
+
+
+# Read 'length' picture bytes from the UART into buf.  Returns the number of bytes read,
+#   which is short of 'length' if the camera stalls for more than stall_ms.
+def receive(uart, buf, length, stall_ms=STALL_MS):
+    mv = memoryview(buf)
+    idx = 0
+    last = utime.ticks_ms()
+    while idx < length:
+        if uart.any():
+            bytes_read = uart.readinto(mv[idx:length])
+            if bytes_read:
+                idx += bytes_read
+                last = utime.ticks_ms()
+        elif utime.ticks_diff(utime.ticks_ms(), last) > stall_ms:
+            break
+    return idx
+
+
+# The JSON body is sent in three pieces so that the Base64 text is never copied
+#   into a str:  prefix + base64 + suffix
+def json_parts(voltage_level, station_id, time_stamp):
+    prefix = "{\"voltage\": " + voltage_level + ",\"base64File\": \""
+    suffix = "\", \"id\": " + station_id + ", \"timeStamp\": \"" + time_stamp + "\"}"
+    return prefix.encode(), suffix.encode()
+
+
+_HEADERS = """\
+POST /file/base64 HTTP/1.1\r
+Content-Type: {content_type}\r
+Content-Length: {content_length}\r
+Host: {host}\r
+{key}Connection: close\r
+\r\n"""
+
+
+# POST prefix + body + suffix on a connected socket and read the reply into reply_buf,
+#   waiting up to 'reply_timeout' (s) for it.  'key' (upload.key()) goes out as the
+#   Idempotency-Key header.
+#   Returns (bytes sent, reply length, ms the sends took); the length is 0 if the reply
+#   does not come (OSError, e.g. a timeout), an error while sending is raised.  The send
+#   time leaves out the reply wait, so it measures the link.
+def post(s, host, port, prefix, body, suffix, reply_buf, key=None, reply_timeout=REPLY_TIMEOUT_S):
+    content_length = len(prefix) + len(body) + len(suffix)
+    header_bytes = _HEADERS.format(
+        content_type="application/json",
+        content_length=content_length,
+        host=str(host) + ":" + str(port),
+        key="Idempotency-Key: " + key + "\r\n" if key else ""
+    ).encode('iso-8859-1')
+
+    start = utime.ticks_ms()
+    s.sendall(header_bytes)
+    s.sendall(prefix)
+    s.sendall(body)
+    s.sendall(suffix)
+    send_ms = utime.ticks_diff(utime.ticks_ms(), start)
+
+    s.settimeout(reply_timeout)
+    try:
+        n = s.readinto(reply_buf)  # The data that the server returns (the server closes the connection)
+    except OSError:
+        n = 0                   # Sent in full all the same
+    return len(header_bytes) + content_length, n or 0, send_ms
@@ -0,0 +1,59 @@
+# power.py  Deep sleep between wakes.
+#
+# Between wakes the GPy sleeps in machine.deepsleep() with everything off: the
+# LTE modem, the camera UART, the I2C bus and the battery divider (its enable pin
+# is held low through the sleep).  The DS3231 alarm pulls INT, wired to P22, low
+# and machine.pin_sleep_wakeup() wakes the GPy on it.  The deep sleep timer is a
+# safety net set SAFETY_MIN past the programmed alarm, so a DS3231 that misses its
+# alarm costs one late wake instead of a dead station.
+#
+# Every wake is counted by reason in the wake state (lib/state.py):
+#
+#   pw_power  power-on or reset    pw_timer  safety timer (the DS3231 alarm was missed)
+#   pw_pin    DS3231 alarm         pw_other  anything else
+
+import machine
+import state
+
+WAKE_PIN = 'P22'
+SAFETY_MIN = 15             # Timer wake this long after the expected DS3231 alarm
+
+# Wake reasons
+POWER_ON = 0
+PIN = 1
+TIMER = 2
+OTHER = 3
+
+_COUNTERS = ('pw_power', 'pw_pin', 'pw_timer', 'pw_other')
+
+
+# Why the GPy is running.  Counts the wake; returns (reason, count so far)
+def wake():
+    cause = machine.wake_reason()[0]
+    if cause == machine.PIN_WAKE:
+        reason = PIN
+    elif cause == machine.RTC_WAKE:
+        reason = TIMER
+    elif cause == machine.PWRON_WAKE:
+        reason = POWER_ON
+    else:
+        reason = OTHER
+    count = state.get(_COUNTERS[reason]) + 1
+    state.put(_COUNTERS[reason], count)
+    return reason, count
+
+
+# Call deinit() on each of 'devices' (LTE, UART, I2C, ...), drive each of 'pins_low'
+#   low and hold it there, then deep sleep until P22 goes low or 'minutes' plus
+#   SAFETY_MIN pass.  Does not return; the GPy boots again on wake.
+def sleep(minutes, devices=(), pins_low=()):
+    for device in devices:
+        try:
+            device.deinit()
+        except OSError:
+            pass                    # Already off
+    for pin in pins_low:
+        pin.value(0)
+        pin.hold(True)
+    machine.pin_sleep_wakeup([WAKE_PIN], machine.WAKEUP_ALL_LOW, False)
+    machine.deepsleep((minutes + SAFETY_MIN) * 60000)
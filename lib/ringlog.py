@@ -0,0 +1,216 @@
+# ringlog.py  Compact binary event log for the GPy water meter.
+#
+# Every record is 12 bytes: ticks_ms (u32), level (u8), event (u8), a (i16), b (i32).
+# Records are packed into a RAM ring that is allocated once at import, so logging
+# never touches the heap and never blocks on the REPL UART.  The ring is appended
+# to flash in one block write when it fills or when flush() is called, and the
+# flash files (the one rotated out first) can be uploaded after the picture with
+# upload() and removed with discard() once the server has answered.
+#
+# Only debug builds (CONSOLE = 1) echo records to the serial console.
+
+import os
+import ustruct
+import utime
+from micropython import const
+
+# Levels
+ERROR = const(0)
+WARN = const(1)
+INFO = const(2)
+DEBUG = const(3)
+
+# Build-time filter.  Records above LEVEL are discarded before they reach the ring.
+LEVEL = const(2)
+
+# Debug builds: set to 1 to echo every record to the serial console
+CONSOLE = const(0)
+
+LOG_FILE = '/flash/log.bin'
+LOG_FILE_OLD = '/flash/log.old'
+LOG_FILE_MAX = const(32768)    # Rotate the log file above this size (bytes)
+
+_RECORD = '<IBBhi'
+_RECORD_SIZE = const(12)
+_RING_RECORDS = const(64)
+
+# Event codes.  Keep EVENT_NAMES in step; the decoder and the console echo use it.
+#   It is indexed by code, so a retired code keeps its name.
+EV_BOOT = const(1)          # a: reset cause             b: ticks_ms at boot
+EV_RTC_TIME = const(2)      # a: 0 startup, 1 after sync b: DS3231 time (utime.mktime seconds)
+EV_ALARM = const(3)         # a: alarm (0/1)             b: hour * 60 + minute
+EV_VBAT = const(4)          # a: ADC count (trimmed mean) b: battery mV
+EV_LTE_ATTACH = const(5)    # a: attach try              b: 1 attached, 0 failed
+EV_LTE_FSM = const(6)       # a: attach try              b: poll attempt
+EV_LTE_CONNECT = const(7)   # a: connect try             b: 1 connected, 0 failed
+EV_NTP = const(8)           # a: servers that answered   b: round-trip delay of the sample used (ms)
+EV_CAM_TRIGGER = const(9)   # a: 0                       b: ticks_ms
+# 10: cam_reply, retired (older logs only); EV_CAM_READY reports the handshake
+EV_CAM_READY = const(11)    # a: handshake tries         b: picture length (0: no answer)
+EV_PIC_LEN = const(12)      # a: 0                       b: picture length announced
+EV_PIC_RX = const(13)       # a: 0 complete, 1 stalled   b: bytes received
+EV_UPLOAD = const(14)       # a: attempts                b: bytes sent
+EV_NET_DOWN = const(15)     # a: transport.WIFI, LTE     b: 0
+EV_SHUTDOWN = const(16)     # a: 0                       b: ticks_ms
+EV_LOG_UPLOAD = const(17)   # a: HTTP status of the reply (0: none)  b: bytes sent
+EV_POOL = const(18)         # a: buffer pool slot        b: high-water mark (bytes)
+EV_POOL_MISS = const(19)    # a: buffer pool slot        b: requests that fell back to the allocator
+EV_CLOCK_ERROR = const(20)  # a: 1 DS3231 written, 0 not b: DS3231 minus NTP time before the sync (ms)
+EV_CLOCK_PREDICT = const(21)  # a: 1 sync due, 0 not    b: predicted DS3231 error (ms, 0 without a model)
+EV_DRIFT = const(22)        # a: aging LSBs applied      b: DS3231 drift rate (ppb, 0 before a fit)
+EV_NET_TIME = const(23)     # a: 0 none, 1 agrees, 2 set, 3 disagrees  b: DS3231 minus network time (s)
+EV_WAKE = const(24)         # a: 0 power-on/reset, 1 capture (Alarm 1), 2 telemetry (Alarm 2)  b: 0
+EV_CADENCE = const(25)      # a: 0 hold, 1 slower, 2 faster, 3 battery  b: next capture interval (min)
+EV_CHANGE = const(26)       # a: 0                       b: picture size change (permille)
+EV_POWER = const(27)        # a: wake reason (power.POWER_ON, PIN, TIMER, OTHER)  b: wakes for that reason
+EV_SLEEP = const(28)        # a: minutes to the next alarm  b: deep sleep safety timer (s)
+EV_TEMP = const(29)         # a: 0                       b: DS3231 temperature (quarter degrees C)
+EV_GOVERNOR = const(30)     # a: mode (governor.SKIP, TELEMETRY, REDUCED, FULL)  b: energy budget (uAh)
+EV_ENERGY = const(31)       # a: energy phase (energy.PHASES: the whole wake with its sleep)  b: charge (uAh)
+EV_ENERGY_TOTAL = const(32)  # a: 0                      b: charge since the counters were cleared (mAh)
+EV_STATE = const(33)        # a: state.LOADED, NEW, CORRUPT  b: record length (bytes)
+EV_STATE_COMMIT = const(34)  # a: 0 ok, 1 flash error   b: record bytes written (0: unchanged)
+EV_MEM = const(35)          # a: 0 after the imports     b: gc.mem_free() (bytes)
+EV_TELEMETRY = const(36)    # a: telemetry records sent  b: HTTP status of the reply (0: none)
+EV_TELEMETRY_REC = const(37)  # a: 0                     b: telemetry records waiting for the upload
+EV_LINK = const(38)         # a: transport.WIFI, LTE (-1: none came up)  b: time taken, failed links included (ms)
+EV_WIFI = const(39)         # a: 1 associated, 0 failed  b: time taken (ms)
+EV_UPLOAD_RESULT = const(40)  # a: upload.SENT, EXISTS, REFUSED, FAILED  b: HTTP status of the last reply (0: none)
+
+EVENT_NAMES = ('none', 'boot', 'rtc_time', 'alarm', 'vbat', 'lte_attach', 'lte_fsm',
+               'lte_connect', 'ntp', 'cam_trigger', 'cam_reply', 'cam_ready', 'pic_len',
+               'pic_rx', 'upload', 'net_down', 'shutdown', 'log_upload', 'pool', 'pool_miss',
+               'clock_error', 'clock_predict', 'drift', 'net_time', 'wake', 'cadence', 'change', 'power', 'sleep', 'temp', 'governor', 'energy', 'energy_total',
+               'state', 'state_commit', 'mem',
+               'telemetry', 'telemetry_rec', 'link', 'wifi', 'upload_result')
+
+_ring = bytearray(_RING_RECORDS * _RECORD_SIZE)
+_head = 0       # Next record slot in the ring
+_count = 0      # Records waiting in the ring (oldest is _head - _count)
+
+
+def log(level, event, a=0, b=0):
+    global _head, _count
+    if level > LEVEL:
+        return
+    ustruct.pack_into(_RECORD, _ring, _head * _RECORD_SIZE,
+                      utime.ticks_ms(), level, event, a, b)
+    _head = (_head + 1) % _RING_RECORDS
+    if _count < _RING_RECORDS:
+        _count += 1
+    if CONSOLE:
+        _echo(level, event, a, b)
+    if _count == _RING_RECORDS:
+        flush()
+
+
+def error(event, a=0, b=0):
+    log(ERROR, event, a, b)
+
+
+def warn(event, a=0, b=0):
+    log(WARN, event, a, b)
+
+
+def info(event, a=0, b=0):
+    log(INFO, event, a, b)
+
+
+def debug(event, a=0, b=0):
+    log(DEBUG, event, a, b)
+
+
+# Append the ring to the flash log in (at most) two block writes.
+# If flash cannot be written the records stay in the ring and the oldest are overwritten.
+def flush():
+    global _count
+    if not _count:
+        return
+    try:
+        if os.stat(LOG_FILE)[6] > LOG_FILE_MAX:
+            try:
+                os.remove(LOG_FILE_OLD)
+            except OSError:
+                pass
+            os.rename(LOG_FILE, LOG_FILE_OLD)
+    except OSError:
+        pass            # No log file yet
+
+    mv = memoryview(_ring)
+    start = (_head - _count) % _RING_RECORDS
+    try:
+        with open(LOG_FILE, 'ab') as f:
+            if start + _count <= _RING_RECORDS:
+                f.write(mv[start * _RECORD_SIZE:(start + _count) * _RECORD_SIZE])
+            else:
+                f.write(mv[start * _RECORD_SIZE:])
+                f.write(mv[:_head * _RECORD_SIZE])
+        _count = 0
+    except OSError:
+        pass
+
+
+# Stream the flash log, the rotated-out file first, through send(memoryview) using
+# buf as the read buffer.  Returns the number of bytes sent.  The files stay until
+# discard().
+def upload(send, buf):
+    flush()
+    sent = 0
+    mv = memoryview(buf)
+    for path in (LOG_FILE_OLD, LOG_FILE):
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            continue
+        with f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                send(mv[:n])
+                sent += n
+    return sent
+
+
+# The server has the first 'sent' bytes that upload() sent: remove the files they
+# cover.  Records appended since upload() keep the current file; all of it goes
+# again next time.
+def discard(sent):
+    old = _file_size(LOG_FILE_OLD)
+    if old and sent >= old:
+        try:
+            os.remove(LOG_FILE_OLD)
+        except OSError:
+            pass
+        sent -= old
+    if sent and _file_size(LOG_FILE) == sent:
+        try:
+            os.remove(LOG_FILE)
+        except OSError:
+            pass
+
+
+def _file_size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+
+# Bytes upload() sends
+def size():
+    return _file_size(LOG_FILE_OLD) + _file_size(LOG_FILE) + _count * _RECORD_SIZE
+
+
+# Decode a block of records (e.g. a downloaded log.bin) into
+# (ticks_ms, level, event_name, a, b) tuples
+def decode(data):
+    for offset in range(0, len(data) - _RECORD_SIZE + 1, _RECORD_SIZE):
+        ticks, level, event, a, b = ustruct.unpack_from(_RECORD, data, offset)
+        name = EVENT_NAMES[event] if event < len(EVENT_NAMES) else str(event)
+        yield ticks, level, name, a, b
+
+
+def _echo(level, event, a, b):
+    print('%d %s %s %d %d' % (utime.ticks_ms(), 'EWID'[level],
+                              EVENT_NAMES[event] if event < len(EVENT_NAMES) else event, a, b))
@@ -0,0 +1,138 @@
+# schedule.py  Wake schedules for the DS3231 alarms.
+#
+# A schedule is a cron-style 'minute hour' pair of fields, in UTC:
+#
+#   '5 1/6'         01:05, 07:05, 13:05 and 19:05
+#   '0,30 8-17'     every half hour from 08:00 to 17:30
+#   '*/15 *'        every quarter hour
+#
+# A field is '*', a value or a range 'a-b', each with an optional step '/s' ('a/s'
+# runs to the end of the field), or a comma-separated list of those.  Each field is
+# compiled into a table of the next allowed value, so finding the next wake is two
+# lookups whatever the schedule.  A per-station offset (minutes) shifts every wake
+# so a fleet of stations does not reach the server at the same moment.
+#
+# Alarm 1 carries the capture schedule and Alarm 2 an optional second cadence,
+# e.g. telemetry-only wakes.  Both alarms match hour and minute daily, so every
+# wake programs the next one.
+
+from ds3231 import HOUR, MINUTE, SECOND
+
+CAPTURE = 1
+TELEMETRY = 2
+
+GUARD_MIN = 10              # Wakes closer than this to the current one are covered by it
+_NONE = 0xff
+
+_alarm = [None, None, None, None, 0, 0, 0, None]    # Reused alarm date/time list
+
+
+# Table of the next allowed value at or after each index of a field (_NONE past the
+#   last); it has one extra entry so that index 'size' reads _NONE
+def _field(text, size):
+    allowed = bytearray(size)
+    for part in text.split(','):
+        step = 1
+        stepped = '/' in part
+        if stepped:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            first, last = 0, size - 1
+        elif '-' in part:
+            first, last = part.split('-')
+            first, last = int(first), int(last)
+        else:
+            first = int(part)
+            last = size - 1 if stepped else first
+        if not 0 <= first <= last < size or step < 1:
+            raise ValueError('schedule field %r' % text)
+        for value in range(first, last + 1, step):
+            allowed[value] = 1
+
+    table = bytearray(size + 1)
+    nxt = table[size] = _NONE
+    for value in range(size - 1, -1, -1):
+        if allowed[value]:
+            nxt = value
+        table[value] = nxt
+    return table
+
+
+class Schedule:
+    def __init__(self, spec, offset=0):
+        fields = spec.split()
+        if len(fields) != 2:
+            raise ValueError('schedule %r: expected "minute hour"' % spec)
+        self._minutes = _field(fields[0], 60)
+        self._hours = _field(fields[1], 24)
+        self.offset = offset % 1440
+
+        # Largest gap between consecutive slots (minutes)
+        first = slot = self.next(0)[0]
+        self.gap = 0
+        while slot < first + 1440:
+            _, wait = self.next(slot % 1440)
+            self.gap = max(self.gap, wait)
+            slot += wait
+
+    # First slot at or after minute of the day 'x' (unshifted); past 1439 on the next day
+    def _at_or_after(self, x):
+        hours, minutes = self._hours, self._minutes
+        h, m = divmod(x, 60)
+        if hours[h] == h:
+            nm = minutes[m]
+            if nm != _NONE:
+                return h * 60 + nm
+        nh = hours[h + 1]
+        if nh != _NONE:
+            return nh * 60 + minutes[0]
+        return 1440 + hours[0] * 60 + minutes[0]
+
+    # Next wake more than 'guard' minutes after minute of the day 'now'.
+    #   Returns (minute of the day of the wake, minutes from now)
+    def next(self, now, guard=0):
+        start = (now + guard + 1 - self.offset) % 1440
+        wait = self._at_or_after(start) - start + guard + 1
+        return (now + wait) % 1440, wait
+
+
+# What woke the GPy: CAPTURE (Alarm 1), TELEMETRY (Alarm 2 only) or 0 (power-on or
+#   reset).  Read it before program() clears the flags.  A2F of an Alarm 2 that
+#   program() left off (an old match still in its registers) does not count.
+def wake_reason(rtc):
+    if rtc.alarm(alarm=0):
+        return CAPTURE
+    if rtc.alarm(alarm=1) and rtc.interrupt_enabled(alarm=1):
+        return TELEMETRY
+    return 0
+
+
+# Program the next wakes after DS3231 time 't' and route them to the INT pin, clearing
+#   both alarm flags.  The capture wake is at least 'interval' minutes after the last
+#   capture, 'since' minutes ago, as far as a daily alarm allows (a day less the
+#   largest gap of the capture schedule).  Load the
+#   DS3231 registers first and commit them after.  Alarm 2 stays off without a
+#   telemetry schedule and when the telemetry wake falls on the capture wake, which
+#   sends the telemetry anyway.
+#   Returns (capture wake, telemetry wake or -1) as minutes of the day.
+def program(rtc, t, capture, telemetry=None, guard=GUARD_MIN, interval=0, since=0):
+    now = t[HOUR] * 60 + t[MINUTE]
+    rtc.no_interrupt()
+    rtc.no_alarmflag()
+
+    wake, _ = capture.next(now, max(guard, min(interval - 1, 1439 - capture.gap) - since))
+    _alarm[HOUR], _alarm[MINUTE], _alarm[SECOND] = wake // 60, wake % 60, 0
+    rtc.alarm_time(_alarm, alarm=0)
+    rtc.interrupt(alarm=0)
+
+    second = -1
+    if telemetry is not None:
+        second, _ = telemetry.next(now, guard)
+    if second >= 0 and second != wake:
+        _alarm[HOUR], _alarm[MINUTE], _alarm[SECOND] = second // 60, second % 60, None
+        rtc.alarm_time(_alarm, alarm=1)
+        rtc.interrupt(alarm=1)
+    else:
+        second = -1
+    return wake, second
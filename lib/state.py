@@ -0,0 +1,288 @@
+# state.py  Typed wake state kept across deep sleep and resets in one record.
+#
+#   import state
+#   interval = state.get('cd_iv', 360)
+#   state.put('cd_iv', 480)         # RAM only
+#   ...
+#   state.commit()                  # Once per wake, before the deep sleep
+#
+# Every value the modules keep from one wake to the next (drift model, cadence,
+# wake counters, energy budget and totals, calibration, telemetry ring position,
+# link history) is a field of FIELDS with a fixed id and a type, INT or BYTES.
+# put() only changes the copy in RAM; commit() encodes the fields that are set
+# into one record and writes it if it changed, so a wake costs one flash write
+# instead of one per put().
+#
+# Record: version (u8), length (u8), the fields, CRC-16/CCITT (u16, big endian)
+# over all that.  A field is a tag byte (id << 1 | 1 for BYTES) followed by a
+# zigzag varint for INT, or a varint length and the bytes for BYTES, so small
+# numbers take one or two bytes and unset fields none.  Fields with an unknown
+# id are skipped, so adding a field needs no new VERSION; bump it (and convert
+# in _upgrade()) only when a field changes meaning.
+#
+# The record is stored Base64 encoded as one pycom NVS string, KEY, so commit()
+# is a single NVS write; NVS replaces an item atomically, so a reset during the
+# commit leaves the old record or the new one.  A record whose CRC fails, or
+# whose fields run past its length, is dropped (load() returns CORRUPT and the
+# fields start unset).  Where NVS does
+# not take strings (older firmware) or there is no pycom module (the unix port)
+# the record goes to a flash file, FILE, replaced through a rename.
+
+import os
+import binascii
+
+VERSION = 1
+MAX_BYTES = 192             # Largest record
+KEY = 'st'
+FILE = '/flash/state.bin'
+
+# Field types
+INT = 0
+BYTES = 1
+
+# name: (id, type).  Never reuse the id of a removed field.
+FIELDS = {
+    'dr_t': (1, INT),       # drift.py
+    'dr_r': (2, INT),
+    'dr_se': (3, INT),
+    'dr_sd': (4, INT),
+    'cd_iv': (5, INT),      # cadence.py
+    'cd_len': (6, INT),
+    'pw_power': (7, INT),   # power.py
+    'pw_pin': (8, INT),
+    'pw_timer': (9, INT),
+    'pw_other': (10, INT),
+    'bt_vref': (11, INT),   # battery.py
+    'bt_gain': (12, INT),
+    'bt_off': (13, INT),
+    'gv_bud': (14, INT),    # governor.py
+    'gv_t': (15, INT),
+    'gv_mv': (16, INT),
+    'en_tot': (17, INT),    # energy.py
+    'en_wake': (18, INT),
+    'en_last': (19, INT),
+    'tr_head': (20, INT),   # telering.py
+    'tr_n': (21, INT),
+    'tp_wms': (22, INT),    # transport.py
+    'tp_wbps': (23, INT),
+    'tp_wup': (24, INT),
+    'tp_wfail': (25, INT),
+    'tp_lms': (26, INT),
+    'tp_lbps': (27, INT),
+    'tp_lup': (28, INT),
+    'tp_lfail': (29, INT),
+    'cd_at': (30, INT),     # cadence.py
+}
+_NAMES = {}                 # id: name
+for _name in FIELDS:
+    _NAMES[FIELDS[_name][0]] = _name
+_ORDER = [_NAMES[i] for i in sorted(_NAMES)]    # Encoding order, so equal values give equal records
+
+# load() results
+LOADED = 0
+NEW = 1                     # Nothing stored yet
+CORRUPT = 2                 # The record failed the CRC or did not decode; the fields start unset
+
+_values = None              # name: value, None until load()
+_stored = b''               # The record as last loaded or committed
+_in_file = False            # The record was loaded from FILE
+_status = NEW
+
+try:
+    import pycom
+except ImportError:
+    pycom = None            # Keep the record in FILE
+
+
+def crc16(data, n):
+    crc = 0xffff
+    for i in range(n):
+        crc ^= data[i] << 8
+        for _ in range(8):
+            crc = (crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1
+        crc &= 0xffff
+    return crc
+
+
+def _varint(out, n):
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def encode(values):
+    out = bytearray(b'\0\0')
+    out[0] = VERSION
+    for name in _ORDER:
+        if name not in values:
+            continue
+        fid, kind = FIELDS[name]
+        value = values[name]
+        out.append(fid << 1 | kind)
+        if kind == INT:
+            _varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+        else:
+            _varint(out, len(value))
+            out.extend(value)
+    if len(out) + 2 > MAX_BYTES:
+        raise ValueError('state record too long')
+    out[1] = len(out) + 2
+    crc = crc16(out, len(out))
+    out.append(crc >> 8)
+    out.append(crc & 0xff)
+    return bytes(out)
+
+
+# Fields of the record 'data' as a dict, or None if it is damaged
+def decode(data):
+    if len(data) < 4 or data[1] < 4 or data[1] > len(data):
+        return None
+    n = data[1]
+    if crc16(data, n - 2) != data[n - 2] << 8 | data[n - 1]:
+        return None
+    values = {}
+    i = 2
+    while i < n - 2:
+        tag = data[i]
+        value = shift = 0
+        i += 1
+        while True:
+            if i >= n - 2:
+                return None         # A varint running into the CRC: passed it by chance
+            b = data[i]
+            i += 1
+            value |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        if tag & 1:
+            if i + value > n - 2:
+                return None
+            value, i = bytes(data[i:i + value]), i + value
+        else:
+            value = value >> 1 if not value & 1 else -(value >> 1) - 1
+        name = _NAMES.get(tag >> 1)
+        if name is not None and FIELDS[name][1] == tag & 1:
+            values[name] = value
+    return _upgrade(data[0], values)
+
+
+# Convert the fields of a record written by schema 'version'
+def _upgrade(version, values):
+    if version != VERSION:
+        return None                 # No older schema with fields in other meanings yet
+    return values
+
+
+def _read_nvs():
+    if pycom is None:
+        return None
+    try:
+        text = pycom.nvs_get(KEY)
+    except (ValueError, OSError):
+        return None
+    if not isinstance(text, str):
+        return None
+    try:
+        return binascii.a2b_base64(text)
+    except ValueError:
+        return b''                  # Present but damaged
+
+
+def _read_file():
+    for path in (FILE, FILE + '.new'):  # A reset between the remove and the rename of commit()
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+    return None
+
+
+# Read the record into RAM; returns LOADED, NEW or CORRUPT
+def load():
+    global _values, _stored, _in_file, _status
+    _values, _stored, _in_file, _status = {}, b'', False, NEW
+    for in_file in (False, True):
+        data = _read_file() if in_file else _read_nvs()
+        if data is None:
+            continue
+        values = decode(data)
+        if values is not None:
+            _values, _stored, _in_file, _status = values, bytes(data), in_file, LOADED
+            return _status
+        _status = CORRUPT
+    return _status
+
+
+def status():
+    return _status
+
+
+# Length of the stored record (bytes)
+def size():
+    return len(_stored)
+
+
+def get(name, default=0):
+    if _values is None:
+        load()
+    return _values.get(name, default)
+
+
+def put(name, value):
+    if _values is None:
+        load()
+    if FIELDS[name][1] == INT:
+        value = int(value)
+    else:
+        value = bytes(value)
+    _values[name] = value
+
+
+# Unset field 'name': get() returns the default again
+def erase(name):
+    if _values is None:
+        load()
+    if name in _values:
+        del _values[name]
+
+
+# Write the fields if they changed since load() or the last commit.  Returns the
+#   record length written (bytes), 0 if nothing changed.  Raises OSError if the
+#   flash file cannot be written.
+def commit():
+    global _stored, _in_file, _status
+    if _values is None:
+        return 0
+    record = encode(_values)
+    if record == _stored:
+        return 0
+    in_file = True
+    if pycom is not None:
+        try:
+            pycom.nvs_set(KEY, binascii.b2a_base64(record)[:-1].decode())
+            in_file = False
+        except (TypeError, ValueError, OSError):
+            pass                    # No string values in this firmware's NVS
+    if in_file:
+        with open(FILE + '.new', 'wb') as f:
+            f.write(record)
+        try:
+            os.remove(FILE)
+        except OSError:
+            pass
+        os.rename(FILE + '.new', FILE)
+        if pycom is not None:
+            try:
+                pycom.nvs_erase(KEY)    # Would shadow the file
+            except (ValueError, OSError, KeyError):
+                pass
+    elif _in_file:
+        try:
+            os.remove(FILE)
+        except OSError:
+            pass
+    _stored, _in_file, _status = record, in_file, LOADED
+    return len(record)
@@ -0,0 +1,70 @@
+# telemetry.py  Compact binary record of one wake.
+#
+# The station's state at a wake in RECORD_SIZE bytes instead of a JSON text,
+# little endian, version 1:
+#
+#   B   version             VERSION
+#   B   flags               FLAG_IMAGE: hash and length are of a picture
+#                           FLAG_WIFI: the wake reached the server over WiFi, not LTE
+#   H   station id
+#   I   time (DS3231, utime seconds since 1970, UTC)
+#   H   battery (mV)
+#   h   DS3231 temperature (quarter degrees C)
+#   h   RSRP (dBm, 0 unknown)
+#   B   mode (governor.SKIP .. FULL)
+#   B   wake reason (schedule.wake_reason())
+#   7H  time in each wake phase up to the record (energy.BOOT .. SHUTDOWN, 10 ms units)
+#   I   picture length (bytes)
+#   8s  picture hash (the first HASH_SIZE bytes of its SHA-256)
+#
+# pack_into() writes a record into a caller buffer.  The reference server
+# (host/ref_server.py) decodes it; a new field means a new VERSION, and the
+# server keeps the layouts of the old ones.
+
+import ustruct
+import uhashlib
+from micropython import const
+
+VERSION = const(1)
+RECORD = '<BBHIHhhBB7HI8s'
+RECORD_SIZE = const(42)
+PHASES = const(7)
+HASH_SIZE = const(8)
+FLAG_IMAGE = const(0x01)
+FLAG_WIFI = const(0x02)
+_PHASE_UNIT_MS = const(10)
+
+
+# Truncated SHA-256 of a picture: HASH_SIZE bytes
+def image_hash(data):
+    return uhashlib.sha256(data).digest()[:HASH_SIZE]
+
+
+# RSRP in dBm from the modem (AT+CESQ), 0 if it does not know
+def rsrp(lte):
+    try:
+        reply = lte.send_at_cmd('AT+CESQ')
+    except OSError:
+        return 0
+    i = reply.find('+CESQ:')
+    if i < 0:
+        return 0
+    fields = reply[i + 6:].split('\r')[0].split(',')
+    try:
+        index = int(fields[5])
+    except (IndexError, ValueError):
+        return 0
+    return 0 if index == 255 else index - 141    # 0: below -140 dBm, 97: -44 dBm and above
+
+
+# Pack a record into 'buf' at 'offset'.  'phase_ms' holds PHASES times in ms,
+#   'digest' is image_hash() of the picture or None when there is none.
+def pack_into(buf, offset, station, time, vbat_mv, temp_q, rsrp_dbm, mode, wake,
+              phase_ms, length=0, digest=None, wifi=False):
+    units = [min(0xffff, ms // _PHASE_UNIT_MS) for ms in phase_ms]
+    flags = (FLAG_IMAGE if digest else 0) | (FLAG_WIFI if wifi else 0)
+    ustruct.pack_into(RECORD, buf, offset, VERSION, flags,
+                      station, time, vbat_mv, temp_q, rsrp_dbm, mode, wake,
+                      units[0], units[1], units[2], units[3], units[4], units[5], units[6],
+                      length, digest or b'\0' * HASH_SIZE)
+    return RECORD_SIZE
@@ -0,0 +1,92 @@
+# telering.py  Telemetry records of every wake, kept in flash until uploaded.
+#
+#   telering.append(record)             # Every wake, connected or not
+#   ...
+#   n = telering.upload(s.sendall, buf) # The pending records, oldest first
+#   telering.acknowledge(n)             # Once the server has them
+#
+# FILE is a ring of SLOTS fixed-size slots of telemetry.RECORD_SIZE bytes,
+# created once; append() overwrites one slot in place, so a wake costs one small
+# flash write and the file never grows.  The ring position lives in the wake
+# state (lib/state.py), committed with everything else at the end of the wake:
+#
+#   tr_head  next slot to write          tr_n  records not yet uploaded
+#
+# When more than SLOTS wakes go by without a connection the oldest records are
+# overwritten.  A reset before the commit leaves the position as it was and the
+# next wake writes the same slot again.  upload() sends the pending records as
+# one block, so a station that was offline for days catches up in one request.
+
+import state
+import telemetry
+from micropython import const
+
+FILE = '/flash/telemetry.bin'
+SLOTS = const(128)          # 5376 bytes; over four days of hourly captures and telemetry wakes
+_SIZE = telemetry.RECORD_SIZE
+
+
+def pending():
+    return state.get('tr_n')
+
+
+# Bytes upload() sends
+def size():
+    return pending() * _SIZE
+
+
+def _create():
+    empty = bytearray(_SIZE)
+    with open(FILE, 'wb') as f:
+        for _ in range(SLOTS):
+            f.write(empty)
+
+
+# Store 'record' (telemetry.RECORD_SIZE bytes) in the next slot
+def append(record):
+    head = state.get('tr_head') % SLOTS
+    try:
+        f = open(FILE, 'r+b')
+    except OSError:
+        _create()                   # First wake, or the file was lost with the records in it
+        state.put('tr_n', 0)
+        f = open(FILE, 'r+b')
+    with f:
+        f.seek(head * _SIZE)
+        f.write(record)
+    state.put('tr_head', (head + 1) % SLOTS)
+    state.put('tr_n', min(pending() + 1, SLOTS))
+
+
+# Stream the pending records, oldest first, through send(memoryview) using 'buf'
+#   (at least one record long) as the read buffer.  Returns the number of
+#   records sent; they stay pending until acknowledge().
+def upload(send, buf):
+    n = pending()
+    if not n:
+        return 0
+    per_read = len(buf) // _SIZE
+    mv = memoryview(buf)
+    slot = (state.get('tr_head') - n) % SLOTS
+    left = n
+    try:
+        f = open(FILE, 'rb')
+    except OSError:
+        state.put('tr_n', 0)        # The records are gone; append() starts a new file
+        return 0
+    with f:
+        while left:
+            count = min(left, per_read, SLOTS - slot)    # A read stops at the end of the ring
+            f.seek(slot * _SIZE)
+            length = f.readinto(mv[:count * _SIZE])
+            if length != count * _SIZE:
+                break
+            send(mv[:length])
+            slot = (slot + count) % SLOTS
+            left -= count
+    return n - left
+
+
+# The server has the 'n' oldest pending records
+def acknowledge(n):
+    state.put('tr_n', max(0, pending() - n))
@@ -0,0 +1,109 @@
+# timesync.py  Set the DS3231 from several NTP servers.
+#
+# The servers are queried together over non-blocking UDP (untplib.request_many)
+# and the reply with the lowest round-trip delay wins: its offset has the
+# smallest error bound (delay / 2).  The DS3231 phase is measured on one of its
+# seconds transitions, and the clock is only written when it is off by more
+# than SET_THRESHOLD_MS.  A write restarts the DS3231 one-second countdown, so
+# it is made on an NTP second boundary.
+#
+# The DS3231 is watched for its transition while the replies come in and then
+# until the next NTP second boundary, where a write would be made; a sync usually
+# costs the exchange plus the wait for that boundary.  Only when the DS3231 ticks
+# after the boundary does the sync fall back to DS3231.await_transition() and,
+# if the clock must be written, the boundary after it.
+
+import usocket as socket
+import utime
+import untplib
+from ds3231 import DS3231, YEAR, MONTH, DAY, WEEKDAY, HOUR, MINUTE, SECOND
+
+SERVERS = ('0.pool.ntp.org', '1.pool.ntp.org', '2.pool.ntp.org', 'time.google.com')
+TIMEOUT_MS = 500            # Wait this long for the replies
+SET_THRESHOLD_MS = 20       # Leave the DS3231 alone when it is closer than this
+_WRITE_LEAD_US = 300        # Start the time write this early; the seconds byte lands ~0.3 ms in at 100 kHz
+_SPIN_US = 2000             # Stop polling the DS3231 this long before a boundary
+
+
+# Resolve the server names; names that do not resolve are skipped
+def resolve(hosts=SERVERS, port=123):
+    addresses = []
+    for host in hosts:
+        try:
+            addresses.append(socket.getaddrinfo(host, port)[0][-1])
+        except OSError:
+            pass
+    return addresses
+
+
+def _seconds(t):
+    return utime.mktime((t[YEAR], t[MONTH], t[DAY], t[HOUR], t[MINUTE], t[SECOND], 0, 0))
+
+
+# Watches the DS3231 for a seconds transition without blocking
+class _Edge:
+    def __init__(self, rtc, t):
+        self.rtc = rtc
+        self.t = t
+        self.tick = None
+        self.second = rtc.datetime_into(t)[SECOND]
+
+    def poll(self):
+        if self.tick is None:
+            self.rtc.datetime_into(self.t)
+            if self.t[SECOND] != self.second:
+                self.tick = utime.ticks_us()
+
+    def wait(self):
+        self.rtc.await_transition(self.t)
+        self.tick = utime.ticks_us()
+
+
+# Fill 'w' with the next NTP second that is at least _SPIN_US away and return
+#   (start tick, microseconds from start until the write must begin)
+def _next_boundary(offset, t0, w):
+    now = utime.ticks_us()
+    ntp_us = offset + utime.ticks_diff(now, t0)
+    wait = 1000000 - ntp_us % 1000000 - _WRITE_LEAD_US
+    if wait < _SPIN_US:
+        wait += 1000000
+    tm = utime.localtime((ntp_us + wait + _WRITE_LEAD_US) // 1000000)
+    w[YEAR], w[MONTH], w[DAY], w[HOUR], w[MINUTE], w[SECOND] = tm[0], tm[1], tm[2], tm[3], tm[4], tm[5]
+    w[WEEKDAY] = tm[6] + 1              # DS3231 weekday 1-7
+    return now, wait
+
+
+def _spin(start, wait):
+    while utime.ticks_diff(utime.ticks_us(), start) < wait:
+        pass
+
+
+# Synchronize the DS3231 'rtc' with the servers at 'addresses'.  't' is a DS3231
+#   date/time list and 'buf' a 48-byte packet buffer, both reused.
+#   Returns None when no server answered, else (error_ms, delay_ms, replies, written):
+#   the DS3231 minus NTP time before the sync, the round-trip delay of the sample
+#   used, the number of servers that answered and whether the DS3231 was written.
+def sync(rtc, t, buf, addresses, timeout_ms=TIMEOUT_MS, threshold_ms=SET_THRESHOLD_MS):
+    edge = _Edge(rtc, t)
+    t0, samples = untplib.request_many(addresses, buf, timeout_ms, poll=edge.poll)
+    if not samples:
+        return None
+    delay, offset, _ = min(samples)
+
+    # Watch for the DS3231 transition until shortly before the next NTP second
+    w = DS3231.new_datetime()
+    start, wait = _next_boundary(offset, t0, w)
+    while edge.tick is None and utime.ticks_diff(utime.ticks_us(), start) < wait - _SPIN_US:
+        edge.poll()
+    late = edge.tick is None
+    if late:
+        edge.wait()         # The DS3231 ticks after that boundary
+    error_ms = (_seconds(t) * 1000000 - offset - utime.ticks_diff(edge.tick, t0)) // 1000
+    if -threshold_ms <= error_ms <= threshold_ms:
+        return error_ms, delay // 1000, len(samples), False
+
+    if late:
+        start, wait = _next_boundary(offset, t0, w)
+    _spin(start, wait)
+    rtc.set_datetime(w)
+    return error_ms, delay // 1000, len(samples), True
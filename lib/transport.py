@@ -0,0 +1,134 @@
+# transport.py  Choice of the network link for a wake: WiFi station or LTE.
+#
+#   links = {transport.WIFI: (wifi_up, wifi_down), transport.LTE: (lte_up, lte_down)}
+#   link, open_socket = transport.connect(links, payload, clock, 300000)
+#   s = open_socket('water.roeber.dev', 80)
+#
+# Each link is a pair of functions from main.py: up(ms) brings it up within ms
+# and returns True once sockets can be opened over it, down() turns its radio
+# off.  connect() tries the links cheapest first until one is up or the deadline
+# has passed, turns every other radio off right away and returns a socket
+# factory for the one that is up.
+#
+# A link's cost is the modelled charge (uAh, from the lib/energy.py currents) of
+# bringing it up and sending the wake's payload, from what it did before.  The
+# history lives in the wake state (lib/state.py), per link (w: WiFi, l: LTE):
+#
+#   tp_wms   time to bring it up (ms, moving average)
+#   tp_wbps  upload throughput (bytes/s, moving average of transfers of MIN_SAMPLE bytes or more)
+#   tp_wup   time it last came up (s)
+#   tp_wfail time it last failed to come up (s); it is tried last for RETRY_S after
+#
+# A link without history, or whose history is older than RETRY_S, is costed
+# from DEFAULT_MS and DEFAULT_BPS, so a link that lost out to the other is
+# measured again about once a RETRY_S.  The times come from clock(), the DS3231
+# time read again after each link is tried (LTE sets it from the network time);
+# while it is not valid (None) no history counts as recent and none is stamped.
+
+import usocket as socket
+import utime
+from micropython import const
+import energy
+import state
+
+WIFI = const(0)
+LTE = const(1)
+NAMES = ('wifi', 'lte')
+
+RETRY_S = const(86400)
+MIN_SAMPLE = const(4096)
+DEFAULT_MS = (6000, 10000)      # WiFi association and DHCP; LTE attach and data session (bench/sim_energy.py)
+DEFAULT_BPS = (50000, 30000)
+_UP_UA = (energy.GPY_ACTIVE_UA + energy.WIFI_CONNECT_UA, energy.GPY_ACTIVE_UA + energy.LTE_ATTACH_UA)
+_TX_UA = (energy.GPY_ACTIVE_UA + energy.WIFI_TX_UA, energy.GPY_ACTIVE_UA + energy.LTE_TX_UA)
+_FIELDS = (('tp_wms', 'tp_wbps', 'tp_wup', 'tp_wfail'), ('tp_lms', 'tp_lbps', 'tp_lup', 'tp_lfail'))
+
+
+def _average(name, value):
+    old = state.get(name)
+    state.put(name, value if not old else old + (value - old) // 4)
+
+
+def _recent(name, now):
+    t = state.get(name)
+    return t and now is not None and 0 <= now - t < RETRY_S
+
+
+# Time to bring 'link' up (ms) and its throughput (bytes/s) as of 'now' (s)
+def up_ms(link, now):
+    return state.get(_FIELDS[link][0]) if _recent(_FIELDS[link][2], now) else DEFAULT_MS[link]
+
+
+def throughput(link, now):
+    bps = state.get(_FIELDS[link][1])
+    return bps if bps and _recent(_FIELDS[link][2], now) else DEFAULT_BPS[link]
+
+
+# Modelled charge (uAh) of bringing 'link' up and sending 'payload' bytes over it at 'now' (s)
+def cost_uah(link, payload, now):
+    return (_UP_UA[link] * up_ms(link, now) +
+            _TX_UA[link] * (payload * 1000 // throughput(link, now))) // 3600000
+
+
+# The links of 'links', cheapest first; those that failed within RETRY_S of 'now'
+#   (s) go last.  Ties go to WiFi.
+def order(links, payload, now):
+    def key(link):
+        return (1 if _recent(_FIELDS[link][3], now) else 0, cost_uah(link, payload, now), link)
+    return sorted(links, key=key)
+
+
+# 'link' came up in 'ms' at 'now' (s, None if not known)
+def came_up(link, ms, now):
+    _average(_FIELDS[link][0], ms)
+    if now is not None:
+        state.put(_FIELDS[link][2], now)
+    state.erase(_FIELDS[link][3])
+
+
+def failed(link, now):
+    if now is not None:
+        state.put(_FIELDS[link][3], now)
+
+
+# 'nbytes' went out over 'link' in 'ms'; short transfers say more about latency than throughput
+def transferred(link, nbytes, ms):
+    if nbytes >= MIN_SAMPLE and ms > 0:
+        _average(_FIELDS[link][1], nbytes * 1000 // ms)
+
+
+# Socket factory over the link that is up: open_socket(host, port, timeout=30) returns
+#   a blocking socket connected to host:port.  Each host is resolved once.
+def sockets():
+    addresses = {}
+
+    def open_socket(host, port, timeout=30):
+        if (host, port) not in addresses:
+            addresses[(host, port)] = socket.getaddrinfo(host, port)[0][-1]
+        s = socket.socket()
+        s.setblocking(True)
+        s.settimeout(timeout)
+        s.connect(addresses[(host, port)])
+        return s
+    return open_socket
+
+
+# Bring up the cheapest link of 'links' ({link: (up, down)}) that comes up within
+#   'deadline_ms' for 'payload' bytes.  clock() returns the time (s), or None while
+#   it is not valid.  The radios of the other links are turned off.  Returns (link,
+#   socket factory), or (-1, None) if none came up.
+def connect(links, payload, clock, deadline_ms):
+    start = utime.ticks_ms()
+    chosen = -1
+    for link in order(links, payload, clock()):
+        up, down = links[link]
+        left = deadline_ms - utime.ticks_diff(utime.ticks_ms(), start)
+        if chosen < 0 and left > 0:
+            t = utime.ticks_ms()
+            if up(left):
+                came_up(link, utime.ticks_diff(utime.ticks_ms(), t), clock())
+                chosen = link
+                continue
+            failed(link, clock())
+        down()
+    return chosen, sockets() if chosen >= 0 else None
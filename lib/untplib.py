@@ -36,9 +36,18 @@ functions.
 
 
 #import datetime
-import socket
-import struct
-import time
+try:
+    import usocket as socket
+    import ustruct as struct
+    import utime as time
+except ImportError:
+    import socket
+    import struct
+    import time
+
+
+# ustruct has no struct.error; it raises ValueError or OverflowError instead
+_PACK_ERRORS = (getattr(struct, 'error', ValueError), OverflowError, ValueError)
 
 
 class NTPException(Exception):
@@ -54,8 +63,9 @@ class NTP:
     #_NTP_EPOCH = datetime.date(1900, 1, 1)
     """NTP epoch"""
     #NTP_DELTA = (_SYSTEM_EPOCH - _NTP_EPOCH).days * 24 * 3600
-    NTP_DELTA = 3155673600
-    """delta between system and NTP time"""
+    NTP_DELTA = 2208988800 if time.localtime(0)[0] == 1970 else 3155673600
+    """delta between system and NTP time (Pycom counts from 1970, other
+    MicroPython ports from 2000)"""
 
     REF_ID_TABLE = {
         "GOES":  "Geostationary Orbit Environment Satellite",
@@ -123,20 +133,38 @@ class NTP:
 class NTPPacket:
     """NTP packet class.
 
-    This represents an NTP packet.
+    This represents an NTP packet.  The packet is encoded into and decoded
+    from one preallocated 48-byte buffer with pack_into/unpack_from, and each
+    timestamp is kept as a pair of 32-bit integers, seconds (*_s) and
+    fraction (*_f), so no floats, 64-bit ints, slices or new buffers are made
+    per packet.  (Ports with 31-bit small ints, the GPy's among them, still
+    box the 32-bit values of 2**30 and up that unpack_from returns.)  The
+    *_timestamp properties give the 32.32 fixed-point value, a long int, for
+    callers outside the hot path.
     """
 
+    __slots__ = ('buf', 'leap', 'version', 'mode', 'stratum', 'poll',
+                 'precision', 'root_delay', 'root_dispersion', 'ref_id',
+                 'ref_s', 'ref_f', 'orig_s', 'orig_f', 'recv_s', 'recv_f',
+                 'tx_s', 'tx_f')
+
     _PACKET_FORMAT = "!BBBbIIIIIIIIIII"
     """packet format to pack/unpack"""
 
-    def __init__(self, version=2, mode=3, tx_timestamp=0):
+    PACKET_SIZE = 48
+    """packet size"""
+
+    def __init__(self, version=2, mode=3, tx_timestamp=0, buf=None):
         """Constructor.
 
         Parameters:
         version      -- NTP version
         mode         -- packet mode (client, server)
-        tx_timestamp -- packet transmit timestamp
+        tx_timestamp -- packet transmit timestamp (32.32 fixed point)
+        buf          -- 48-byte buffer for the encoded packet (default: a new one)
         """
+        self.buf = bytearray(NTPPacket.PACKET_SIZE) if buf is None else buf
+        """encoded packet"""
         self.leap = 0
         """leap second indicator"""
         self.version = version
@@ -150,131 +178,143 @@ class NTPPacket:
         self.precision = 0
         """precision"""
         self.root_delay = 0
-        """root delay"""
+        """root delay (16.16 fixed point seconds)"""
         self.root_dispersion = 0
-        """root dispersion"""
+        """root dispersion (16.16 fixed point seconds)"""
         self.ref_id = 0
         """reference clock identifier"""
-        self.ref_timestamp = 0
+        self.ref_s = self.ref_f = 0
         """reference timestamp"""
-        self.orig_timestamp = 0
+        self.orig_s = self.orig_f = 0
         """originate timestamp"""
-        self.recv_timestamp = 0
+        self.recv_s = self.recv_f = 0
         """receive timestamp"""
         self.tx_timestamp = tx_timestamp
         """tansmit timestamp"""
 
+    ref_timestamp = property(lambda self: _to_time(self.ref_s, self.ref_f),
+                             lambda self, t: self._set('ref', t))
+    orig_timestamp = property(lambda self: _to_time(self.orig_s, self.orig_f),
+                              lambda self, t: self._set('orig', t))
+    recv_timestamp = property(lambda self: _to_time(self.recv_s, self.recv_f),
+                              lambda self, t: self._set('recv', t))
+    tx_timestamp = property(lambda self: _to_time(self.tx_s, self.tx_f),
+                            lambda self, t: self._set('tx', t))
+
+    def _set(self, name, timestamp):
+        setattr(self, name + '_s', _to_int(timestamp))
+        setattr(self, name + '_f', _to_frac(timestamp))
+
     def to_data(self):
-        """Convert this NTPPacket to a buffer that can be sent over a socket.
+        """Encode this NTPPacket into its buffer.
 
         Returns:
-        buffer representing this packet
+        the 48-byte buffer, ready to be sent over a socket
 
         Raises:
         NTPException -- in case of invalid field
         """
         try:
-            packed = struct.pack(NTPPacket._PACKET_FORMAT,
-                (self.leap << 6 | self.version << 3 | self.mode),
+            struct.pack_into(NTPPacket._PACKET_FORMAT, self.buf, 0,
+                self.leap << 6 | self.version << 3 | self.mode,
                 self.stratum,
                 self.poll,
                 self.precision,
-                _to_int(self.root_delay) << 16 | _to_frac(self.root_delay, 16),
-                _to_int(self.root_dispersion) << 16 |
-                _to_frac(self.root_dispersion, 16),
+                self.root_delay,
+                self.root_dispersion,
                 self.ref_id,
-                _to_int(self.ref_timestamp),
-                _to_frac(self.ref_timestamp),
-                _to_int(self.orig_timestamp),
-                _to_frac(self.orig_timestamp),
-                _to_int(self.recv_timestamp),
-                _to_frac(self.recv_timestamp),
-                _to_int(self.tx_timestamp),
-                _to_frac(self.tx_timestamp))
-        except struct.error:
+                self.ref_s, self.ref_f,
+                self.orig_s, self.orig_f,
+                self.recv_s, self.recv_f,
+                self.tx_s, self.tx_f)
+        except _PACK_ERRORS:
             raise NTPException("Invalid NTP packet fields.")
-        return packed
+        return self.buf
 
     def from_data(self, data):
         """Populate this instance from a NTP packet payload received from
         the network.
 
         Parameters:
-        data -- buffer payload
+        data -- buffer payload (at least 48 bytes; may be this packet's buffer)
 
         Raises:
         NTPException -- in case of invalid packet format
         """
-        try:
-            unpacked = struct.unpack(NTPPacket._PACKET_FORMAT,
-                    data[0:struct.calcsize(NTPPacket._PACKET_FORMAT)])
-        except struct.error:
+        if len(data) < NTPPacket.PACKET_SIZE:
             raise NTPException("Invalid NTP packet.")
-
-        self.leap = unpacked[0] >> 6 & 0x3
-        self.version = unpacked[0] >> 3 & 0x7
-        self.mode = unpacked[0] & 0x7
-        self.stratum = unpacked[1]
-        self.poll = unpacked[2]
-        self.precision = unpacked[3]
-        self.root_delay = (unpacked[4])//2**16
-        self.root_dispersion = (unpacked[5])//2**16
-        self.ref_id = unpacked[6]
-        self.ref_timestamp = _to_time(unpacked[7], unpacked[8])
-        self.orig_timestamp = _to_time(unpacked[9], unpacked[10])
-        self.recv_timestamp = _to_time(unpacked[11], unpacked[12])
-        self.tx_timestamp = _to_time(unpacked[13], unpacked[14])
+        (first, self.stratum, self.poll, self.precision, self.root_delay,
+         self.root_dispersion, self.ref_id, self.ref_s, self.ref_f,
+         self.orig_s, self.orig_f, self.recv_s, self.recv_f,
+         self.tx_s, self.tx_f) = struct.unpack_from(NTPPacket._PACKET_FORMAT, data)
+        self.leap = first >> 6 & 0x3
+        self.version = first >> 3 & 0x7
+        self.mode = first & 0x7
 
 
 class NTPStats(NTPPacket):
     """NTP statistics.
 
     Wrapper for NTPPacket, offering additional statistics like offset and
-    delay, and timestamps converted to system time.
+    delay in integer milliseconds, and timestamps converted to system time.
     """
 
-    def __init__(self):
+    __slots__ = ('dest_s', 'dest_f')
+
+    def __init__(self, buf=None):
         """Constructor."""
-        NTPPacket.__init__(self)
-        self.dest_timestamp = 0
+        NTPPacket.__init__(self, buf=buf)
+        self.dest_s = self.dest_f = 0
         """destination timestamp"""
 
+    dest_timestamp = property(lambda self: _to_time(self.dest_s, self.dest_f),
+                              lambda self, t: self._set('dest', t))
+
     @property
     def offset(self):
-        """offset"""
-        return ((self.recv_timestamp - self.orig_timestamp) +
-                (self.tx_timestamp - self.dest_timestamp))//2
+        """offset (ms)"""
+        return (_diff_ms(self.recv_s, self.recv_f, self.orig_s, self.orig_f) +
+                _diff_ms(self.tx_s, self.tx_f, self.dest_s, self.dest_f)) // 2
 
     @property
     def delay(self):
-        """round-trip delay"""
-        return ((self.dest_timestamp - self.orig_timestamp) -
-                (self.tx_timestamp - self.recv_timestamp))
+        """round-trip delay (ms)"""
+        return (_diff_ms(self.dest_s, self.dest_f, self.orig_s, self.orig_f) -
+                _diff_ms(self.tx_s, self.tx_f, self.recv_s, self.recv_f))
 
     @property
     def tx_time(self):
         """Transmit timestamp in system time."""
-        return ntp_to_system_time(self.tx_timestamp)
+        return self.tx_s - NTP.NTP_DELTA
 
     @property
     def recv_time(self):
         """Receive timestamp in system time."""
-        return ntp_to_system_time(self.recv_timestamp)
+        return self.recv_s - NTP.NTP_DELTA
 
     @property
     def orig_time(self):
         """Originate timestamp in system time."""
-        return ntp_to_system_time(self.orig_timestamp)
+        return self.orig_s - NTP.NTP_DELTA
 
     @property
     def ref_time(self):
         """Reference timestamp in system time."""
-        return ntp_to_system_time(self.ref_timestamp)
+        return self.ref_s - NTP.NTP_DELTA
 
     @property
     def dest_time(self):
         """Destination timestamp in system time."""
-        return ntp_to_system_time(self.dest_timestamp)
+        return self.dest_s - NTP.NTP_DELTA
+
+
+def _diff_ms(s1, f1, s0, f0):
+    """Return timestamp s1.f1 minus timestamp s0.f0 in milliseconds.
+
+    The fractions are cut to 16 bits first, so every product stays a small
+    int; the result is floored to the millisecond.
+    """
+    return (s1 - s0) * 1000 + (((f1 >> 16) - (f0 >> 16)) * 1000 >> 16)
 
 
 class NTPClient:
@@ -303,15 +343,18 @@ class NTPClient:
         # create the socket
         s = socket.socket(family, socket.SOCK_DGRAM)
 
+        # the request and the response share the packet buffer
+        stats = NTPStats()
         try:
             s.settimeout(timeout)
 
             # create the request packet - mode 3 is client
-            query_packet = NTPPacket(mode=3, version=version,
-                                tx_timestamp=system_to_ntp_time(time.time()))
+            stats.mode = 3
+            stats.version = version
+            stats.tx_timestamp = system_to_ntp_time(time.time())
 
             # send the request
-            s.sendto(query_packet.to_data(), sockaddr)
+            s.sendto(stats.to_data(), sockaddr)
 
             # wait for the response - check the source address
             src_addr = None,
@@ -326,13 +369,83 @@ class NTPClient:
             s.close()
 
         # construct corresponding statistics
-        stats = NTPStats()
         stats.from_data(response_packet)
         stats.dest_timestamp = dest_timestamp
 
         return stats
 
 
+def request_many(addresses, buf, timeout_ms=500, version=3, poll=None):
+    """Query several NTP servers at once over one non-blocking UDP socket.
+
+    All requests go out back to back and the replies are collected as they
+    arrive, so the exchange takes about one round trip to the slowest server
+    that answers.  Local times are ticks_us() counted from the first send; the
+    transmit timestamp of each request carries the server index and the local
+    send time, which the server echoes back as the originate timestamp.
+
+    Parameters:
+    addresses  -- server socket addresses (from getaddrinfo)
+    buf        -- 48-byte packet buffer, reused for every request and reply
+    timeout_ms -- stop waiting for replies after this long
+    version    -- NTP version to use
+    poll       -- optional function called while no reply is waiting
+
+    Returns:
+    (t0, samples) -- t0 is the ticks_us() of the first send and samples a
+    list of (delay_us, offset_us, index), one per valid reply.  offset_us is
+    the server time at t0 in microseconds since the system epoch, so the time
+    at a later tick x is offset_us + time.ticks_diff(x, t0).
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    packet = NTPPacket(version=version, mode=3, buf=buf)
+    samples = []
+    try:
+        s.setblocking(False)
+        t0 = time.ticks_us()
+        for i in range(len(addresses)):
+            packet.tx_s = i
+            packet.tx_f = time.ticks_diff(time.ticks_us(), t0) & 0xffffffff
+            try:
+                s.sendto(packet.to_data(), addresses[i])
+            except OSError:
+                pass
+        pending = len(addresses)
+        timeout_us = timeout_ms * 1000
+        while pending and time.ticks_diff(time.ticks_us(), t0) < timeout_us:
+            try:
+                n = s.readinto(buf)
+            except OSError:
+                n = None
+            if not n:
+                if poll is not None:
+                    poll()
+                continue
+            t4 = time.ticks_diff(time.ticks_us(), t0)
+            if n < NTPPacket.PACKET_SIZE:
+                continue
+            packet.from_data(buf)
+            index = packet.orig_s
+            if packet.mode != 4 or not 0 < packet.stratum < 16 or index >= len(addresses):
+                continue            # Not a reply to us, or an unsynchronized server
+            t1 = packet.orig_f
+            t2 = _to_us(packet.recv_s, packet.recv_f)
+            t3 = _to_us(packet.tx_s, packet.tx_f)
+            delay = (t4 - t1) - (t3 - t2)
+            offset = ((t2 - t1) + (t3 - t4)) // 2
+            samples.append((delay, offset, index))
+            pending -= 1
+    finally:
+        s.close()
+    return t0, samples
+
+
+def _to_us(seconds, fraction):
+    """Return an NTP timestamp as microseconds since the system epoch."""
+    return (seconds - NTP.NTP_DELTA) * 1000000 + \
+        (fraction * 15625 >> 26)    # 10**6 / 2**32
+
+
 def _to_int(timestamp):
     """Return the integral part of a timestamp.
 
@@ -342,8 +455,7 @@ def _to_int(timestamp):
     Retuns:
     integral part
     """
-    return timestamp
-    #return int(timestamp)
+    return timestamp >> 32
 
 
 def _to_frac(timestamp, n=32):
@@ -356,8 +468,7 @@ def _to_frac(timestamp, n=32):
     Retuns:
     fractional part
     """
-    return 0
-    #return int(abs(timestamp - _to_int(timestamp)) * 2**n)
+    return (timestamp & 0xffffffff) >> (32 - n)
 
 
 def _to_time(integ, frac, n=32):
@@ -371,8 +482,7 @@ def _to_time(integ, frac, n=32):
     Retuns:
     timestamp
     """
-    return integ
-    #return integ + float(frac)/2**n
+    return integ << 32 | frac << (32 - n)
 
 
 def ntp_to_system_time(timestamp):
@@ -382,21 +492,21 @@ def ntp_to_system_time(timestamp):
     timestamp -- timestamp in NTP time
 
     Returns:
-    corresponding system time
+    corresponding system time (whole seconds)
     """
-    return timestamp - NTP.NTP_DELTA
+    return (timestamp >> 32) - NTP.NTP_DELTA
 
 
 def system_to_ntp_time(timestamp):
     """Convert a system time to a NTP time.
 
     Parameters:
-    timestamp -- timestamp in system time
+    timestamp -- timestamp in system time (whole seconds)
 
     Returns:
     corresponding NTP time
     """
-    return timestamp + NTP.NTP_DELTA
+    return (int(timestamp) + NTP.NTP_DELTA) << 32
 
 
 def leap_to_text(leap):
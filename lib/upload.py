@@ -0,0 +1,113 @@
+# upload.py  Idempotent uploads: HTTP status, existence check, retries with backoff.
+#
+#   k = upload.key(station_id, capture_seconds, digest)
+#   result, code, tries, sent, n = upload.deliver(open_socket, host, port, k, send, buf, deadline)
+#
+# Every picture carries an idempotency key, '<station>-<capture time>-<hash>'
+# (the hex of telemetry.image_hash()), in an Idempotency-Key header; the server
+# keeps the key with what it stored and does not store the same key twice.
+# deliver() sends with send(s) over a socket from open_socket (transport.py)
+# and reads the HTTP status of the reply.  An attempt that got no reply, a 408,
+# a 429 or a 5xx is retried after BACKOFF_MS, doubling up to BACKOFF_MAX_MS,
+# while 'deadline' leaves room for the wait and another attempt as long as the
+# last one.  Before each attempt, the first included, it asks the server
+# whether the key is already stored (GET /file/exists?key=), so a reply lost
+# after the server kept the picture, in this wake or one that was reset before
+# it saw the reply, costs one small request instead of the picture again.
+
+import binascii
+import utime
+from micropython import const
+
+# deliver() results
+SENT = const(0)
+EXISTS = const(1)           # The server had the key already
+REFUSED = const(2)          # 4xx: the same request would be refused again
+FAILED = const(3)           # Out of tries or time
+
+TRIES = const(5)
+BACKOFF_MS = const(2000)
+BACKOFF_MAX_MS = const(30000)
+EXISTS_TIMEOUT_S = const(15)
+
+_EXISTS = """\
+GET /file/exists?key={key} HTTP/1.1\r
+Host: {host}\r
+Connection: close\r
+\r\n"""
+
+
+def key(station_id, capture_seconds, digest):
+    return '%s-%d-%s' % (station_id, capture_seconds, binascii.hexlify(digest).decode())
+
+
+# Status code of the HTTP reply in buf[:n], 0 if there is none
+def status(buf, n):
+    if n < 12 or buf[:5] != b'HTTP/':
+        return 0
+    try:
+        return int(bytes(buf[9:12]))
+    except ValueError:
+        return 0
+
+
+def retryable(code):
+    return code == 0 or code == 408 or code == 429 or code >= 500
+
+
+# Ask the server whether 'key' is stored: 200 yes, 404 no, 0 no answer
+def exists(open_socket, host, port, key, buf):
+    return status(buf, _exists(open_socket, host, port, key, buf))
+
+
+# Length of the existence check reply in buf, 0 if there is none
+def _exists(open_socket, host, port, key, buf):
+    try:
+        s = open_socket(host, port, EXISTS_TIMEOUT_S)
+        try:
+            s.sendall(_EXISTS.format(key=key, host=str(host) + ":" + str(port)).encode('iso-8859-1'))
+            return s.readinto(buf) or 0
+        finally:
+            s.close()
+    except OSError:
+        return 0
+
+
+# Send with send(s) -> (bytes sent, reply length in buf, 0 if none came) until the server has it,
+#   refuses it, TRIES attempts were made or 'deadline' (ticks_ms) is too close.
+#   Returns (result, HTTP status of the last reply, attempts, bytes sent, length of
+#   the last reply in buf); an attempt that broke off while sending does not count
+#   in the bytes.
+def deliver(open_socket, host, port, key, send, buf, deadline):
+    tries = sent = 0
+    delay = BACKOFF_MS
+    attempt_ms = 0
+    while True:
+        if tries:
+            if tries >= TRIES or utime.ticks_diff(deadline, utime.ticks_ms()) < delay + attempt_ms:
+                return FAILED, code, tries, sent, n
+            utime.sleep_ms(delay)
+            delay = min(delay * 2, BACKOFF_MAX_MS)
+        n = _exists(open_socket, host, port, key, buf)
+        if status(buf, n) == 200:
+            return EXISTS, 200, tries, sent, n
+        tries += 1
+        start = utime.ticks_ms()
+        n = 0
+        try:
+            s = open_socket(host, port)
+            try:
+                bytes_sent, n = send(s)
+                sent += bytes_sent
+            finally:
+                s.close()
+        except OSError:
+            pass                # No connection, or it broke: retried like a missing reply
+        attempt_ms = utime.ticks_diff(utime.ticks_ms(), start)
+        code = status(buf, n)
+        if 200 <= code < 300:
+            return SENT, code, tries, sent, n
+        if code == 409:
+            return EXISTS, code, tries, sent, n
+        if not retryable(code):
+            return REFUSED, code, tries, sent, n
@@ -58,9 +58,15 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
         s.connect(ai[-1])
         if proto == "https:":
             s = ussl.wrap_socket(s, server_hostname=host)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
+        # Write the request line piecewise; avoids formatting a new bytes object
+        s.write(method)
+        s.write(b" /")
+        s.write(path)
+        s.write(b" HTTP/1.0\r\n")
         if not "Host" in headers:
-            s.write(b"Host: %s\r\n" % host)
+            s.write(b"Host: ")
+            s.write(host)
+            s.write(b"\r\n")
         # Iterate over keys to avoid tuple alloc
         for k in headers:
             s.write(k)
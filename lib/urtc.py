@@ -113,6 +113,46 @@ class DS3231(_BaseRTC):
     _DATETIME_REGISTER = 0x00
     _ALARM_REGISTERS = (0x08, 0x0b)
     _SQUARE_WAVE_REGISTER = 0x0e
+    _REGISTER_COUNT = 0x13
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shadow = bytearray(self._REGISTER_COUNT)
+        self._loaded = False
+        self._dirty_lo = self._REGISTER_COUNT
+        self._dirty_hi = -1
+
+    # Burst access.  load() reads the whole register file (0x00-0x12) in one
+    # transaction into a shadow copy.  Until commit(), register reads and the
+    # flag helpers work on the shadow and alarm/control/status changes only
+    # mark it dirty; commit() writes the dirty span back in one transaction.
+    # Time reads while loaded return the time at load().
+    def load(self):
+        self.i2c.readfrom_mem_into(self.address, 0, self._shadow)
+        self._loaded = True
+        self._dirty_lo = self._REGISTER_COUNT
+        self._dirty_hi = -1
+        return self._shadow
+
+    def commit(self):
+        if self._loaded and self._dirty_hi >= self._dirty_lo:
+            self.i2c.writeto_mem(self.address, self._dirty_lo,
+                                 memoryview(self._shadow)[self._dirty_lo:self._dirty_hi + 1])
+        self._loaded = False
+        self._dirty_lo = self._REGISTER_COUNT
+        self._dirty_hi = -1
+
+    def _register(self, register, buffer=None):
+        if not self._loaded:
+            return super()._register(register, buffer)
+        if buffer is None:
+            return self._shadow[register]
+        end = register + len(buffer)
+        self._shadow[register:end] = buffer
+        if register < self._dirty_lo:
+            self._dirty_lo = register
+        if end - 1 > self._dirty_hi:
+            self._dirty_hi = end - 1
 
     def lost_power(self):
         return self._flag(self._STATUS_REGISTER, 0b10000000)
@@ -142,12 +182,27 @@ class DS3231(_BaseRTC):
         if datetime is not None:
             status = self._register(self._STATUS_REGISTER) & 0b01111111
             self._register(self._STATUS_REGISTER, bytearray((status,)))
+        elif self._loaded:
+            buffer = self._shadow
+            return datetime_tuple(
+                year=_bcd2bin(buffer[6]) + 2000,
+                month=_bcd2bin(buffer[5] & 0x1f),
+                day=_bcd2bin(buffer[4]),
+                weekday=_bcd2bin(buffer[3]),
+                hour=_bcd2bin(buffer[2]),
+                minute=_bcd2bin(buffer[1]),
+                second=_bcd2bin(buffer[0]),
+            )
         return super().datetime(datetime)
 
+    def _read(self, register, n):
+        if self._loaded:
+            return self._shadow[register:register + n]
+        return self.i2c.readfrom_mem(self.address, register, n)
+
     def alarm_time(self, datetime=None, alarm=0):
         if datetime is None:
-            buffer = self.i2c.readfrom_mem(self.address,
-                                           self._ALARM_REGISTERS[alarm], 3)
+            buffer = self._read(self._ALARM_REGISTERS[alarm], 3)
             day = None
             weekday = None
             second = None
@@ -163,8 +218,7 @@ class DS3231(_BaseRTC):
                     if not buffer[1] & 0x80 else None)
             if alarm == 0:
                 # handle seconds
-                buffer = self.i2c.readfrom_mem(
-                    self.address, self._ALARM_REGISTERS[alarm] - 1, 1)
+                buffer = self._read(self._ALARM_REGISTERS[alarm] - 1, 1)
                 second = (_bcd2bin(buffer[0] & 0x7f)
                           if not buffer[0] & 0x80 else None)
             return datetime_tuple(
@@ -175,26 +229,27 @@ class DS3231(_BaseRTC):
                 second=second,
             )
         datetime = datetime_tuple(*datetime)
-        buffer = bytearray(3)
-        buffer[0] = (_bin2bcd(datetime.minute)
+        # Alarm 1 has a seconds register in front of minutes, hours and day;
+        #   all of an alarm's registers are written in one transaction
+        buffer = bytearray(4 if alarm == 0 else 3)
+        i = 0
+        if alarm == 0:
+            buffer[0] = (_bin2bcd(datetime.second)
+                         if datetime.second is not None else 0x80)
+            i = 1
+        buffer[i] = (_bin2bcd(datetime.minute)
                      if datetime.minute is not None else 0x80)
-        buffer[1] = (_bin2bcd(datetime.hour)
-                     if datetime.hour is not None else 0x80)
+        buffer[i + 1] = (_bin2bcd(datetime.hour)
+                         if datetime.hour is not None else 0x80)
         if datetime.day is not None:
             if datetime.weekday is not None:
                 raise ValueError("can't specify both day and weekday")
-            buffer[2] = _bin2bcd(datetime.day)
+            buffer[i + 2] = _bin2bcd(datetime.day)
         elif datetime.weekday is not None:
-            buffer[2] = _bin2bcd(datetime.weekday) | 0b01000000
+            buffer[i + 2] = _bin2bcd(datetime.weekday) | 0b01000000
         else:
-            buffer[2] = 0x80
-        self._register(self._ALARM_REGISTERS[alarm], buffer)
-
-        if alarm == 0:
-            # handle seconds
-            buffer = bytearray([_bin2bcd(datetime.second)
-                                if datetime.second is not None else 0x80])
-            self._register(self._ALARM_REGISTERS[alarm] - 1, buffer)
+            buffer[i + 2] = 0x80
+        self._register(self._ALARM_REGISTERS[alarm] - i, buffer)
 
 
 class PCF8523(_BaseRTC):
@@ -1,39 +1,82 @@
+import gc
 import pycom
+import machine
 from machine import Pin, I2C    # To control the pin that RESETs the ESP32-CAM, I2C for RTC
 from machine import UART        # Receiving pictures from the ESP32-CAM
-from machine import ADC         # Battery voltage measurement
-from network import WLAN        # Connecting with the WiFi; Will not be needed when connecting with LTE
+from network import WLAN        # Connect to network using WiFi, where a network is in range
 from network import LTE         # Connect to network using LTE
-import base64                   # For encoding the picture
-import urequests as requests    # Used for http transfer with the server
 import utime                    # Time delays
-import usocket as socket
-from socket import AF_INET, SOCK_DGRAM  # Needed when synchronizing the DS3231 with NTP
-import ustruct
-from urtc import DS3231         # DS3231 real time clock
+from ds3231 import DS3231       # DS3231 real time clock
+import drift                    # DS3231 drift model; decides when to synchronize
+import schedule                 # Cron-style wake schedules for the DS3231 alarms
+import cadence                  # Adaptive capture interval
+import power                    # Deep sleep between wakes, wake counters
+from battery import Battery     # Background, calibrated battery voltage measurement
+import governor                 # Battery-aware choice of what each wake does
+import energy                   # Modelled charge per wake phase
+import state                    # Wake state kept across deep sleep, committed once per wake
+import telemetry                # Compact binary record of each wake
+import ringlog as log           # Buffered binary event log (replaces console prints)
+from bufpool import BufferPool, wake_slots     # Buffers reserved at boot to keep the heap from fragmenting
+# Imported where a wake first needs them, so that a skipped wake loads none of them:
+#   transport   choice of WiFi or LTE for the wake, from what each did before (network phase)
+#   nettime     network time (NITZ) from the LTE modem (LTE attach)
+#   picture     receive and upload the picture (capture wakes), base64 to encode it
+#   upload      idempotent uploads: HTTP status, existence check, retries with backoff
+#   telering    telemetry records of every wake, kept in flash until uploaded
+#   timesync    multi-server NTP (sync_clock(), on the few wakes that need it)
 
 pycom.heartbeat(False)
 
+# Reserve the large per-wake buffers (picture, Base64 text, HTTP and NTP packets)
+#   while the heap is still empty.
+PICTURE_MAX = 131072
+pool = BufferPool(wake_slots(PICTURE_MAX))
+
 # Assign the Station ID number (0-99)
 station_id = "50"
 
+# Upload the binary event log to the server after the picture
+upload_log_enabled = False
+
 timezone = -5 # est: -5   edt: -4
 
-# global LTE object
-lte = LTE()
+# Wake schedules (GMT, cron style 'minute hour'): Alarm 1 wakes the GPy for a picture and
+#   Alarm 2 for telemetry only (None disables it).  Each station is offset by a few minutes
+#   so that the stations do not all reach the server at the same time.  Captures take the
+#   first slot at least cadence.interval() after the last capture, which adapts to how busy
+#   the meter is.
+#   A telemetry slot that falls on the next capture wake takes no alarm of its own.
+station_offset = int(station_id) % 30
+capture_schedule = schedule.Schedule('5 *', station_offset)        # Hourly slots at hh:05 + offset
+telemetry_schedule = schedule.Schedule('5 4/6', station_offset)    # 04:05, 10:05, 16:05, 22:05 + offset
+
+# global LTE object.  Created by modem() when the wake first needs the network: LTE() waits
+#   for the modem, which a skipped wake never uses.
+lte = None
 #print(lte.imei())  # Print the GPY IMEI
 #print(lte.iccid())  # Print the SIM Card ICCID
 
-# Establish the WiFi object as a station; Internal antenna
-#wlan = WLAN(mode=WLAN.STA,antenna=WLAN.INT_ANT,max_tx_pwr=20)  #range is 8 to 78
+# WiFi network (ssid, WPA2 key) the station may upload through instead of LTE; None: LTE only.
+#   Each wake brings up the link that costs the least charge for what it sends (transport.py)
+#   within NET_DEADLINE_MS, and turns the other radio off.
+wifi_network = ('JRG Guest', '600guest')
+#wifi_network = ('polaris', 'gALAtians_03:20')
+WIFI_TIMEOUT_MS = 15000     # Longest wait for the WiFi association
+NET_DEADLINE_MS = 300000    # Longest wait for a link, all tries included
+WAKE_BUDGET_MS = 540000     # Upload retries stop in time to shut down by this long after the reset
+
+# global WLAN object (station, internal antenna).  Created by wifi_up() when the wake tries WiFi
+wlan = None
 
 i2c = I2C(0, I2C.MASTER, baudrate=100000)  # use default pins P9 and P10 for I2C
 ds3231 = DS3231(i2c)
+rtc_time = DS3231.new_datetime()   # DS3231 reads are decoded into this list
 
-# Define uart for UART1.  This is the UART that
-#    receives data from the ESP32-CAM
+# UART1 receives data from the ESP32-CAM.  It is created just before the camera is
+#    triggered (capture wakes only).
 #    For now, the ESP32-CAM transmits to the GPy at 38400 bps.  This can probably be increased.
-uart = UART(1, baudrate=38400)
+uart = None
 
 
 # Define the trigger pin for waking up the ESP32-CAM
@@ -58,140 +101,182 @@ gpy_reset_trigger = Pin('P23', mode=Pin.OPEN_DRAIN, value=1)
 #      resistor divider is cut off - helps conserve battery energy.
 #   Initialize the pin to disable the voltage divider
 gpy_enable_vmeas = Pin('P19', mode=Pin.OUT)
+gpy_enable_vmeas.hold(False)    # Held low through the last deep sleep
 gpy_enable_vmeas.value(0)
+battery_meter = Battery(gpy_enable_vmeas)   # Samples P18 in the background while the divider is enabled
 
 
 
 
 ############################################################
 ############ Begin function definitions ####################
-def set_next_alarm():
-    startup_datetime = ds3231.datetime()   # Get the time from the DS3231 RTC on startup
-
-    startup_minute = startup_datetime[5]
-    startup_hour = startup_datetime[4]
-    startup_day = startup_datetime[2]
-    startup_year = startup_datetime[0]
-
-    print("startup time: ", startup_datetime)
-
-    #  Calculate the time (GMT) for the next alarm based on the startup time.
-    #  For this case, the alarm times are 0705, 1305, 1905 and 0105 hrs.
-    if startup_hour >= 0 and startup_hour < 7:
-        next_hour = 7
-    elif startup_hour >= 7 and startup_hour < 13:
-        next_hour = 13
-    elif startup_hour >= 13 and startup_hour < 19:
-        next_hour = 19
-    else:
-        next_hour = 1
+def set_next_alarm(loaded=False, stretch=0):
+    global alarm_wakes
+    if not loaded:
+        ds3231.load()                      # Read the whole DS3231 register file in one I2C transaction
+    startup_datetime = ds3231.datetime_into(DS3231.new_datetime())   # Get the time from the DS3231 RTC on startup
+
+    now = utime.mktime((startup_datetime[0], startup_datetime[1], startup_datetime[2],
+                        startup_datetime[4], startup_datetime[5], startup_datetime[6], 0, 0))
+    log.info(log.EV_RTC_TIME, 0, now)
+
+    #  Calculate the time (GMT) for the next capture (Alarm 1) and telemetry (Alarm 2) wakes
+    #  from the schedules.  Both alarm flags are cleared and both alarms routed to INT.
+    #  The capture interval counts from the last capture, so re-arming on any other wake keeps the
+    #  capture where it was.  A 'stretch' (minutes) puts the next capture at least that far off and
+    #  drops the telemetry wakes.
+    alarm_wakes = capture_wake, telemetry_wake = schedule.program(ds3231, startup_datetime, capture_schedule,
+                                                                  None if stretch else telemetry_schedule,
+                                                                  interval=stretch or cadence.interval(),
+                                                                  since=0 if stretch else cadence.elapsed(now // 60))
+    log.info(log.EV_ALARM, 0, capture_wake)
+    if telemetry_wake >= 0:
+        log.info(log.EV_ALARM, 1, telemetry_wake)
+    ds3231.commit()                     # Write alarm, control and status back in one I2C transaction
 
-    next_minute = 5
+    return startup_datetime
 
-    # Testing.  Set the alarm
-    # Format: [year, month, day, weekday, hour, minute, second, millisecond]
-    #next_hour = startup_hour
-    #next_minute = startup_minute + 3  # Send a picture every three minutes
-    #if next_minute > 59:
-    #    next_minute -= 60
-    #    next_hour += 1
-    #    if next_hour > 23:
-    #        next_hour -= 24
 
-    alarm = [None, None, None, None, next_hour, next_minute, 0, None]  # Alarm when hours, minutes and seconds (0) match
-    alarm_datetime = tuple(alarm)
-    ds3231.alarm_time(alarm_datetime)
 
-    print("Next Alarm Time: ", ds3231.alarm_time())     # For debugging, print the alarm time
-    ds3231.no_interrupt()               # Ensure both alarm interrupts are disabled
-    ds3231.no_alarmflag()               # Ensure both alarm flags in the status register are clear (even though Alarm 2 is not used)
-    ds3231.interrupt(alarm=0)           # Enable Alarm 1 (alarm=0) interrupt
 
-    return startup_datetime
+
+# The LTE object, created on first use
+def modem():
+    global lte
+    if lte is None:
+        lte = LTE()
+    return lte
+
+
+# True once utime.ticks_ms() has reached 'deadline' (a ticks_ms value)
+def expired(deadline):
+    return utime.ticks_diff(deadline, utime.ticks_ms()) <= 0
+
+
+# Join wifi_network within timeout_ms (at most WIFI_TIMEOUT_MS).  Returns True when associated.
+def wifi_up(timeout_ms):
+    global wlan
+    energy.phase(energy.ATTACH)
+    energy.wifi(True)
+    timeout_ms = min(timeout_ms, WIFI_TIMEOUT_MS)
+    start = utime.ticks_ms()
+    deadline = utime.ticks_add(start, timeout_ms)
+    wlan = WLAN(mode=WLAN.STA, antenna=WLAN.INT_ANT, max_tx_pwr=20)  #range is 8 to 78
+    try:
+        wlan.connect(ssid=wifi_network[0], auth=(WLAN.WPA2, wifi_network[1]), timeout=timeout_ms)
+        while not wlan.isconnected() and not expired(deadline):
+            machine.idle()
+    except OSError:
+        pass                # Not in range: no association to wait for
+    if wlan.isconnected():
+        log.info(log.EV_WIFI, 1, utime.ticks_diff(utime.ticks_ms(), start))
+        return True
+    log.warn(log.EV_WIFI, 0, utime.ticks_diff(utime.ticks_ms(), start))
+    energy.wifi(False)      # The failed attempt stays charged at the WiFi currents, LTE takes over from here
+    return False
 
 
+def wifi_down():
+    (wlan or WLAN()).deinit()
 
 
+# Bring LTE up within timeout_ms: attach, check the clock against the network time the
+#   modem received, then start the data session.  Returns True when connected.
+def lte_up(timeout_ms):
+    global network_time, rsrp_dbm
+    deadline = utime.ticks_add(utime.ticks_ms(), timeout_ms)
+    if not attach_to_lte(deadline):
+        return False
+    rsrp_dbm = telemetry.rsrp(lte)      # Signal strength for the telemetry record
 
-def connect_to_wifi():
-    #wlan.connect(ssid='polaris', auth=(WLAN.WPA2, 'gALAtians_03:20'))
-    wlan.connect(ssid='JRG Guest', auth=(WLAN.WPA2, '600guest'), timeout=5000)
-    while not wlan.isconnected():
-        machine.idle()
-    print(wlan.ifconfig())
+    # Network time from the modem: sets an invalid clock before the data session (and the picture)
+    network_time = check_network_time()
 
+    # Send an SMS message here if needed (after attached to LTE and before connected to LTE data)
 
-def attach_to_lte():
+    return connect_to_lte_data(deadline) == 1
+
+
+def lte_down():
+    if lte is not None:
+        lte.deinit(detach=True, reset=True)
+
+
+def attach_to_lte(deadline):
+    import nettime
     return_val = 0
+    energy.phase(energy.ATTACH)
+    modem()
  
     # First, enable the module radio functionality and attach to the LTE network
+    #   The modem takes the network time while it attaches
+    nettime.enable(lte)
     attach_try = 0
-    while attach_try < 3:
+    while attach_try < 3 and not expired(deadline):
         lte.attach(apn="wireless.dish.com",type=LTE.IP)
 
-        print("attaching..",end='')
-
         attempt = 0
-        while attempt < 20:
+        while attempt < 20 and not expired(deadline):
             if not lte.isattached():
-                print(lte.send_at_cmd('AT!="fsm"'))         # get the System FSM
+                if log.CONSOLE:
+                    print(lte.send_at_cmd('AT!="fsm"'))     # Debug builds only: dump the System FSM
+                log.debug(log.EV_LTE_FSM, attach_try, attempt)
                 attempt += 1
                 utime.sleep(5.0)
             else:
-                print("attached!")
                 break
         # Break out of the 'attach_try' while loop if attached to the LTE network
         if lte.isattached():
+            log.info(log.EV_LTE_ATTACH, attach_try, 1)
             return_val = 1    # update return_val to indicate successful attach
             break
         else:
-            print("Attempt #%d failed. Try attaching again!" %(attach_try))
-            attach_try += 1.0
+            log.warn(log.EV_LTE_ATTACH, attach_try, 0)
+            attach_try += 1
             utime.sleep(7)
 
     # If the GPy failed to connect to the LTE network return an error code
     if not lte.isattached():
-        print("Failed to attach to the LTE system")
+        log.error(log.EV_LTE_ATTACH, attach_try, 0)
     
     return return_val
 
 
-def connect_to_lte_data():
+def connect_to_lte_data(deadline):
     return_val = 0
+    energy.phase(energy.CONNECT)
     # Once the GPy is attached to the LTE network, start a data session using lte.connect()
     connect_try = 0
-    while connect_try < 10:
+    while connect_try < 10 and not expired(deadline):
         lte.connect()
-        print("connecting [##",end='')
 
         # Check for a data connection
         attempt = 0
-        while attempt < 10:
+        while attempt < 10 and not expired(deadline):
             if not lte.isconnected():
                 #print(lte.send_at_cmd('AT!="showphy"'))
                 #print(lte.send_at_cmd('AT!="fsm"'))
-                print('#',end='')
                 attempt += 1
                 utime.sleep(1.0)
 
             # Break out of the 'attempt' while loop if a data connection is established
             else:
-                print("] connected!")
                 break
 
         # If no data connection, disconnect and try again
         # If connected, update return_val and break out of the 'connect_try' while loop
         if lte.isconnected():
+            log.info(log.EV_LTE_CONNECT, connect_try, 1)
             return_val = 1         # update return_val to indicate successful data connection
             break
         else:
-            print("Try the data connection again!")
-            connect_try += 1.0
+            log.warn(log.EV_LTE_CONNECT, connect_try, 0)
+            connect_try += 1
             utime.sleep(5)
 
     # If a data connection is not established, detach from the LTE network before returning
     if not lte.isconnected():
-        print("Failed to connect to the LTE data network")  
+        log.error(log.EV_LTE_CONNECT, connect_try, 0)
         lte.detach(reset=False)
 
     return return_val
@@ -227,47 +312,28 @@ def send_sms_msg():
 
 
 def process_picture(picture_len_int):
-    buf = bytearray(picture_len_int)
-    mv = memoryview(buf)
-
-    idx = 0
-    while idx < picture_len_int:
-        if uart.any():
-            bytes_read = uart.readinto(mv[idx:])
-            idx += bytes_read
-            print('.', end='')
-
-    # Print the index counter.  This is the number of bytes copied to the picture buffer
-    print(idx)
-
-    b64_picture_bytes = base64.b64encode(buf)
-
-    del buf
+    global image_digest
+    import base64
+    import upload
+    buf = pool.borrow('picture', picture_len_int)
+    idx = picture.receive(uart, buf, picture_len_int)
+    energy.phase(energy.NET)
+
+    # Log the index counter.  This is the number of bytes copied to the picture buffer
+    if idx < picture_len_int:
+        # The camera stalled; a truncated JPEG is not worth the upload
+        log.error(log.EV_PIC_RX, 1, idx)
+        pool.give_back('picture')
+        return 0
+    log.info(log.EV_PIC_RX, 0, idx)
+    image_digest = telemetry.image_hash(memoryview(buf)[:picture_len_int])
+
+    b64_buf = pool.borrow('b64', base64.encoded_length(picture_len_int))
+    b64_len = base64.b64encode_into(memoryview(buf)[:picture_len_int], b64_buf)
+    pool.give_back('picture')
 
     # Transmit the encoded image to the server
-    data_file = "{\"voltage\": " + voltage_level + ",\"base64File\": \"" +  b64_picture_bytes.decode('ascii') + "\", \"id\": " + station_id + ", \"timeStamp\": \"" + time_stamp + "\"}" 
-
-    # Post the picture using the uPython urequests library
-    """
-    # URL string.  Transmit the encoded image to the server
-    url = "http://gaepd.janusresearch.com:8555/file/base64"
-    #url = "http://water.roeber.dev:80/file/base64"
-
-    # HTTP Header string
-    headers = {
-        'Content-Type': 'application/json',
-    }
-
-    try:
-        wdt=machine.WDT(timeout=5*1000)
-        response = requests.post(url, headers=headers, data=data_file)
-        print(response.text)  # Prints the return filename from the server in json format
-        response.close()
-    except Exception as e:
-        print(e)
-    """
-
-
+    data_prefix, data_suffix = picture.json_parts(voltage_level, station_id, time_stamp)
 
     # Post the picture using the uPython usockets library
     # Host at JRG, Inc
@@ -279,147 +345,204 @@ def process_picture(picture_len_int):
     # Host on Digital Ocean
     host = "water.roeber.dev"
     port = 80
-    server_address = socket.getaddrinfo('water.roeber.dev', 80)[0][-1]
-    
+
+    # The key lets the server tell a resend from a new picture; upload.deliver() retries
+    #   within the wake's budget and first asks whether a lost reply hid a stored picture
+    key = upload.key(station_id, capture_seconds, image_digest)
+    reply = pool.borrow('net')
+    send_ms = [0]           # How long the last post took to send, for the link's throughput
+
+    def send(s):
+        s.settimeout(240)
+        sent, n, send_ms[0] = picture.post(s, host, port, data_prefix, memoryview(b64_buf)[:b64_len], data_suffix,
+                                           reply, key)
+        return sent, n
+
+    energy.phase(energy.UPLOAD)
+    result, status, tries, sent, reply_len = upload.deliver(open_socket, host, port, key, send, reply,
+                                                            utime.ticks_add(0, WAKE_BUDGET_MS))    # ticks_ms() counts from the reset
+    if result == upload.SENT and tries == 1:
+        transport.transferred(link, sent, send_ms[0])
+    log.info(log.EV_UPLOAD, tries, sent)
+    if result == upload.SENT or result == upload.EXISTS:
+        log.info(log.EV_UPLOAD_RESULT, result, status)
+    else:
+        log.error(log.EV_UPLOAD_RESULT, result, status)
+    if log.CONSOLE:
+        print(bytes(reply[:reply_len]))
+    pool.give_back('net')
+    pool.give_back('b64')
+    energy.phase(energy.NET)
+    return picture_len_int
+
+
+def upload_log():
+    # POST the binary event log (ringlog records) to the server in one request
+    import upload
+    host = "water.roeber.dev"
+    port = 80
+    log.flush()
+    length = log.size()
+    if not length:
+        return
 
     headers = """\
-POST /file/base64 HTTP/1.1\r
-Content-Type: {content_type}\r
+POST /file/log?id={station_id} HTTP/1.1\r
+Content-Type: application/octet-stream\r
 Content-Length: {content_length}\r
 Host: {host}\r
+Connection: close\r
 \r\n"""
 
-    header_bytes = headers.format(
-        content_type="application/json",
-        content_length=len(data_file),
-        host=str(host) + ":" + str(port)
-    ).encode('iso-8859-1')
-
-    payload = header_bytes + data_file
-
-    s = socket.socket()
-    s.setblocking(True)
-    s.settimeout(30)
-
-    print("Connect to server")
-    s.settimeout(30)
-    s.connect(server_address)
-
-    print("Sending photo to server...")
-    s.settimeout(240)
-    s.sendall(payload)
-    print("...Send complete")
+    energy.phase(energy.UPLOAD)
+    net = pool.borrow('net')
+    sent = status = 0
+    try:
+        s = open_socket(host, port)
+        try:
+            s.sendall(headers.format(station_id=station_id, content_length=length,
+                                     host=str(host) + ":" + str(port)).encode('iso-8859-1'))
+            sent = log.upload(s.sendall, net)
+            s.settimeout(60)
+            status = upload.status(net, s.readinto(net) or 0)
+        finally:
+            s.close()
+    except OSError:
+        pass                    # No connection or no reply: the log stays for the next upload
+    pool.give_back('net')
+    energy.phase(energy.NET)
+    if 200 <= status < 300:
+        log.discard(sent)
+        log.info(log.EV_LOG_UPLOAD, status, sent)
+    else:
+        log.warn(log.EV_LOG_UPLOAD, status, sent)
+
+
+# Store the telemetry record of this wake (lib/telemetry.py) in the flash ring, once
+def record_telemetry():
+    global telemetry_recorded
+    if telemetry_recorded:
+        return
+    import telering
+    telemetry.pack_into(telemetry_buf, 0, int(station_id), capture_seconds, vbat_mv, temperature_q,
+                        rsrp_dbm, mode, wake_reason,
+                        [energy.ms(p) for p in range(telemetry.PHASES)],
+                        received, image_digest, on_wifi)
+    telering.append(telemetry_buf)
+    telemetry_recorded = True
+    log.info(log.EV_TELEMETRY_REC, 0, telering.pending())
+
+
+def upload_telemetry():
+    # POST every telemetry record waiting in the flash ring, this wake's included, in one request
+    import telering
+    import upload
+    host = "water.roeber.dev"
+    port = 80
+    record_telemetry()
+    pending = telering.pending()
+    length = telering.size()
+    energy.phase(energy.UPLOAD)
 
-    s.settimeout(60)
-    print(s.recv(1024))  # Print the data that the server returns
+    headers = """\
+POST /file/telemetry?id={station_id} HTTP/1.1\r
+Content-Type: application/octet-stream\r
+Content-Length: {content_length}\r
+Host: {host}\r
+Connection: close\r
+\r\n"""
 
-"""
-    s = socket.socket()
-    s.setblocking(False)
+    net = pool.borrow('net')
+    sent = status = 0
     try:
-        s.connect(server_address)
-    except OSError as e:
-        if str(e) == '119':   # For non-Blocking sockets 119 is EINPROGRESS
-            print("Socket connection in progress")
-        else:
-            raise e
-"""
-    
+        s = open_socket(host, port)
+        try:
+            s.sendall(headers.format(station_id=station_id, content_length=length,
+                                     host=str(host) + ":" + str(port)).encode('iso-8859-1'))
+            # Content-Length announces all the pending records; if the ring file comes up short
+            #   the body is incomplete, so there is no reply to wait for and nothing to acknowledge
+            sent = telering.upload(s.sendall, net)
+            if sent == pending:
+                s.settimeout(60)
+                status = upload.status(net, s.readinto(net) or 0)
+        finally:
+            s.close()
+    except OSError:
+        pass                    # No connection or no reply: the records stay pending
+    pool.give_back('net')
+    energy.phase(energy.NET)
+    # The records are delivered once the server took the whole body; anything else keeps them for the next connection
+    if sent == pending and 200 <= status < 300:
+        telering.acknowledge(sent)
+        log.info(log.EV_TELEMETRY, sent, status)
+    else:
+        log.warn(log.EV_TELEMETRY, sent, status)
 
 
+# Battery voltage in mV from the background measurement started at boot (battery.Battery)
 def battery_voltage():
-    gpy_enable_vmeas.value(1)  # enable the battery voltage divider
-    adc = ADC(0)             # create an ADC object
-    adc_vbat = adc.channel(pin='P18',attn=adc.ATTN_0DB)   # create an analog pin on P18
-
-    print("Reading Battery Voltage...")
-
-    adc_value = 0.0
-    for y in range(0,10):
-        utime.sleep_ms(10)
-        reading = adc_vbat()
-        adc_value += reading
-
-    gpy_enable_vmeas.value(0)  # disable the battery voltage divider
-
-    # Take average of the 10 readings
-    adc_value = adc_value / 10
-    print("ADC count = %d" %(adc_value))
-
-    # GPy  has 1.1 V input range for ADC using ATTN_0DB
-
-    # The battery pack maximum voltage is 2 * 3.65 = 7.3V.  Allow for a maximum of 8V.
-    #   Use a voltage divider consisting of 352k and 56k resistors.
-    #   V_measured = 0.1372549 * V_battery
-    #   For V_battery = 8V, V_measured = 1.1V
-    #   For V_battery = 7.3V, V_measured = 1.002V
-
-    volts = adc_value * 0.001754703 + 0.544528802 
-    print("Voltage = %5.2f V" % (volts))
-
-    # Return voltage without a decimal so that it can be used in the photo filename
-    rounded_value = 100 * round(volts,2)  # e.g., for volts = 6.475324, rounded_value = 648.
-    integer_value = int(rounded_value)    # for rounded_value = 648.  integer_value = 648 
-    return str(integer_value)
+    vbat_mv = battery_meter.read_mv()
+    log.info(log.EV_VBAT, battery_meter.count16() // 16, vbat_mv)
+    return vbat_mv
 
 # Set the clock with NTP date/time
 def sync_clock():
-    return_val = 0
-
-    print("Setting the DS3231 RTC ...")
-    print("   Connecting to ntp")
-    host = "pool.ntp.org"
-    port = 123
-    buf = 1024
-    address = socket.getaddrinfo(host,  port)[0][-1]
-    msg = '\x1b' + 47 * '\0'
-    msg = msg.encode()
-    TIME1970 = 2208988800 # 1970-01-01 00:00:00
-
-    # Try 5 times to connect ot the NTP server
-    ntp_try = 0
-    while ntp_try < 5:
-        client = socket.socket(AF_INET, SOCK_DGRAM)
-        bytes_sent = 0
-        for _ in range(10):
-            bytes_sent = client.sendto(msg, address)
-            utime.sleep(1)
-            if bytes_sent > 0:                       #Connection to NTP server successful if bytes are sent
-                #print("Sent to NTP server")
-                # Receive the NTP time into t.  Adjust t with the base time, TIME1970.
-                msg, address = client.recvfrom(buf)
-                t = ustruct.unpack("!12I", msg)[10]
-                t -= TIME1970
-
-                # Convert epoch time, t in GMT, to 8-tuple [yr, mo, mday, hr, min, sec, weekday, yearday]
-                ntp_time = utime.localtime(t)
-
-                print("ntp_time (GMT): ", ntp_time)  
-
-                # Set DS3231 time using NTP time.  First, adjust the time tuple to match the
-                #    format requried by the DS3231 driver
-                a = list(ntp_time)
-
-                del a[7]            # delete the yearday value
-                a.insert(3, 1)      # insert 1 for the weekday value.  Any weekday value that is in range 1-7
-                                    # is OK since this program does not use the weekday.
-
-                localtime = tuple(a)
-                ds3231.datetime(localtime)
-
+    import timesync
+    # Query several NTP servers at once and set the DS3231 from the lowest-delay reply
+    addresses = timesync.resolve()
+    for ntp_try in range(3):
+        result = timesync.sync(ds3231, rtc_time, pool.borrow('ntp'), addresses)
+        pool.give_back('ntp')
+        if result is not None:
+            error_ms, delay_ms, replies, written = result
+            log.info(log.EV_NTP, replies, delay_ms)
+            log.info(log.EV_CLOCK_ERROR, 1 if written else 0, max(-0x7fffffff, min(error_ms, 0x7fffffff)))
+
+            # Feed the measurement to the drift model (NTP time of the DS3231 transition)
+            ntp_seconds = utime.mktime((rtc_time[0], rtc_time[1], rtc_time[2],
+                                        rtc_time[4], rtc_time[5], rtc_time[6], 0, 0)) - error_ms // 1000
+            rate_ppb, aging_applied = drift.record(ntp_seconds, error_ms, written, ds3231)
+            log.info(log.EV_DRIFT, aging_applied, rate_ppb or 0)
+            if written:
                 # The ds3231 date/time has been updated.  Now re-set the next alarm time
                 set_next_alarm()
-
-                return_val = 1    # Update the return_val to indicate time update success
-                return return_val
-            else:
-                print("loop in time server")
-                utime.sleep(5)
-        ntp_try += 1
-        client.close()
-        print("Try NTP again")
-        utime.sleep(5)            # Time delay before next attempt at connecting to the NTP server
-    return return_val
+            return 1
+        log.warn(log.EV_NTP, 0, ntp_try)
+    return 0
+
+# The DS3231 time (s), or None while it is not valid: a DS3231 that lost power reads year 2000
+#   until NITZ or NTP sets it
+def rtc_seconds():
+    ds3231.load()
+    t = ds3231.datetime_into(rtc_time)
+    valid = t[0] >= 2021 and not ds3231.lost_power()
+    ds3231.commit()
+    if valid:
+        return utime.mktime((t[0], t[1], t[2], t[4], t[5], t[6], 0, 0))
+    return None
+
+# Check the clock against the network time the modem received while attaching.  No data
+#   session is needed.  Returns 1 if the DS3231 agrees or was set, 0 if there is no network
+#   time and -1 if the DS3231 disagrees (NTP settles it)
+def check_network_time():
+    import nettime
+    result = nettime.check(ds3231, rtc_time, lte)
+    if result is None:
+        log.info(log.EV_NET_TIME, 0, 0)
+        return 0
+    error_s, written = result
+    error_s = max(-0x7fffffff, min(error_s, 0x7fffffff))
+    if written:
+        log.info(log.EV_NET_TIME, 2, error_s)
+        # The DS3231 is only good to a second now: restart the drift fit and re-set the alarm
+        drift.forget()
+        set_next_alarm()
+        return 1
+    if -nettime.TOLERANCE_S <= error_s <= nettime.TOLERANCE_S:
+        log.info(log.EV_NET_TIME, 1, error_s)
+        return 1
+    log.warn(log.EV_NET_TIME, 3, error_s)
+    return -1
 
 def gpy_reset():
     # Pull the RESET pin LOW to reset the GPy
@@ -441,17 +564,52 @@ def ds3231_int_handler(arg):
    gpy_reset()
 
 
-#   For shutdown, put the GPy in a sleep mode for some time longer than the normal RTC delay.  For example, if the
-#      RTC initiates a RESET every six hours, put the GPy in a sleep mode for 6hrs and 15 minutes.  If all else
-#      fails, the GPy will reboot at the end of the software delay
+#   For shutdown, turn off the modem, camera UART, I2C and the battery divider and put the GPy in deep sleep.
+#      The DS3231 alarm wakes it through P22.  If all else fails, the deep sleep timer wakes it power.SAFETY_MIN
+#      after the alarm was due.
 def shutdown():
-    # Delay.  Expect that the RTC will reset the GPY before this delay expires.
-    #    Delay 6hrs and 15 minutes (22500 seconds) assuming that the RTC interrupts every 6 hours
-    #machine.deepsleep(22500000)
-    utime.sleep(22500)
-    
-    # Pull the RESET pin LOW to reset the GPy
-    gpy_reset()
+    # Write the buffered log records to flash before the long delay
+    # Report the buffer pool high-water marks so the slot sizes can be tuned
+    slot = 0
+    for name, size, hwm, borrows, misses in pool.stats():
+        log.info(log.EV_POOL, slot, hwm)
+        if misses:
+            log.warn(log.EV_POOL_MISS, slot, misses)
+        slot += 1
+    log.info(log.EV_SHUTDOWN, 0, utime.ticks_ms())
+
+    # Minutes until the first of the programmed alarms
+    now = ds3231.datetime_into(rtc_time)
+    now = now[4] * 60 + now[5]
+    sleep_min = 1440
+    for wake in alarm_wakes:
+        if wake >= 0:
+            sleep_min = min(sleep_min, (wake - now) % 1440 or 1440)
+    log.info(log.EV_SLEEP, sleep_min, (sleep_min + power.SAFETY_MIN) * 60)
+
+    # Charge of this wake and the sleep after it, per phase and in total; it is drawn from the energy budget
+    wake_uah = energy.finish(sleep_min)
+    for phase, ms, uah in energy.phases():
+        log.info(log.EV_ENERGY, phase, uah)
+    log.info(log.EV_ENERGY, energy.PHASES, wake_uah)
+    log.info(log.EV_ENERGY_TOTAL, 0, energy.total_uah() // 1000)
+    governor.spend(wake_uah)
+
+    # Wakes that did not reach the server keep their telemetry for the next one that does
+    record_telemetry()
+
+    # Everything the modules changed this wake goes to flash in one commit
+    try:
+        log.info(log.EV_STATE_COMMIT, 0, state.commit())
+    except OSError:
+        log.error(log.EV_STATE_COMMIT, 1, 0)    # The wake's state is lost, the sleep must not be
+    log.flush()
+
+    # After a power-on the modem may be up even if this wake never used it
+    if lte is None and wake_cause == power.POWER_ON:
+        modem()
+    devices = [device for device in (lte, wlan, uart, i2c) if device is not None]
+    power.sleep(sleep_min, devices, (gpy_enable_vmeas,))
 
 #########################################################
 ################ End function definitions ###############
@@ -459,13 +617,32 @@ def shutdown():
 
 
 ################################################ Entry Point ############################################
-# For testing only.  A message and a delay
-print("Starting ...")
-utime.sleep(1)
-
-# Before any other action, set the next DS3231 alarm time and clear the DS3231 interrupt request.  If any of the functions hang,
-#   the DS3231 will reset the GPy at the next alarm.
-startup_datetime = set_next_alarm()
+log.info(log.EV_BOOT, machine.reset_cause(), utime.ticks_ms())
+log.info(log.EV_MEM, 0, gc.mem_free())      # After the imports, the buffer pool and the pins
+log.info(log.EV_STATE, state.load(), state.size())
+wake_cause, wake_count = power.wake()
+log.info(log.EV_POWER, wake_cause, wake_count)
+
+# Before any other action, set the next DS3231 alarm times and clear the DS3231 interrupt request.  If any of the functions hang,
+#   the DS3231 will reset the GPy at the next alarm.  The alarm flags tell a capture wake from a telemetry-only one.
+ds3231.load()
+wake_reason = schedule.wake_reason(ds3231)
+temperature_q = ds3231.temperature_q()
+log.info(log.EV_WAKE, wake_reason, 0)
+log.info(log.EV_TEMP, 0, temperature_q)
+startup_datetime = set_next_alarm(loaded=True)
+
+# The telemetry record of this wake; the fields are filled in as the wake gets to them
+telemetry_buf = bytearray(telemetry.RECORD_SIZE)
+telemetry_recorded = False
+capture_seconds = utime.mktime((startup_datetime[0], startup_datetime[1], startup_datetime[2],
+                                startup_datetime[4], startup_datetime[5], startup_datetime[6], 0, 0))
+vbat_mv = 0
+link = -1               # transport.WIFI or LTE once a link is up
+on_wifi = False         # link == transport.WIFI
+rsrp_dbm = 0
+received = 0            # Picture bytes received
+image_digest = None     # telemetry.image_hash() of the picture
 
 
 # Now that the DS3231 interrupt request is cleared, configure P22 as an interrupt pin to detect DS3231 interrupts.
@@ -474,48 +651,72 @@ ds3231_trigger.callback(Pin.IRQ_FALLING, ds3231_int_handler)
 
 
 ######################## Read the battery voltage ##############################
-voltage_level = battery_voltage()
-
+# Sample the battery in the background while the modem attaches; the reading is collected after
+battery_meter.start()
+
+
+######################## Energy governor ##############################
+# Decide what this wake may do from the last battery reading, the temperature and the energy
+#   budget.  Telemetry-only wakes (Alarm 2) never capture.  Skipped wakes stretch the next alarm.
+#   A DS3231 that lost power reads year 2000 until this wake sets it: no refill from that.
+clock_valid = startup_datetime[0] >= 2021 and not ds3231.lost_power()
+energy_budget = governor.refill(capture_seconds if clock_valid else None)
+mode = governor.decide(governor.last_mv(), temperature_q, energy_budget,
+                       telemetry_only=wake_reason == schedule.TELEMETRY)
+log.info(log.EV_GOVERNOR, mode, energy_budget)
+if mode == governor.SKIP:
+    vbat_mv = battery_voltage()
+    governor.remember_mv(vbat_mv)
+    set_next_alarm(stretch=governor.STRETCH_MIN)
+    shutdown()
 
 
 #################################### Network Connection #############################################################
-connect_to_wifi()
-
-attached = 0
-attached = attach_to_lte()
-
-if not attached:
-    print("Shutting down.  Better luck next reset.")
-    shutdown()     # Wait for the next scheduled reset
-
-# Send an SMS message here if needed (after attached to LTE and before connected to LTE data)
-
-
-connected = 0
-connected = connect_to_lte_data()
-
-if not connected:
+# Bring up WiFi or LTE, whichever is expected to cost less for what this wake sends.  The link
+#   history is stamped with the DS3231 time read after each attempt, which an LTE attach may have set.
+import telering
+import transport
+links = {transport.LTE: (lte_up, lte_down)}
+if wifi_network:
+    links[transport.WIFI] = (wifi_up, wifi_down)
+payload = telering.size() + telemetry.RECORD_SIZE
+if mode >= governor.REDUCED:
+    payload += cadence.last_length() * 4 // 3      # The Base64 picture
+network_time = 0        # check_network_time() result; LTE only
+link_start = utime.ticks_ms()
+link, open_socket = transport.connect(links, payload, rtc_seconds, NET_DEADLINE_MS)
+on_wifi = link == transport.WIFI
+log.info(log.EV_LINK, link, utime.ticks_diff(utime.ticks_ms(), link_start))
+
+vbat_mv = battery_voltage()
+voltage_level = '{:d}'.format((vbat_mv + 5) // 10)     # Centivolts for the picture filename and the server
+
+# The fresh reading can only lower the mode chosen at boot
+governor.remember_mv(vbat_mv)
+fresh_mode = governor.decide(vbat_mv, temperature_q, energy_budget)
+if fresh_mode < mode:
+    mode = fresh_mode
+    log.info(log.EV_GOVERNOR, mode, energy_budget)
+    if mode == governor.SKIP:
+        set_next_alarm(stretch=governor.STRETCH_MIN)
+        shutdown()
+capture = mode >= governor.REDUCED
+
+if link < 0:
     shutdown()      # Wait for the next scheduled reset
-
-
-print("server addresses")
-server_address = socket.getaddrinfo('water.roeber.dev', 80)[0][-1]
-print(server_address)
-#server_address = socket.getaddrinfo('gaepd.janusresearch.com', 8555)[0][-1]
-#print(server_address)
+energy.phase(energy.NET)
 
 ################################### DS3231 Synchronization with NTP server ##################################################
-# Synchronize the DS3231 clock with NTP on the first day of the month
-#   or if the year is wrong (usually on first start or backup battery is replaced)
+# Synchronize the DS3231 clock with NTP when the drift model predicts that it is off by
+#   more than drift.THRESHOLD_MS, when it disagrees with the network time, or if the time
+#   was invalid at startup (usually on first start or when the backup battery is replaced)
 #   startup_datetime[0]  - year
-#   startup_datetime[2]  - day
-#   startup_datetime[4]  - hour
-#   startup_datetime[5]  - minute
 #  Note: sync_clock() also updates the next alarm time
-if(startup_datetime[0] < 2021 or startup_datetime[2] == 1):
+sync_due, predicted_ms = drift.sync_due(utime.mktime((startup_datetime[0], startup_datetime[1], startup_datetime[2],
+                                                      startup_datetime[4], startup_datetime[5], startup_datetime[6], 0, 0)))
+log.info(log.EV_CLOCK_PREDICT, 1 if sync_due else 0, predicted_ms or 0)
+if startup_datetime[0] < 2021 or ds3231.lost_power() or sync_due or network_time < 0:
     sync_clock()
-else:
-    print("DS3231: no update needed")
 
 # DS3231 time:
 # datetime[0] year
@@ -525,92 +726,75 @@ else:
 # datetime[4] hour
 # datetime[5] minute
 # datetime[6] second
-datetime = ds3231.datetime()
-print('DS3231 time:', ds3231.datetime())
+datetime = ds3231.datetime_into(rtc_time)
+capture_seconds = utime.mktime((datetime[0], datetime[1], datetime[2], datetime[4], datetime[5], datetime[6], 0, 0))
+log.info(log.EV_RTC_TIME, 1, capture_seconds)
 
 time_stamp = '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}'.format(datetime[0], datetime[1], datetime[2], datetime[4], datetime[5], datetime[6])
 camera_time_stamp = '{:04d}{:02d}{:02d}{:02d}{:02d}'.format(datetime[0], datetime[1], datetime[2], datetime[4], datetime[5])
 #print("Timestamp", time_stamp)
 #print("CameraTimestamp", camera_time_stamp)
 
-# Picture filename.  Transmit this to the ESP32-CAM. It is used for the SD Card filename on the ESP32-CAM
-picture_filename = station_id + '_' + camera_time_stamp + '_' + voltage_level + '\0'
-print(picture_filename)  # Print the filename to make sure it is properly formatted
 
+# Telemetry-only wakes (Alarm 2 or the governor) skip the camera
+if capture:
+    import picture
 
-# Toggle the ESP32-CAM RESET line to initiate the picture capture process
-camera_trigger(0)
-utime.sleep_ms(10)
-camera_trigger(1)
-
-
-# For testing only.  Print a string to the GPy terminal
-print('new picture')
-
-
-# Parse through the data that follows the ESP32-CAM bootup transmission to find the keyword, 'ready'
-# TODO: This needs a timeout escape so that the code does not hang here
-
-# Transmit 'Hello' until 'ready' is received
-keyword = b'ready'  # Expected word from the ESP32-CAM
-utime.sleep(1)
-# Send a greeting followed by reading the response
-while True:
-    uart.write('Hello\0')
-    utime.sleep_ms(200)
-    reply = uart.readline()
-    print(reply)
-    if reply == keyword:
-            break
+    # Picture filename.  Transmit this to the ESP32-CAM. It is used for the SD Card filename on the ESP32-CAM
+    picture_filename = station_id + '_' + camera_time_stamp + '_' + voltage_level
+    if mode == governor.REDUCED:
+        picture_filename += picture.REDUCED_SUFFIX     # Ask the camera for its reduced frame size
+    picture_filename += '\0'
 
-print("found the keyword")  # The word 'ready' was received
+    # Toggle the ESP32-CAM RESET line to initiate the picture capture process
+    energy.phase(energy.CAMERA)
+    uart = UART(1, baudrate=38400)
+    camera_trigger(0)
+    utime.sleep_ms(10)
+    camera_trigger(1)
+    log.info(log.EV_CAM_TRIGGER, 0, utime.ticks_ms())
 
-# Send the picture filename to the ESP32-CAM.  This filename will be used
-#   by the ESP32-CAM to store the picture to its local SD-Card.
-utime.sleep_ms(200)
-uart.write(picture_filename)
 
+    # Parse through the data that follows the ESP32-CAM bootup transmission to find the keyword, 'ready',
+    #   send the picture filename (used by the ESP32-CAM for its SD-Card filename) and read the picture length.
+    #   The handshake gives up after picture.HELLO_TRIES greetings.
+    utime.sleep(1)
+    hello_try, picture_len_int = picture.handshake(uart, picture_filename)
+    log.info(log.EV_CAM_READY, hello_try, picture_len_int)
+    log.info(log.EV_PIC_LEN, 0, picture_len_int)
 
+    """
+    if not lte.isconnected():
+        print("Lost data connection")
+        connect_to_lte_data()
+    else:
+        print("Still connected")
+    """
 
-# Read the picture length from the ESP32-Cam.  Convert the value to an integer
-while True:
-    picture_len = uart.readline()
-    if(picture_len is not None):
-        #print(picture_len)
-        break
-
-
-# Strip the trailing whitespace (e.g. \r\n)
-picture_len_bytes = picture_len.strip()
-
-# Cast the value to an integer
-picture_len_int = int(picture_len_bytes)
-print(picture_len_int)
-
-print('Begin transfer')
-
-"""
-if not lte.isconnected():
-    print("Lost data connection")
-    connect_to_lte_data()
-else:
-    print("Still connected")
-"""
-
-process_picture(picture_len_int)
+    if picture_len_int:
+        received = process_picture(picture_len_int)
 
-# Turn off the UART port
-uart.deinit()
+    # Adapt the capture interval to how much the picture changed and to the battery, then
+    #   re-set the next alarm with it.  Reduced pictures are not comparable in size.
+    decision, capture_interval, change = cadence.update(received if mode == governor.FULL else 0, vbat_mv,
+                                                        capture_seconds // 60)
+    log.info(log.EV_CADENCE, decision, capture_interval)
+    log.info(log.EV_CHANGE, 0, change)
+    set_next_alarm()
 
-# For testing only.  Indicates that the picture processing (capture, encode, transmit) is complete
-print('end transfer')
+    # Turn off the UART port
+    uart.deinit()
 
+# Optionally send the binary event log after the picture; telemetry-only wakes always send it
+if upload_log_enabled or not capture:
+    upload_log()
 
+# Every wake that reaches the server sends its telemetry record with those of the wakes before
+upload_telemetry()
 
 # Picture transfer is complete so disconnect from the network
-#wlan.disconnect()
-lte.deinit(detach=True,reset=True)
-
-print("Network disconnected, going to sleep")
+energy.phase(energy.SHUTDOWN)
+links[link][1]()
+log.info(log.EV_NET_DOWN, link)
 
 shutdown()
\ No newline at end of file